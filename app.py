@@ -1,6 +1,8 @@
 \
 from __future__ import annotations
+import hashlib
 import json
+import re
 import uuid
 from dataclasses import asdict
 from typing import Dict, Any, List
@@ -9,20 +11,25 @@ import streamlit as st
 import pandas as pd
 
 from src.data import load_yccd
-from src.ppct import load_ppct, extract_and_save_from_upload, find_periods
-from src.gemini import generate_json, GeminiError
+from src.ppct import DATA_DIR, load_ppct, extract_from_upload, save_extracted, find_periods, match_periods, ppct_subject
+from src.catalog import grades, subjects, load_manifest, load_yccd_partitions, load_ppct_partitions, save_ppct_partitions
 from src.validators import (
     validate_question,
-    QTYPE_MC, QTYPE_TF, QTYPE_MATCH, QTYPE_FILL, QTYPE_ESSAY
+    QTYPE_MC, QTYPE_TF, QTYPE_MATCH, QTYPE_FILL, QTYPE_ESSAY, MATCH_MAX_PAIRS
 )
+from src.generation import LEVELS_TT27, QTYPES, SYSTEM_INSTRUCTION, build_blueprint, prompt_token_report
+from src.sessions import new_session_id, valid_session_id
+from src.jobs import JobManager, KIND_GENERATE, KIND_REGENERATE, DONE
+from src.pregen import Pregenerator, QUEUED as PREGEN_QUEUED, RUNNING as PREGEN_RUNNING, READY as PREGEN_READY
+from src.gemini import MIN_CACHE_TOKENS, ContextCache, LatencyStats, Router, cache_tokens
 from src.export_docx import export_exam_docx
+from src.export_xlsx import export_matrix_xlsx
+from src.matrix_import import catalog_ids, import_matrix, read_matrix_file, template_csv
+from src.grading import compile_key, grade_responses, read_responses, response_template, results_xlsx
+from src import perf, profiler
+from src.matrix import compute_ratio_points
 
 APP_TITLE = "V1.1 – Tool ra đề Lớp 5 (AI Studio Gemini) • Streamlit"
-LEVELS_TT27 = ["M1 – Nhận biết", "M2 – Kết nối", "M3 – Vận dụng"]
-# Map hiển thị -> nhãn gọn
-LEVEL_KEY = {"M1 – Nhận biết": "M1", "M2 – Kết nối": "M2", "M3 – Vận dụng": "M3"}
-
-QTYPES = [QTYPE_MC, QTYPE_TF, QTYPE_MATCH, QTYPE_FILL, QTYPE_ESSAY]
 
 def init_state():
     st.session_state.setdefault("matrix_rows", [])  # list[dict]
@@ -30,49 +37,22 @@ def init_state():
     st.session_state.setdefault("last_dataset_hash", "")
     st.session_state.setdefault("ppct_df", None)
     st.session_state.setdefault("ppct_source_note", "")
-
-
-def compute_ratio_points(rows: List[Dict[str, Any]], mode: str, block1_points: float, block2_points: float):
-    """
-    mode:
-      - "Toàn đề (10 điểm)"
-      - "2 block (2,5 / 7,5)"
-    Yêu cầu: rows có 'so_tiet' (int) và (nếu 2 block) có 'block' = 1/2.
-    Ghi vào rows: 'ti_le', 'so_diem'
-    """
-    # reset
-    for r in rows:
-        r["ti_le"] = None
-        r["so_diem"] = None
-
-    if mode == "Toàn đề (10 điểm)":
-        total = sum(int(r.get("so_tiet") or 0) for r in rows)
-        if total <= 0:
-            return rows, "Tổng số tiết = 0. Hãy điền Số tiết trước."
-        for r in rows:
-            stt = int(r.get("so_tiet") or 0)
-            r["ti_le"] = round(stt * 100.0 / total, 4)
-            r["so_diem"] = round(r["ti_le"] * 10.0 / 100.0, 5)
-        return rows, "OK"
-    else:
-        # 2 blocks
-        b1 = [r for r in rows if int(r.get("block") or 1) == 1]
-        b2 = [r for r in rows if int(r.get("block") or 1) == 2]
-        t1 = sum(int(r.get("so_tiet") or 0) for r in b1)
-        t2 = sum(int(r.get("so_tiet") or 0) for r in b2)
-        if (t1 <= 0 and len(b1)>0) or (t2 <= 0 and len(b2)>0):
-            return rows, "Thiếu Số tiết trong một block. Hãy điền/auto-fill trước."
-        if len(b1)>0 and t1>0:
-            for r in b1:
-                stt = int(r.get("so_tiet") or 0)
-                r["ti_le"] = round(stt * 100.0 / t1, 4)
-                r["so_diem"] = round(r["ti_le"] * float(block1_points) / 100.0, 5)
-        if len(b2)>0 and t2>0:
-            for r in b2:
-                stt = int(r.get("so_tiet") or 0)
-                r["ti_le"] = round(stt * 100.0 / t2, 4)
-                r["so_diem"] = round(r["ti_le"] * float(block2_points) / 100.0, 5)
-        return rows, "OK"
+    if "session_id" not in st.session_state:
+        # giữ session_id trên URL để F5 / khởi động lại app vẫn nối lại được job nền của phiên;
+        # sid sai định dạng (đường dẫn, mã đoán) -> cấp mã mới
+        sid = st.query_params.get("sid")
+        if not valid_session_id(sid):
+            sid = new_session_id()
+        st.query_params["sid"] = sid
+        st.session_state.session_id = sid
+    st.session_state.setdefault("active_job", "")
+    # độ trễ Gemini theo endpoint của riêng phiên (không lộ model/key/base của phiên khác)
+    st.session_state.setdefault("gemini_stats", LatencyStats())
+    if "perf" not in st.session_state:
+        st.session_state.perf = perf.PerfRecorder(st.session_state.session_id)
+    if "profiler" not in st.session_state:
+        st.session_state.profiler = (profiler.RerunProfiler(st.session_state.session_id)
+                                     if profiler.enabled(st.secrets) else None)
 
 
 def points_options(step=0.5, max_point=10.0):
@@ -83,210 +63,344 @@ def points_options(step=0.5, max_point=10.0):
         x += step
     return vals
 
-def build_prompt(meta: Dict[str, Any]) -> str:
+# widget chỉnh sửa của câu idx có key dạng f"{prefix}_{idx}" hoặc f"{prefix}_{idx}_{j}"
+EDIT_WIDGET_KEY = re.compile(r"^(stem|opt|ans|tf_s|tf_a|mt_n|mt_l|mt_r|mt_a|fb_t|fb_a|es_p|es_r)_(\d+)(_\w+)?$")
+
+def reset_question_widgets(indices):
     """
-    Prompt bám TT27 3 mức (M1/M2/M3) và yêu cầu trả JSON đúng schema.
+    Xoá state các widget chỉnh sửa của những câu vừa sinh lại, để form hiển thị nội dung mới.
     """
-    qtype = meta["qtype"]
-    level = meta["level"]
-    subject = meta["subject"]
-    topic = meta["topic"]
-    lesson = meta["lesson"]
-    yccd = meta["yccd"]
-    grade = meta.get("grade", 5)
-    pts = meta["points"]
-
-    level_desc = {
-        "M1": "Nhận biết: nhắc lại/mô tả/áp dụng trực tiếp trong tình huống quen thuộc.",
-        "M2": "Kết nối: kết nối/sắp xếp kiến thức để giải quyết vấn đề tương tự.",
-        "M3": "Vận dụng: vận dụng kiến thức vào tình huống mới/gần thực tế.",
-    }[LEVEL_KEY[level]]
-
-    schema = f"""
-Trả về DUY NHẤT 1 JSON object (không markdown, không giải thích thêm ngoài JSON), theo dạng {qtype}:
-
-- Với Trắc nghiệm nhiều lựa chọn:
-{{
-  "stem": "...",
-  "options": {{"A":"...","B":"...","C":"...","D":"..."}},
-  "correct_answer": "A|B|C|D",
-  "explanation": "Giải thích ngắn gọn."
-}}
-
-- Với Đúng/Sai:
-{{
-  "stem": "...",
-  "true_false": [{{"statement":"...","answer":true}},{{"statement":"...","answer":false}}],
-  "explanation": "Giải thích ngắn gọn."
-}}
-
-- Với Nối cột:
-{{
-  "stem": "Nối cột A với cột B cho phù hợp: ...",
-  "matching": {{
-     "left": ["1) ...","2) ...","3) ...","4) ..."],
-     "right": ["A) ...","B) ...","C) ...","D) ..."],
-     "answer": {{"1":"A","2":"B","3":"C","4":"D"}}
-  }},
-  "explanation": "Giải thích ngắn gọn."
-}}
-
-- Với Điền khuyết:
-{{
-  "stem": "...",
-  "fill_blank": {{"text":"... ____ ...", "answer":"..."}},
-  "explanation": "Giải thích ngắn gọn."
-}}
-
-- Với Tự luận:
-{{
-  "stem": "...",
-  "essay": {{"prompt":"...", "rubric":["Ý 1 (x điểm)","Ý 2 (y điểm)"]}},
-  "explanation": "Gợi ý/nhận xét ngắn."
-}}
-
-Ràng buộc sư phạm:
-- Phù hợp học sinh lớp {grade}, câu văn rõ, không mẹo, không mơ hồ.
-- Bám sát YCCĐ: {yccd}
-- Mức độ theo TT27: {level_desc}
-- Điểm câu: {pts} điểm.
-"""
-    user = f"""
-Môn: {subject}
-Chủ đề: {topic}
-Bài: {lesson}
-YCCĐ: {yccd}
-Dạng: {qtype}
-Mức: {level} ({LEVEL_KEY[level]})
-Điểm: {pts}
-
-{schema}
-"""
-    return user.strip()
-
-def offline_question(meta: Dict[str, Any]) -> Dict[str, Any]:
+    targets = {str(i) for i in indices}
+    for key in list(st.session_state.keys()):
+        m = EDIT_WIDGET_KEY.match(str(key))
+        if m and m.group(2) in targets:
+            del st.session_state[key]
+    st.session_state.pop("regen_selected", None)
+
+def job_settings() -> Dict[str, Any]:
+    return {"api_key": api_key, "model": model, "api_base": api_base,
+            "temperature": temperature, "max_tokens": max_tokens, "cache": context_cache, "router": router}
+
+def start_job(kind: str, blueprint: List[Dict[str, Any]], targets=None):
+    settings = job_settings()
+    if kind == KIND_GENERATE and use_pregen:
+        # dùng các câu đã sinh trước khi thêm dòng ma trận; sinh lại thì luôn gọi API
+        settings["pregen"] = get_pregenerator().taker(st.session_state.session_id, job_settings())
+    job = get_job_manager().submit(st.session_state.session_id, kind, blueprint, settings, targets)
+    st.session_state.active_job = job.id
+
+def sync_pregen():
     """
-    Fallback khi không có API key: tạo câu theo mẫu cấu trúc để test pipeline.
+    Sinh trước (nền) các câu của ma trận hiện tại; dòng bị xoá / đổi thì huỷ phần của dòng đó.
+    Không có API key thì bỏ qua (mẫu offline sinh tức thì lúc TẠO ĐỀ).
     """
-    qtype = meta["qtype"]
-    level_short = LEVEL_KEY[meta["level"]]
-    yccd = meta["yccd"]
-
-    if qtype == QTYPE_MC:
-        return {
-            "stem": f"({level_short}) Chọn đáp án đúng: {yccd}",
-            "options": {"A": "Phương án A", "B": "Phương án B", "C": "Phương án C", "D": "Phương án D"},
-            "correct_answer": "A",
-            "explanation": "Giải thích ngắn gọn theo nội dung bài học."
-        }
-    if qtype == QTYPE_TF:
-        return {
-            "stem": f"({level_short}) Đánh dấu Đ/S theo yêu cầu: {yccd}",
-            "true_false": [{"statement": "Mệnh đề 1", "answer": True}, {"statement": "Mệnh đề 2", "answer": False}],
-            "explanation": "Giải thích ngắn gọn."
-        }
-    if qtype == QTYPE_MATCH:
-        return {
-            "stem": f"({level_short}) Nối cột A với cột B cho phù hợp: {yccd}",
-            "matching": {
-                "left": ["1) A1", "2) A2", "3) A3", "4) A4"],
-                "right": ["A) B1", "B) B2", "C) B3", "D) B4"],
-                "answer": {"1": "A", "2": "B", "3": "C", "4": "D"},
-            },
-            "explanation": "Giải thích ngắn gọn."
-        }
-    if qtype == QTYPE_FILL:
-        return {
-            "stem": f"({level_short}) Điền vào chỗ trống: {yccd}",
-            "fill_blank": {"text": "Nội dung ____ cần điền.", "answer": "đáp án"},
-            "explanation": "Giải thích ngắn gọn."
-        }
-    return {
-        "stem": f"({level_short}) Trả lời: {yccd}",
-        "essay": {"prompt": "Viết câu trả lời đầy đủ.", "rubric": ["Ý 1 (0,5–1 điểm)", "Ý 2 (0,5–1 điểm)"]},
-        "explanation": "Gợi ý chấm."
-    }
-
-def make_question(meta: Dict[str, Any], api_key: str, model: str, api_base: str, temperature: float, max_tokens: int):
-    prompt = build_prompt(meta)
-    if api_key:
-        obj = generate_json(prompt, api_key=api_key, model=model, api_base=api_base,
-                           temperature=temperature, max_output_tokens=max_tokens)
+    pre = get_pregenerator()
+    if use_pregen and api_key:
+        pre.sync(st.session_state.session_id, st.session_state.matrix_rows, grade_sel, job_settings())
     else:
-        obj = offline_question(meta)
-
-    ok, msg = validate_question(meta["qtype"], obj)
-    if not ok:
-        # nếu AI trả sai cấu trúc -> fallback offline để không "kẹt"
-        obj = offline_question(meta)
-        ok2, msg2 = validate_question(meta["qtype"], obj)
-        return obj, False, f"AI trả chưa đạt ({msg}). Dùng mẫu tạm để test."
-    return obj, True, "OK"
+        pre.cancel_session(st.session_state.session_id)
+
+def current_job():
+    mgr = get_job_manager()
+    if st.session_state.active_job:
+        job = mgr.get(st.session_state.active_job)
+        if job is not None:
+            return job
+    jobs = mgr.session_jobs(st.session_state.session_id)
+    if jobs:
+        st.session_state.active_job = jobs[0].id
+        return jobs[0]
+    return None
+
+def apply_job(job):
+    """
+    Đưa các câu job đã sinh vào exam (cả đề hoặc đúng các vị trí được sinh lại).
+    """
+    if job.kind == KIND_GENERATE:
+        st.session_state.exam = [r for r in job.results if r is not None]
+        indices = list(range(1, len(st.session_state.exam) + 1))
+    else:
+        indices = []
+        for t, item in job.completed_items():
+            if t <= len(st.session_state.exam):
+                st.session_state.exam[t - 1] = item
+                indices.append(t)
+    reset_question_widgets(indices)
+    get_job_manager().mark_applied(job)
+
+def regenerate_questions(indices):
+    """
+    Sinh lại (chạy nền) chỉ các câu idx (đánh số từ 1), giữ nguyên các câu khác.
+    """
+    indices = list(indices)
+    metas = []
+    for idx in indices:
+        q = st.session_state.exam[idx - 1]
+        meta = {k: q[k] for k in ["subject","topic","lesson","yccd","qtype","level","points"]}
+        meta["grade"] = q.get("grade", 5)
+        metas.append(meta)
+    start_job(KIND_REGENERATE, metas, indices)
+
+def _frame_digest(df) -> str:
+    # băm theo nội dung (không theo id(): frame dựng lại mỗi rerun / id bị tái sử dụng sau khi GC)
+    if df is None or len(df) == 0:
+        return ""
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+def render_matrix_download():
+    """
+    XLSX ma trận của phiên: chỉ xuất khi giáo viên bấm tạo, giữ lại tới khi ma trận / PPCT đổi
+    (không tốn ~100 ms mỗi lần rerun Tab 1).
+    """
+    ppct_df = st.session_state.get("ppct_df")
+    key = (json.dumps(st.session_state.matrix_rows, ensure_ascii=False, sort_keys=True, default=str),
+           _frame_digest(ppct_df))
+    cached = st.session_state.get("matrix_xlsx")
+    if cached is None or cached[0] != key:
+        if not st.button("📦 Tạo file ma trận + đặc tả (XLSX)"):
+            return
+        cached = st.session_state.matrix_xlsx = (key, export_matrix_xlsx(st.session_state.matrix_rows, ppct_df))
+    st.download_button("⬇️ Tải ma trận + đặc tả (XLSX)", data=cached[1], file_name="Ma_tran_dac_ta.xlsx",
+                       mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+_fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+@_fragment(run_every=1.0)
+def job_progress(job_id: str):
+    """
+    Tự làm mới mỗi giây (chỉ phần này, không rerun cả trang) khi job đang chạy.
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return
+    label = "Đang tạo đề" if job.kind == KIND_GENERATE else "Đang tạo lại"
+    st.progress(job.done / max(job.total, 1), text=f"{label} (nền): {job.done}/{job.total} câu")
+    if st.button("⏹️ Huỷ", key="job_cancel"):
+        get_job_manager().cancel(job.id)
+        st.caption("Đang huỷ sau câu hiện tại...")
+    if not job.active:
+        st.rerun()
+
+@st.cache_resource
+def load_default_yccd() -> pd.DataFrame:
+    # kho YCCĐ trong repo chỉ đọc -> 1 bản dùng chung cho mọi phiên (không copy theo phiên)
+    return load_yccd(measure_memory=True)
+
+@st.cache_resource(max_entries=16)
+def load_catalog_yccd(grade: int, subject_list: tuple) -> pd.DataFrame:
+    # chỉ load partition (khối, môn) được chọn; dùng chung giữa các phiên cùng lựa chọn
+    return load_yccd_partitions(grade, list(subject_list), measure_memory=True)
+
+@st.cache_resource(max_entries=16)
+def load_catalog_ppct(grade: int, subject_list: tuple) -> pd.DataFrame:
+    return load_ppct_partitions(grade, list(subject_list))
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    # 1 hàng đợi cho cả tiến trình; job sống qua các lần rerun của script
+    return JobManager()
+
+@st.cache_resource
+def get_pregenerator() -> Pregenerator:
+    return Pregenerator()
+
+@st.cache_resource
+def get_context_cache() -> ContextCache:
+    # dùng chung toàn tiến trình: mọi phiên cùng model/key tái sử dụng 1 cached content
+    return ContextCache()
+
+def render_perf_panel():
+    """
+    Panel sidebar: thống kê thời gian các bước (phiên này / toàn tiến trình) + tuỳ chọn ghi trace.
+    """
+    with st.expander("⏱️ Hiệu năng", expanded=False):
+        scope = st.radio("Phạm vi", ["Phiên này", "Toàn tiến trình"], horizontal=True, key="perf_scope")
+        rec = st.session_state.perf if scope == "Phiên này" else perf.PROCESS
+        rows = rec.summary_rows()
+        if rows:
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        else:
+            st.caption("Chưa có số liệu.")
+        endpoints = st.session_state.gemini_stats.summary_rows()
+        if endpoints:
+            st.caption("Độ trễ Gemini theo model/key (phiên này, dùng để chọn endpoint và hedge)")
+            st.dataframe(pd.DataFrame(endpoints), use_container_width=True, hide_index=True)
+        # chỉ phiên này ghi trace (các phiên khác không bị bật / tắt theo)
+        trace_on = st.checkbox("Ghi trace JSONL ra đĩa", value=st.session_state.perf.trace is not None,
+                               key="perf_trace")
+        st.session_state.perf.trace = perf.DEFAULT_TRACE if trace_on else None
+        if trace_on:
+            st.caption(f"Trace: {perf.DEFAULT_TRACE}")
+        if st.button("Xoá số liệu phiên", key="perf_reset"):
+            st.session_state.perf.reset()
+        render_profile_summary()
+
+def render_profile_summary():
+    """
+    Top hotspot của lần rerun trước (chỉ khi bật APP_PROFILE).
+    """
+    prof = st.session_state.profiler
+    if prof is None:
+        return
+    last = prof.last
+    st.caption(f"Profiler đang bật ({profiler.ENV_VAR}) • ghi vào {prof.dir}")
+    if not last:
+        st.caption("Chưa có lần rerun nào hoàn tất.")
+        return
+    st.caption(f"Lần rerun #{last['seq']}: {last['total_ms']:.0f} ms")
+    st.dataframe(pd.DataFrame(last["sections"]), use_container_width=True, hide_index=True)
+    top_n = st.number_input("Top hotspot (theo tottime)", 1, profiler.TOP_N, 10, key="profile_top_n")
+    st.dataframe(pd.DataFrame(last["hotspots"][:int(top_n)]), use_container_width=True, hide_index=True)
 
 # ---------------- UI ----------------
 st.set_page_config(page_title=APP_TITLE, layout="wide")
 init_state()
+perf.bind_session(st.session_state.perf)
+prof = st.session_state.profiler
+if prof is not None:
+    prof.begin()
 st.title(APP_TITLE)
 
-with st.sidebar:
+with st.sidebar, profiler.section(prof, "sidebar"):
     st.subheader("AI Studio Gemini")
     api_key = st.text_input("GEMINI_API_KEY", value=st.secrets.get("GEMINI_API_KEY", ""), type="password")
     model = st.text_input("Model", value=st.secrets.get("GEMINI_MODEL", "gemini-2.0-flash"))
     api_base = st.text_input("API base", value=st.secrets.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta"))
     temperature = st.slider("Temperature", 0.0, 1.0, 0.7, 0.05)
     max_tokens = st.slider("Max output tokens", 256, 2048, 1024, 128)
+    use_cache = st.checkbox("Context caching cho hướng dẫn chung", value=False,
+                            help=f"Gửi phần hướng dẫn tĩnh qua Gemini cachedContents. Chỉ có tác dụng khi hướng dẫn "
+                                 f"≥ {MIN_CACHE_TOKENS} token (ngưỡng tối thiểu của cachedContents); ngắn hơn thì gửi kèm từng câu.")
+    context_cache = get_context_cache() if use_cache else None
+    if context_cache is not None and not context_cache.cacheable(SYSTEM_INSTRUCTION):
+        st.caption(f"Hướng dẫn chung ~{cache_tokens(SYSTEM_INSTRUCTION)} token < {MIN_CACHE_TOKENS}: "
+                   "không cache được, vẫn gửi kèm từng câu.")
+    use_hedge = st.checkbox("Hedged request (giảm độ trễ đuôi)", value=False,
+                            help="Câu nào chờ lâu hơn p95 độ trễ gần đây thì gửi thêm 1 request (sang model/key dự phòng nếu có), lấy kết quả về trước. "
+                                 "Tốn thêm request: chỉ bật khi quota đủ (không nên với key free tier).")
+    use_pregen = st.checkbox("Sinh trước khi thêm dòng ma trận", value=True,
+                             help="Thêm dòng vào ma trận là bắt đầu sinh câu ở nền (giới hạn số request/phút); "
+                                  "TẠO ĐỀ dùng lại các câu đã có. Xoá/sửa dòng thì huỷ phần của dòng đó.")
+    fallback_models = st.text_input("Model dự phòng (cách nhau dấu phẩy)", value=st.secrets.get("GEMINI_FALLBACK_MODELS", ""))
+    fallback_keys = st.text_input("API key dự phòng (cách nhau dấu phẩy)", value=st.secrets.get("GEMINI_FALLBACK_KEYS", ""), type="password")
+    router = Router(
+        fallbacks=[(m.strip(), "") for m in fallback_models.split(",") if m.strip()]
+                  + [("", k.strip()) for k in fallback_keys.split(",") if k.strip()],
+        hedge=use_hedge,
+        stats=st.session_state.gemini_stats,
+    )
 
     st.divider()
     st.subheader("Dữ liệu YCCĐ")
+    manifest = load_manifest()
+    catalog_grades = grades(manifest)
+    if catalog_grades:
+        grade_sel = st.selectbox("Khối lớp", catalog_grades, index=len(catalog_grades) - 1)
+        grade_subjects = subjects(manifest, grade_sel)
+        subj_sel = st.multiselect("Môn (chỉ load môn được chọn)", grade_subjects, default=grade_subjects,
+                                  key=f"catalog_subjects_{grade_sel}")
+    else:
+        grade_sel, subj_sel = 5, None
     up = st.file_uploader("Upload khoi5_normalized (.csv/.xlsx) (tuỳ chọn)", type=["csv","xlsx"])
-    st.caption("Nếu không upload, app dùng data/khoi5_normalized.csv trong repo.")
+    st.caption("Nếu không upload, app dùng catalog data/catalog (hoặc data/khoi5_normalized.csv) trong repo.")
+    yccd_caption = st.empty()
 
     st.divider()
-    st.subheader("PPCT / Số tiết (từ K5.pdf)")
-    ppct_pdf = st.file_uploader("Upload K5.pdf (tuỳ chọn) để trích số tiết", type=["pdf"], key="ppct_pdf")
-    use_extracted = st.checkbox("Dùng ppct_k5_extracted.csv trong repo (khuyến nghị)", value=True)
-    if use_extracted or ppct_pdf is None:
-        ppct_df = load_ppct()
-        st.session_state.ppct_df = ppct_df
-        st.session_state.ppct_source_note = "Đang dùng data/ppct/ppct_k5_extracted.csv"
-    else:
-        try:
-            ppct_df = extract_and_save_from_upload(ppct_pdf)
-            st.session_state.ppct_df = ppct_df
-            st.session_state.ppct_source_note = "Đã trích từ K5.pdf upload và lưu vào data/ppct/ppct_k5_extracted.csv"
-        except Exception as e:
-            st.warning(f"Không trích được từ PDF: {e}")
-            st.session_state.ppct_df = load_ppct()
-            st.session_state.ppct_source_note = "Fallback: dùng CSV trích sẵn (nếu có)"
+    st.subheader(f"PPCT / Số tiết (từ K{grade_sel}.pdf)")
+    ppct_pdf = st.file_uploader(f"Upload K{grade_sel}.pdf (tuỳ chọn) để trích số tiết", type=["pdf"], key="ppct_pdf")
+    use_extracted = st.checkbox("Dùng PPCT trích sẵn trong repo (khuyến nghị)", value=True)
+    with profiler.section(prof, "ppct"):
+        ppct_csv = DATA_DIR / "ppct" / f"ppct_k{grade_sel}_extracted.csv"
+
+        def repo_ppct():
+            # PPCT của đúng khối đang chọn (catalog, hoặc CSV trích sẵn của khối đó)
+            if catalog_grades:
+                return (load_catalog_ppct(grade_sel, tuple(sorted({ppct_subject(s) for s in subj_sel or []}))),
+                        f"PPCT lớp {grade_sel} trong data/catalog")
+            return load_ppct(ppct_csv), str(ppct_csv.relative_to(DATA_DIR.parent))
+
+        if use_extracted or ppct_pdf is None:
+            st.session_state.ppct_df, source = repo_ppct()
+            st.session_state.ppct_source_note = f"Đang dùng {source}"
+        else:
+            pdf_bytes = ppct_pdf.getvalue()
+            digest = hashlib.sha1(pdf_bytes).hexdigest()
+            upload = st.session_state.get("ppct_upload")
+            if upload is None or upload[0] != digest:
+                # trích 1 lần cho mỗi file upload (không trích lại mỗi lần rerun); lỗi cũng nhớ lại
+                try:
+                    upload = (digest, extract_from_upload(ppct_pdf), "")
+                except Exception as e:
+                    upload = (digest, None, str(e))
+                st.session_state.ppct_upload = upload
+            _, extracted, error = upload
+            if extracted is None:
+                st.warning(f"Không trích được từ PDF: {error}")
+                st.session_state.ppct_df, source = repo_ppct()
+                st.session_state.ppct_source_note = f"Fallback: dùng {source}"
+            else:
+                st.session_state.ppct_df = extracted
+                saved = st.session_state.get("ppct_saved") == (digest, grade_sel)
+                # chỉ ghi vào dữ liệu dùng chung của repo khi giáo viên bấm lưu
+                if not saved and st.button(f"💾 Lưu PPCT trích được vào dữ liệu lớp {grade_sel}", key="ppct_save"):
+                    save_extracted(extracted, ppct_csv)
+                    if catalog_grades:
+                        save_ppct_partitions(extracted, grade_sel)
+                        load_catalog_ppct.clear()
+                    st.session_state.ppct_saved = saved = (digest, grade_sel)
+                st.session_state.ppct_source_note = (
+                    f"Đang dùng PPCT trích từ PDF upload ({len(extracted)} bài)"
+                    + (f", đã lưu vào {ppct_csv.relative_to(DATA_DIR.parent)}" if saved else ", chưa lưu vào repo"))
     st.caption(st.session_state.ppct_source_note)
 
+    st.divider()
+    render_perf_panel()
+
 
 # Load dataset
-try:
-    df = load_yccd(up)
-except Exception as e:
-    st.error(str(e))
-    st.stop()
+with profiler.section(prof, "dataset"):
+    try:
+        if up is not None:
+            df = load_yccd(up, measure_memory=True)
+        elif catalog_grades:
+            if not subj_sel:
+                st.info("Hãy chọn ít nhất 1 môn ở sidebar.")
+                st.stop()
+            df = load_catalog_yccd(grade_sel, tuple(subj_sel))
+        else:
+            df = load_default_yccd()
+    except Exception as e:
+        st.error(str(e))
+        st.stop()
+
+mem = df.attrs.get("memory")
+if mem:
+    per_session = mem["after_bytes"] if up is not None else 0
+    yccd_caption.caption(f"YCCĐ: {len(df)} dòng • {mem['after_bytes'] / 1024:.0f} KB "
+                         f"(dạng chuỗi: {mem['before_bytes'] / 1024:.0f} KB) • "
+                         f"bộ nhớ riêng của phiên: {per_session / 1024:.0f} KB "
+                         f"(trước: {mem['before_bytes'] / 1024:.0f} KB + bản copy khi lọc)")
 
 tabs = st.tabs(["1) Ma trận (tối giản)", "2) Tạo đề & chỉnh sửa", "3) Tải xuống"])
 
 # ---- Tab 1: Matrix builder (minimal) ----
-with tabs[0]:
+with tabs[0], profiler.section(prof, "tab1"):
     st.subheader("Tạo ma trận tối giản theo YCCĐ (để test V1.1)")
     st.caption("Mỗi dòng = 1 YCCĐ + cấu hình dạng/mức/điểm/số câu. Đây là bản tối giản để chạy trên GitHub + Streamlit Cloud.")
 
     c1, c2, c3 = st.columns([1,1,1])
     with c1:
         subject = st.selectbox("Môn", sorted(df["Môn"].unique().tolist()))
-    df_s = df[df["Môn"] == subject].copy()
+    # lọc bằng mask trên df dùng chung, chỉ cắt ra vài dòng của bài đang chọn
+    m_s = df["Môn"] == subject
 
     with c2:
-        topic = st.selectbox("Chủ đề/Chủ điểm", sorted(df_s["Chủ đề/Chủ điểm"].unique().tolist()))
-    df_t = df_s[df_s["Chủ đề/Chủ điểm"] == topic].copy()
+        topic = st.selectbox("Chủ đề/Chủ điểm", sorted(df.loc[m_s, "Chủ đề/Chủ điểm"].unique().tolist()))
+    m_t = m_s & (df["Chủ đề/Chủ điểm"] == topic)
 
     with c3:
-        lesson = st.selectbox("Bài", sorted(df_t["Bài"].unique().tolist(), key=lambda x: (len(x), x)))
-    df_l = df_t[df_t["Bài"] == lesson].copy()
+        lesson = st.selectbox("Bài", sorted(df.loc[m_t, "Bài"].unique().tolist(), key=lambda x: (len(x), x)))
+    df_l = df.loc[m_t & (df["Bài"] == lesson), ["Tên bài học", "Yêu cầu cần đạt"]]
 
     lesson_name = df_l["Tên bài học"].iloc[0] if len(df_l) else ""
     st.write(f"**Tên bài học:** {lesson_name}")
@@ -301,7 +415,11 @@ with tabs[0]:
         st.info(f"Gợi ý số tiết: **{so_tiet_suggest}**. {so_tiet_note}")
 
 
-    yccd = st.selectbox("YCCĐ", df_l["Yêu cầu cần đạt"].tolist())
+    # chọn theo dòng của kho (không theo nội dung: YCCĐ trùng chữ vẫn ra đúng mã)
+    yccd_row = st.selectbox("YCCĐ", df_l.index.tolist(), format_func=lambda i: df_l.at[i, "Yêu cầu cần đạt"])
+    yccd = df_l.at[yccd_row, "Yêu cầu cần đạt"] if yccd_row is not None else None
+    if yccd_row is not None:
+        st.caption(f"Mã YCCĐ (dùng khi nhập ma trận từ file): `{catalog_ids(df).at[yccd_row]}`")
 
     cA, cB, cC, cD = st.columns([1,1,1,1])
     with cA:
@@ -337,6 +455,34 @@ with tabs[0]:
         })
         st.success("Đã thêm 1 dòng vào ma trận.")
 
+    with st.expander("📥 Nhập cả ma trận từ file (CSV/XLSX)"):
+        # khớp với cả khối (mọi môn), không chỉ các môn đang chọn ở sidebar
+        if catalog_grades and up is None:
+            import_yccd = load_catalog_yccd(grade_sel, tuple(grade_subjects))
+            import_ppct = (load_catalog_ppct(grade_sel, tuple(sorted({ppct_subject(s) for s in grade_subjects})))
+                           if use_extracted or ppct_pdf is None else st.session_state.get("ppct_df"))
+        else:
+            import_yccd, import_ppct = df, st.session_state.get("ppct_df")
+        st.caption("Cột: Môn, Bài, Yêu cầu cần đạt (hoặc Mã YCCĐ), Dạng câu hỏi, Mức độ, Số câu, Block; "
+                   "tuỳ chọn Điểm, Số tiết. File XLSX ma trận tải từ app cũng nhập lại được.")
+        st.download_button("⬇️ File mẫu (CSV)", data=template_csv(import_yccd), file_name="Mau_ma_tran.csv",
+                           mime="text/csv")
+        matrix_file = st.file_uploader("File ma trận", type=["csv", "xlsx"], key="matrix_import_file")
+        replace = st.checkbox("Thay thế ma trận hiện tại", value=False, key="matrix_import_replace")
+        if st.button("📥 Nhập ma trận", disabled=matrix_file is None):
+            try:
+                rows, report = import_matrix(read_matrix_file(matrix_file), import_yccd, import_ppct)
+            except Exception as e:
+                st.error(f"Không đọc được file: {e}")
+            else:
+                st.session_state.matrix_rows = (rows if replace else st.session_state.matrix_rows + rows)
+                st.session_state.matrix_import_report = report
+                st.success(f"Đã nhập {len(rows)} dòng ({sum(r['n'] for r in rows)} câu).")
+        report = st.session_state.get("matrix_import_report")
+        if report is not None and len(report):
+            st.warning(f"{len(report)} dòng không nhập được:")
+            st.dataframe(report, use_container_width=True, hide_index=True)
+
     if st.session_state.matrix_rows:
         st.markdown("### Ma trận hiện tại")
         mdf = pd.DataFrame(st.session_state.matrix_rows)
@@ -349,15 +495,11 @@ with tabs[0]:
                 if ppct_df_state is None or len(ppct_df_state) == 0:
                     st.warning("Chưa có PPCT. Hãy upload K5.pdf hoặc dùng CSV trích sẵn ở sidebar.")
                 else:
-                    new_rows = []
-                    for r in st.session_state.matrix_rows:
-                        if int(r.get("so_tiet") or 0) > 0:
-                            new_rows.append(r); continue
-                        so_tiet, note = find_periods(ppct_df_state, r.get("subject",""), r.get("lesson",""))
+                    todo = [r for r in st.session_state.matrix_rows if int(r.get("so_tiet") or 0) <= 0]
+                    found = match_periods(ppct_df_state, [r.get("subject","") for r in todo], [r.get("lesson","") for r in todo])
+                    for r, (so_tiet, note) in zip(todo, found):
                         r["so_tiet"] = int(so_tiet) if so_tiet is not None else 0
                         r["so_tiet_note"] = note
-                        new_rows.append(r)
-                    st.session_state.matrix_rows = new_rows
                     st.success("Đã auto-fill Số tiết (những dòng khớp được).")
         with colx2:
             mode = st.selectbox("Chế độ tính tỉ lệ/điểm", ["Toàn đề (10 điểm)", "2 block (2,5 / 7,5)"], index=1)
@@ -374,7 +516,9 @@ with tabs[0]:
             else:
                 st.warning(msg)
 
-        colx1, colx2 = st.columns([1,1])
+        colx1, colx2, colx3 = st.columns([1,1,1])
+        with colx3:
+            render_matrix_download()
         with colx1:
             if st.button("🧹 Xoá toàn bộ ma trận"):
                 st.session_state.matrix_rows = []
@@ -382,8 +526,14 @@ with tabs[0]:
         with colx2:
             st.caption("Bước tiếp theo: sang Tab 2 để tạo đề theo ma trận.")
 
+    sync_pregen()
+    if use_pregen and api_key and st.session_state.matrix_rows:
+        pg = get_pregenerator().status(st.session_state.session_id)
+        st.caption(f"Sinh trước (nền): {pg[PREGEN_READY]} câu sẵn sàng • {pg[PREGEN_RUNNING]} đang sinh • "
+                   f"{pg[PREGEN_QUEUED]} đang chờ")
+
 # ---- Tab 2: Generate + edit ----
-with tabs[1]:
+with tabs[1], profiler.section(prof, "tab2"):
     st.subheader("Tạo đề theo ma trận & chỉnh sửa")
     if not st.session_state.matrix_rows:
         st.info("Chưa có ma trận. Hãy thêm dòng ở Tab 1.")
@@ -395,65 +545,75 @@ with tabs[1]:
     with colg2:
         meta_time = st.text_input("Thời gian (phút)", value="40")
     with colg3:
-        grade = st.selectbox("Lớp", [5], index=0)
-
-    # Build blueprint
-    blueprint = []
-    for row in st.session_state.matrix_rows:
-        for _ in range(int(row["n"])):
-            pts = float(row.get("so_diem")) if row.get("so_diem") not in (None, "", 0) else float(row.get("points", 1))
-            blueprint.append({
-                "subject": row["subject"],
-                "topic": row["topic"],
-                "lesson": row["lesson"],
-                "yccd": row["yccd"],
-                "qtype": row["qtype"],
-                "level": row["level"],
-                "points": pts,
-            })
+        grade = st.selectbox("Lớp", [grade_sel], index=0)
+
+    blueprint = build_blueprint(st.session_state.matrix_rows, grade)
 
     st.caption(f"Số câu theo ma trận: **{len(blueprint)}**")
 
+    job = current_job()
+    busy = job is not None and job.active
+
     colb1, colb2, colb3 = st.columns([1,1,1])
     with colb1:
-        if st.button("⚙️ TẠO ĐỀ", type="primary"):
-            st.session_state.exam = []
-            for meta in blueprint:
-                qobj, ok, msg = make_question(meta, api_key, model, api_base, temperature, max_tokens)
-                st.session_state.exam.append({
-                    "qtype": meta["qtype"],
-                    "level": meta["level"],
-                    "points": meta["points"],
-                    "subject": meta["subject"],
-                    "topic": meta["topic"],
-                    "lesson": meta["lesson"],
-                    "yccd": meta["yccd"],
-                    "content": qobj,
-                    "status": "OK" if ok else msg,
-                })
-            st.success("Đã tạo đề xong.")
+        if st.button("⚙️ TẠO ĐỀ", type="primary", disabled=busy):
+            start_job(KIND_GENERATE, blueprint)
+            st.session_state.token_blueprint = blueprint
     with colb2:
-        if st.button("🔁 TẠO LẠI ĐỀ (giữ form)"):
+        if st.button("🔁 TẠO LẠI ĐỀ (giữ form)", disabled=busy):
             if not st.session_state.exam:
                 st.warning("Chưa có đề. Bấm TẠO ĐỀ trước.")
             else:
-                new_exam = []
-                for q in st.session_state.exam:
-                    meta = {k: q[k] for k in ["subject","topic","lesson","yccd","qtype","level","points"]}
-                    qobj, ok, msg = make_question(meta, api_key, model, api_base, temperature, max_tokens)
-                    new_exam.append({**q, "content": qobj, "status": "OK" if ok else msg})
-                st.session_state.exam = new_exam
-                st.success("Đã tạo lại đề (giữ form).")
+                regenerate_questions(range(1, len(st.session_state.exam) + 1))
     with colb3:
         st.caption("Không có API key vẫn chạy (offline mẫu cấu trúc) để bạn test xuất Word.")
 
+    # Job nền: tiến độ / huỷ / chạy tiếp; kết quả đưa vào exam khi xong
+    job = current_job()
+    if job is not None:
+        if job.active:
+            job_progress(job.id)
+        elif not job.applied and job.status == DONE:
+            apply_job(job)
+            st.success("Đã tạo đề xong." if job.kind == KIND_GENERATE else f"Đã tạo lại {job.total} câu.")
+        elif job.resumable:
+            st.warning(f"Job {job.status}: đã sinh {job.done}/{job.total} câu. {job.error}".strip())
+            colj1, colj2 = st.columns([1,1])
+            with colj1:
+                if st.button("▶️ Chạy tiếp"):
+                    get_job_manager().resume(job.id, job_settings())
+                    st.rerun()
+            with colj2:
+                if st.button(f"Dùng {job.done} câu đã sinh", disabled=job.applied or job.done == 0):
+                    apply_job(job)
+                    st.rerun()
+
     st.divider()
     if not st.session_state.exam:
         st.info("Chưa có đề. Bấm TẠO ĐỀ.")
         st.stop()
 
+    # Tạo lại có chọn lọc: mặc định chọn các câu AI trả chưa đạt
+    failed = [i for i, q in enumerate(st.session_state.exam, 1) if not q.get("ok", q.get("status") == "OK")]
+    colr1, colr2 = st.columns([3,1])
+    with colr1:
+        selected = st.multiselect("Câu cần tạo lại (mặc định: các câu lỗi)", list(range(1, len(st.session_state.exam) + 1)),
+                                  default=failed, format_func=lambda i: f"Câu {i}", key="regen_selected")
+    with colr2:
+        if st.button("🎯 Tạo lại câu đã chọn", disabled=not selected or busy):
+            regenerate_questions(selected)
+            st.rerun()
+
     total_points = sum(float(q["points"]) for q in st.session_state.exam)
     st.write(f"**Tổng câu:** {len(st.session_state.exam)}  •  **Tổng điểm (tham chiếu):** {total_points}")
+    token_bp = st.session_state.get("token_blueprint")
+    if token_bp:
+        # tính theo việc cache có thực sự được dùng không (API có thể từ chối), không theo checkbox
+        cached = context_cache is not None and context_cache.cached(SYSTEM_INSTRUCTION, model, api_key, api_base)
+        rep = prompt_token_report(token_bp, cached=cached)
+        st.caption(f"Token đầu vào (ước tính) cho {rep['questions']} câu: {rep['compact_tokens']} "
+                   f"(prompt cũ: {rep['legacy_tokens']}) → tiết kiệm {rep['saved_tokens']} token ({rep['saved_pct']}%)"
+                   + ("; hướng dẫn chung đã cache." if cached else "; hướng dẫn chung gửi kèm từng câu (không cache)."))
 
     st.markdown("### Chỉnh sửa nhanh từng câu")
     for idx, q in enumerate(st.session_state.exam, 1):
@@ -486,7 +646,8 @@ with tabs[1]:
                 left = mt.get("left", [])
                 right = mt.get("right", [])
                 # enforce 4 lines editor
-                n = st.number_input("Số cặp (khuyến nghị 4)", min_value=2, max_value=8, value=max(4, len(left), len(right)), step=1, key=f"mt_n_{idx}")
+                n = st.number_input("Số cặp (khuyến nghị 4)", min_value=2, max_value=MATCH_MAX_PAIRS,
+                                    value=min(MATCH_MAX_PAIRS, max(4, len(left), len(right))), step=1, key=f"mt_n_{idx}")
                 while len(left) < n: left.append("")
                 while len(right) < n: right.append("")
                 for j in range(n):
@@ -522,7 +683,7 @@ with tabs[1]:
             st.session_state.exam[idx-1]["content"] = content
 
 # ---- Tab 3: Export ----
-with tabs[2]:
+with tabs[2], profiler.section(prof, "tab3"):
     st.subheader("Tải xuống")
     if not st.session_state.exam:
         st.info("Chưa có đề để tải.")
@@ -531,7 +692,7 @@ with tabs[2]:
     meta = {
         "title": st.text_input("Tiêu đề (xuất Word)", value="ĐỀ KIỂM TRA ĐỊNH KÌ"),
         "subject": st.session_state.exam[0].get("subject",""),
-        "grade": 5,
+        "grade": st.session_state.exam[0].get("grade", grade_sel),
         "time": st.text_input("Thời gian (phút)", value="40", key="time_export"),
     }
 
@@ -541,3 +702,49 @@ with tabs[2]:
     session = {"matrix_rows": st.session_state.matrix_rows, "exam": st.session_state.exam}
     st.download_button("⬇️ Tải session.json", data=json.dumps(session, ensure_ascii=False, indent=2),
                        file_name="session.json", mime="application/json")
+
+    with st.expander("📝 Chấm bài làm của học sinh (CSV/XLSX)"):
+        st.caption("Mỗi học sinh 1 dòng: Học sinh, Mã đề (nếu có), Câu 1, Câu 2, ... Trắc nghiệm ghi B; "
+                   "Đúng/Sai ghi ĐSĐS; nối cột ghi 1B 2A 3D 4C; điền khuyết ghi từ cần điền; "
+                   "tự luận ghi điểm đã chấm.")
+        variant_files = st.file_uploader("session.json của các mã đề khác (tên file = mã đề, tuỳ chọn)",
+                                         type=["json"], accept_multiple_files=True, key="grading_variants")
+        base_code = st.text_input("Mã đề của đề hiện tại", value="", key="grading_base_code",
+                                  disabled=not variant_files,
+                                  help="Bắt buộc khi có nhiều mã đề: học sinh bỏ trống ô Mã đề sẽ được ghi chú, không bị chấm theo đề này.")
+        try:
+            if variant_files and not base_code.strip():
+                raise ValueError("Nhập mã đề của đề hiện tại (có nhiều mã đề).")
+            exams = {base_code: st.session_state.exam}
+            for f in variant_files or []:
+                exams[f.name.rsplit(".", 1)[0]] = json.loads(f.getvalue().decode("utf-8")).get("exam", [])
+            answer_key = compile_key(exams if variant_files else st.session_state.exam)
+        except (ValueError, json.JSONDecodeError) as e:
+            answer_key = None
+            st.error(f"Không dựng được đáp án: {e}")
+        if answer_key is not None:
+            st.download_button("⬇️ Phiếu bài làm mẫu (CSV)", data=response_template(answer_key),
+                               file_name="Mau_bai_lam.csv", mime="text/csv")
+            sheet_file = st.file_uploader("Bảng bài làm", type=["csv", "xlsx"], key="grading_file")
+            if st.button("📝 Chấm", disabled=sheet_file is None):
+                try:
+                    st.session_state.grading_result = grade_responses(read_responses(sheet_file), answer_key)
+                except Exception as e:
+                    st.error(f"Không chấm được: {e}")
+        result = st.session_state.get("grading_result")
+        if result is not None:
+            students, stats = result
+            graded = students["Tổng điểm"].dropna()
+            c1, c2, c3 = st.columns(3)
+            c1.metric("Học sinh đã chấm", f"{len(graded)}/{len(students)}")
+            c2.metric("Điểm TB", f"{graded.mean():.2f}" if len(graded) else "—")
+            c3.metric("Trung vị", f"{graded.median():.2f}" if len(graded) else "—")
+            st.markdown("**Thống kê từng câu**")
+            st.dataframe(stats, use_container_width=True, hide_index=True)
+            st.markdown("**Điểm từng học sinh**")
+            st.dataframe(students, use_container_width=True, hide_index=True)
+            st.download_button("⬇️ Tải kết quả (XLSX)", data=results_xlsx(students, stats), file_name="Ket_qua_cham.xlsx",
+                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+if prof is not None:
+    prof.finish()
@@ -0,0 +1,71 @@
+\
+"""
+Chạy nhánh context caching (cachedContents -> cachedContent -> cachedContentTokenCount) trên mock
+server và đo token đầu vào gửi thật (promptTokenCount - cachedContentTokenCount).
+
+SYSTEM_INSTRUCTION hiện ngắn hơn MIN_CACHE_TOKENS nên ở ngưỡng thật (kịch bản "cache_real_threshold")
+client không tạo cache và gửi hướng dẫn kèm từng câu. Kịch bản "cache" hạ ngưỡng của cả client
+(ContextCache(min_tokens=...)) lẫn mock xuống cùng 1 giá trị, không cao hơn độ dài hướng dẫn,
+để nhánh cache thực sự chạy.
+
+    python -m bench.context_cache --n 50 --min-tokens 128
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+from typing import Any, Dict, Optional
+
+from bench.mock_gemini import start_mock
+from src.gemini import MIN_CACHE_TOKENS, ContextCache, cache_tokens, generate_json
+from src.generation import LEVELS_TT27, QTYPES, SYSTEM_INSTRUCTION, build_prompt
+
+MODEL = "gemini-2.0-flash"
+
+def run_mode(n: int, min_tokens: int, cache: Optional[ContextCache]) -> Dict[str, Any]:
+    server, base = start_mock(invalid_rate=0, schema_invalid_rate=0, cache_min_tokens=min_tokens)
+    try:
+        for i in range(n):
+            meta = {"subject": "Toán", "topic": "Số thập phân", "lesson": f"Bài {i % 30 + 1}",
+                    "yccd": "Thực hiện được phép cộng, trừ số thập phân.", "qtype": QTYPES[i % len(QTYPES)],
+                    "level": LEVELS_TT27[i % 3], "points": 0.5}
+            generate_json(build_prompt(meta), api_key="mock", model=MODEL, api_base=base,
+                          system_instruction=SYSTEM_INSTRUCTION, cache=cache)
+        st = server.state
+        return {
+            "min_tokens": min_tokens,
+            "cache_creates": st.cache_creates,
+            "requests_with_cached_content": st.cached_requests,
+            "cached": bool(cache and cache.cached(SYSTEM_INSTRUCTION, MODEL, "mock", base)),
+            "input_tokens_sent": st.prompt_tokens - st.cached_tokens,
+            "cached_content_tokens": st.cached_tokens,
+        }
+    finally:
+        server.shutdown()
+
+def measure_context_cache(n: int = 50, min_tokens: int = 128) -> Dict[str, Any]:
+    system = cache_tokens(SYSTEM_INSTRUCTION)
+    if min_tokens > system:
+        raise ValueError(f"--min-tokens {min_tokens} > độ dài hướng dẫn (~{system} token): nhánh cache không chạy.")
+    out: Dict[str, Any] = {"system_instruction_tokens": system}
+    scenarios = [
+        ("no_cache", min_tokens, None),
+        ("cache", min_tokens, ContextCache(min_tokens=min_tokens)),
+        ("cache_real_threshold", MIN_CACHE_TOKENS, ContextCache()),
+    ]
+    for label, threshold, cache in scenarios:
+        out[label] = run_mode(n, threshold, cache)
+        print(f"{label:<22} {json.dumps(out[label], ensure_ascii=False)}", flush=True)
+    return out
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=50)
+    ap.add_argument("--min-tokens", type=int, default=128,
+                    help="ngưỡng cache dùng chung cho client và mock (không cao hơn độ dài hướng dẫn)")
+    args = ap.parse_args(argv)
+    measure_context_cache(args.n, args.min_tokens)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
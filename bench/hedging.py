@@ -0,0 +1,96 @@
+\
+"""
+Đo độ trễ đuôi (p50/p95/p99) của generate_json trên mock server có "straggler",
+khi gọi 1 lần / hedged request / hedged + model dự phòng, và khi model chính suy giảm.
+
+    python -m bench.hedging --n 400 --slow-rate 0.05 --slow-ms 1500
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from bench.mock_gemini import start_mock
+from src.gemini import GeminiError, LatencyStats, Router, generate_json
+from src.generation import SYSTEM_INSTRUCTION, build_prompt
+from src.validators import response_schema
+
+PRIMARY = "gemini-2.0-flash"
+FALLBACK = "gemini-fallback"
+META = {"subject": "Toán", "topic": "Số thập phân", "lesson": "Bài 10", "grade": 5,
+        "yccd": "Thực hiện được phép cộng, trừ số thập phân.",
+        "qtype": "Trắc nghiệm nhiều lựa chọn", "level": "M1 – Nhận biết", "points": 0.5}
+
+def _pct(xs: List[float], p: float) -> float:
+    xs = sorted(xs)
+    return round(xs[min(len(xs) - 1, int(round(p / 100.0 * (len(xs) - 1))))] * 1000, 1)
+
+def run_mode(base: str, router: Optional[Router], n: int, warmup: int, concurrency: int, server) -> Dict[str, Any]:
+    prompt = build_prompt(META)
+    schema = response_schema(META["qtype"])
+
+    def one(_):
+        t0 = time.perf_counter()
+        try:
+            generate_json(prompt, api_key="mock", model=PRIMARY, api_base=base,
+                          system_instruction=SYSTEM_INSTRUCTION, response_schema=schema, router=router)
+            return time.perf_counter() - t0, True
+        except GeminiError:
+            return time.perf_counter() - t0, False
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(warmup)))  # cho router đủ mẫu độ trễ
+        start_requests = server.state.requests
+        results = list(pool.map(one, range(n)))
+    time.sleep(0.5)  # request hedge thua vẫn chạy nốt ở nền
+    lat = [t for t, ok in results if ok]
+    return {
+        "ok_rate": round(len(lat) / n, 3),
+        "p50_ms": _pct(lat, 50) if lat else None,
+        "p95_ms": _pct(lat, 95) if lat else None,
+        "p99_ms": _pct(lat, 99) if lat else None,
+        "max_ms": round(max(lat) * 1000, 1) if lat else None,
+        "requests_per_call": round((server.state.requests - start_requests) / n, 3),
+    }
+
+def measure_hedging(n: int = 400, latency_ms: float = 40, jitter_ms: float = 10, slow_rate: float = 0.05,
+                    slow_ms: float = 1500, concurrency: int = 8, seed: int = 0) -> Dict[str, Any]:
+    out = {}
+    scenarios = [
+        ("single", {}, None),
+        ("hedge", {}, lambda: Router(hedge=True, stats=LatencyStats())),
+        ("hedge+fallback", {}, lambda: Router(fallbacks=[(FALLBACK, "")], hedge=True, stats=LatencyStats())),
+        # model chính lỗi 60% (503): không router thì lỗi thẳng, có router thì chuyển sang dự phòng
+        ("degraded_single", {PRIMARY: {"error_rate": 0.6}}, None),
+        ("degraded_router", {PRIMARY: {"error_rate": 0.6}},
+         lambda: Router(fallbacks=[(FALLBACK, "")], hedge=True, stats=LatencyStats())),
+    ]
+    for label, models, make_router in scenarios:
+        server, base = start_mock(seed=seed, models=models, latency_ms=latency_ms, jitter_ms=jitter_ms,
+                                  slow_rate=slow_rate, slow_ms=slow_ms, invalid_rate=0)
+        try:
+            out[label] = run_mode(base, make_router() if make_router else None, n, warmup=60,
+                                  concurrency=concurrency, server=server)
+        finally:
+            server.shutdown()
+        print(f"{label:<18} {json.dumps(out[label], ensure_ascii=False)}", flush=True)
+    return out
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=400)
+    ap.add_argument("--latency-ms", type=float, default=40)
+    ap.add_argument("--jitter-ms", type=float, default=10)
+    ap.add_argument("--slow-rate", type=float, default=0.05, help="xác suất 1 request thành straggler")
+    ap.add_argument("--slow-ms", type=float, default=1500)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    measure_hedging(args.n, args.latency_ms, args.jitter_ms, args.slow_rate, args.slow_ms, args.concurrency, args.seed)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+\
+"""
+Profile thời gian import lúc khởi động (cold start) của các module src.*.
+
+    python -m bench.importtime            # báo cáo top module theo thời gian import
+    python -m bench.importtime --top 30
+
+Chạy trong tiến trình con mới với `python -X importtime` để đo đúng cold start.
+"""
+from __future__ import annotations
+import argparse
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Những module app.py import ngay khi khởi động
+STARTUP_MODULES = ["src.data", "src.ppct", "src.gemini", "src.validators", "src.export_docx", "src.matrix", "src.perf",
+                   "src.catalog", "src.generation", "src.jobs", "src.export_xlsx", "src.profiler", "src.pregen",
+                   "src.grading"]
+# Thư viện nặng phải hoãn tới lần dùng đầu tiên
+DEFERRED_PACKAGES = ["docx", "pypdf", "requests", "openpyxl"]
+# Ngân sách cold start (ms) cho việc import STARTUP_MODULES (pandas chiếm phần lớn)
+COLD_START_BUDGET_MS = 600.0
+
+_LINE = re.compile(r"import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+def profile_imports(modules: List[str] = STARTUP_MODULES) -> Dict[str, Any]:
+    """
+    Import `modules` trong tiến trình con, trả về wall time + bảng thời gian từng module.
+    """
+    code = "import " + ", ".join(modules)
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=ROOT, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        rows.append({
+            "module": m.group(4),
+            "self_ms": int(m.group(1)) / 1000,
+            "cumulative_ms": int(m.group(2)) / 1000,
+            "depth": len(m.group(3)) // 2,
+        })
+    top_level = [r for r in rows if r["depth"] == 0]
+    loaded = {r["module"].split(".")[0] for r in rows}
+    return {
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(sum(r["cumulative_ms"] for r in top_level), 1),
+        "modules": rows,
+        "deferred_loaded": [p for p in DEFERRED_PACKAGES if p in loaded],
+    }
+
+def check_budget(profile: Dict[str, Any], budget_ms: float = COLD_START_BUDGET_MS) -> List[str]:
+    """
+    Trả danh sách vi phạm (rỗng = đạt): vượt ngân sách hoặc thư viện nặng bị import sớm.
+    """
+    problems = []
+    if profile["import_ms"] > budget_ms:
+        problems.append(f"Cold start {profile['import_ms']} ms > ngân sách {budget_ms} ms")
+    for p in profile["deferred_loaded"]:
+        problems.append(f"'{p}' bị import lúc khởi động (phải hoãn tới lần dùng đầu)")
+    return problems
+
+def main(argv: List[str] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--budget", type=float, default=COLD_START_BUDGET_MS)
+    args = ap.parse_args(argv)
+
+    prof = profile_imports()
+    print(f"Import {', '.join(STARTUP_MODULES)}")
+    print(f"  tổng import: {prof['import_ms']} ms   (wall tiến trình con: {prof['wall_ms']} ms)\n")
+    print(f"{'module':<40} {'self ms':>10} {'cum ms':>10}")
+    for r in sorted(prof["modules"], key=lambda r: r["self_ms"], reverse=True)[:args.top]:
+        print(f"{r['module']:<40} {r['self_ms']:>10.1f} {r['cumulative_ms']:>10.1f}")
+    problems = check_budget(prof, args.budget)
+    for p in problems:
+        print("VI PHẠM:", p)
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
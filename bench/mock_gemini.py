@@ -0,0 +1,266 @@
+\
+"""
+Mock server cục bộ mô phỏng Gemini generateContent / cachedContents để đo hiệu năng
+và tỉ lệ JSON hợp lệ mà không tốn quota.
+
+    python -m bench.mock_gemini --port 8765 --invalid-rate 0.2 --latency-ms 300
+
+Mô phỏng:
+- Không có responseSchema: model "tự do" trả đúng mẫu nhưng có xác suất `invalid_rate`
+  làm hỏng cấu trúc (thiếu field, sai kiểu, thiếu chỗ trống...).
+- Có responseSchema: sinh object đúng theo schema (giống constrained decoding), nhưng với xác
+  suất `schema_invalid_rate` vẫn sai những luật schema không diễn đạt được (chuỗi rỗng, đoạn
+  điền khuyết thiếu '____'...). Tỉ lệ này là giả định của mock, không phải số đo từ API thật.
+- Độ trễ: latency_ms ± jitter, với xác suất slow_rate thành "straggler" slow_ms;
+  error_rate trả HTTP 503. Có thể cấu hình riêng theo model (models={...}).
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+from src.gemini import MIN_CACHE_TOKENS, cache_tokens
+from src.validators import QTYPE_MC, QTYPE_TF, QTYPE_MATCH, QTYPE_FILL, QTYPE_ESSAY
+
+DEFAULTS = {
+    "invalid_rate": 0.2,
+    "schema_invalid_rate": 0.05,
+    "latency_ms": 0.0,
+    "jitter_ms": 0.0,
+    "slow_rate": 0.0,
+    "slow_ms": 0.0,
+    "error_rate": 0.0,
+    "cache_min_tokens": MIN_CACHE_TOKENS,   # dưới ngưỡng này cachedContents trả 400 (cùng ngưỡng với client)
+}
+
+def _valid_object(qtype: str) -> Dict[str, Any]:
+    if qtype == QTYPE_MC:
+        return {"stem": "Câu hỏi?", "options": {k: f"Phương án {k}" for k in "ABCD"}, "correct_answer": "B",
+                "explanation": "..."}
+    if qtype == QTYPE_TF:
+        return {"stem": "Đúng hay sai?", "true_false": [{"statement": "Mệnh đề 1", "answer": True},
+                                                        {"statement": "Mệnh đề 2", "answer": False}],
+                "explanation": "..."}
+    if qtype == QTYPE_MATCH:
+        return {"stem": "Nối cột:", "matching": {"left": ["1) a", "2) b", "3) c", "4) d"],
+                                                  "right": ["A) w", "B) x", "C) y", "D) z"],
+                                                  "answer": {"1": "B", "2": "A", "3": "D", "4": "C"}},
+                "explanation": "..."}
+    if qtype == QTYPE_FILL:
+        return {"stem": "Điền vào chỗ trống:", "fill_blank": {"text": "Số ____ là số chẵn.", "answer": "2"},
+                "explanation": "..."}
+    return {"stem": "Trả lời:", "essay": {"prompt": "Trình bày...", "rubric": ["Ý 1", "Ý 2"]}, "explanation": "..."}
+
+def _corrupt(qtype: str, obj: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    """
+    Các lỗi cấu trúc hay gặp khi model trả JSON tự do.
+    """
+    obj = json.loads(json.dumps(obj))
+    if qtype == QTYPE_MC:
+        rng.choice([
+            lambda: obj["options"].pop("D"),
+            lambda: obj.update(correct_answer="Phương án B"),
+            lambda: obj.update(options=[v for v in obj["options"].values()]),
+        ])()
+    elif qtype == QTYPE_TF:
+        rng.choice([
+            lambda: obj["true_false"][0].update(answer="Đúng"),
+            lambda: obj.update(true_false=obj["true_false"][:1]),
+        ])()
+    elif qtype == QTYPE_MATCH:
+        rng.choice([
+            lambda: obj["matching"].update(answer=["1-B", "2-A"]),
+            lambda: obj.update(matching={"pairs": obj["matching"]["left"]}),
+        ])()
+    elif qtype == QTYPE_FILL:
+        rng.choice([
+            lambda: obj["fill_blank"].update(text="Số ... là số chẵn."),
+            lambda: obj["fill_blank"].pop("answer"),
+        ])()
+    else:
+        rng.choice([
+            lambda: obj.pop("essay"),
+            lambda: obj["essay"].update(rubric="Ý 1; Ý 2"),
+        ])()
+    return obj
+
+def _corrupt_constrained(qtype: str, obj: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    """
+    Lỗi vẫn lọt qua structured output: đúng kiểu/field theo schema nhưng sai luật của validator.
+    """
+    obj = json.loads(json.dumps(obj))
+    fixes = [lambda: obj.update(stem="")]
+    if qtype == QTYPE_MC:
+        fixes.append(lambda: obj["options"].update(D=""))
+    elif qtype == QTYPE_TF:
+        fixes.append(lambda: obj["true_false"][-1].update(statement=""))
+    elif qtype == QTYPE_FILL:
+        fixes += [lambda: obj["fill_blank"].update(text="Số ... là số chẵn."),
+                  lambda: obj["fill_blank"].update(answer="")]
+    elif qtype == QTYPE_ESSAY:
+        fixes.append(lambda: obj["essay"].update(prompt=""))
+    rng.choice(fixes)()
+    return obj
+
+def _schema_qtype(schema: Dict[str, Any]) -> str:
+    props = schema.get("properties") or {}
+    for field, qtype in (("options", QTYPE_MC), ("true_false", QTYPE_TF), ("matching", QTYPE_MATCH),
+                         ("fill_blank", QTYPE_FILL)):
+        if field in props:
+            return qtype
+    return QTYPE_ESSAY
+
+def _from_schema(schema: Dict[str, Any], name: str = "") -> Any:
+    t = (schema.get("type") or "").upper()
+    if t == "OBJECT":
+        return {k: _from_schema(v, k) for k, v in (schema.get("properties") or {}).items()}
+    if t == "ARRAY":
+        n = max(int(schema.get("minItems") or 0), 2)
+        return [_from_schema(schema.get("items") or {"type": "STRING"}, name) for _ in range(n)]
+    if t == "BOOLEAN":
+        return True
+    if t in ("INTEGER", "NUMBER"):
+        return 1
+    if schema.get("enum"):
+        return schema["enum"][0]
+    if "____" in (schema.get("description") or ""):
+        return "Nội dung ____ cần điền."
+    return f"nội dung {name}".strip()
+
+_QTYPE_RE = re.compile(r"(?:Dạng:\s*|dạng\s+)(" + "|".join(map(re.escape, [QTYPE_MC, QTYPE_TF, QTYPE_MATCH, QTYPE_FILL, QTYPE_ESSAY])) + ")")
+
+class MockState:
+    def __init__(self, seed: int = 0, models: Optional[Dict[str, Dict[str, float]]] = None, **cfg: float):
+        self.cfg = {**DEFAULTS, **cfg}
+        self.models = models or {}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.cached = {}
+        self.cache_creates = 0       # cachedContents tạo thành công
+        self.cached_requests = 0     # generateContent có cachedContent hợp lệ
+        self.prompt_tokens = 0       # tổng promptTokenCount (gồm phần cache)
+        self.cached_tokens = 0       # tổng cachedContentTokenCount
+
+    def conf(self, model: str) -> Dict[str, float]:
+        return {**self.cfg, **self.models.get(model, {})}
+
+    def draw(self) -> float:
+        with self.lock:
+            return self.rng.random()
+
+def _handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, body: Dict[str, Any]):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            with state.lock:
+                state.requests += 1
+            if self.path.rstrip("/").endswith("/cachedContents"):
+                return self._cached_contents(payload)
+            m = re.search(r"/models/([^/:]+):generateContent", self.path)
+            if not m:
+                return self._send(404, {"error": {"message": "not found"}})
+            return self._generate(m.group(1), payload)
+
+        def _cached_contents(self, payload: Dict[str, Any]):
+            parts = (payload.get("systemInstruction") or {}).get("parts") or []
+            if cache_tokens("".join(p.get("text", "") for p in parts)) < state.cfg["cache_min_tokens"]:
+                return self._send(400, {"error": {"message": "Cached content is too small."}})
+            with state.lock:
+                state.cache_creates += 1
+                name = f"cachedContents/mock-{len(state.cached) + 1}"
+                state.cached[name] = payload.get("systemInstruction")
+            return self._send(200, {"name": name})
+
+        def _generate(self, model: str, payload: Dict[str, Any]):
+            cfg = state.conf(model)
+            delay = cfg["latency_ms"] + (state.draw() * 2 - 1) * cfg["jitter_ms"]
+            if state.draw() < cfg["slow_rate"]:
+                delay = cfg["slow_ms"]
+            if delay > 0:
+                time.sleep(delay / 1000.0)
+            if state.draw() < cfg["error_rate"]:
+                return self._send(503, {"error": {"message": "The model is overloaded."}})
+
+            prompt = "".join(p.get("text", "") for c in payload.get("contents", []) for p in c.get("parts", []))
+            gen = payload.get("generationConfig") or {}
+            schema = gen.get("responseSchema")
+            if schema:
+                obj = _from_schema(schema)
+                if state.draw() < cfg["schema_invalid_rate"]:
+                    obj = _corrupt_constrained(_schema_qtype(schema), obj, random.Random(state.draw()))
+            else:
+                qm = _QTYPE_RE.search(prompt)
+                qtype = qm.group(1) if qm else QTYPE_ESSAY
+                obj = _valid_object(qtype)
+                if state.draw() < cfg["invalid_rate"]:
+                    obj = _corrupt(qtype, obj, random.Random(state.draw()))
+            text = json.dumps(obj, ensure_ascii=False)
+            system = "".join(p.get("text", "") for p in (payload.get("systemInstruction") or {}).get("parts") or [])
+            cached = state.cached.get(payload.get("cachedContent") or "")
+            cached_tokens = cache_tokens("".join(p.get("text", "") for p in cached.get("parts") or [])) if cached else 0
+            prompt_tokens = (len(prompt) + len(system)) // 4 + cached_tokens
+            with state.lock:
+                state.cached_requests += 1 if cached else 0
+                state.prompt_tokens += prompt_tokens
+                state.cached_tokens += cached_tokens
+            return self._send(200, {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+                "usageMetadata": {
+                    "promptTokenCount": prompt_tokens,
+                    "candidatesTokenCount": len(text) // 4,
+                    "cachedContentTokenCount": cached_tokens,
+                },
+            })
+    return Handler
+
+def start_mock(host: str = "127.0.0.1", port: int = 0, seed: int = 0,
+               models: Optional[Dict[str, Dict[str, float]]] = None, **cfg: float) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Chạy mock server trong thread nền. Trả (server, api_base); nhớ server.shutdown() khi xong.
+    """
+    state = MockState(seed=seed, models=models, **cfg)
+    server = ThreadingHTTPServer((host, port), _handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1beta"
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8765)
+    for k, v in DEFAULTS.items():
+        ap.add_argument("--" + k.replace("_", "-"), type=float, default=v)
+    args = ap.parse_args(argv)
+    cfg = {k: getattr(args, k) for k in DEFAULTS}
+    server, base = start_mock(port=args.port, **cfg)
+    print(f"Mock Gemini: GEMINI_API_BASE = \"{base}\"  (Ctrl+C để dừng)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,97 @@
+\
+"""
+Đo thời gian từ lúc bấm TẠO ĐỀ tới khi có đề, có / không sinh trước, trên mock server.
+Mô phỏng giáo viên thêm lần lượt các dòng ma trận (mỗi dòng cách nhau --think-s giây),
+xoá 1 dòng giữa chừng, bấm 🧮 Tính Tỉ lệ & Số điểm (ghi lại so_diem mọi dòng), rồi bấm TẠO ĐỀ.
+
+    python -m bench.pregen --rows 8 --n 2 --think-s 2 --latency-ms 800
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from bench.mock_gemini import start_mock
+from src.generation import QTYPES, build_blueprint
+from src.jobs import JobManager, KIND_GENERATE
+from src.matrix import compute_ratio_points
+from src.pregen import Pregenerator
+from src.sessions import new_session_id
+
+MODEL = "gemini-2.0-flash"
+GRADE = 5
+
+def _rows(k: int, n: int) -> List[Dict[str, Any]]:
+    return [{"id": f"r{i}", "subject": "Toán", "topic": "Số thập phân", "lesson": f"Bài {10 + i}: Luyện tập",
+             "yccd": f"Yêu cầu cần đạt số {i}.", "qtype": QTYPES[i % len(QTYPES)], "level": "M1 – Nhận biết",
+             "points": 0.5, "n": n, "so_tiet": 1, "block": 1, "ti_le": None, "so_diem": None} for i in range(k)]
+
+def run_mode(base: str, server, rows: List[Dict[str, Any]], think_s: float, use_pregen: bool,
+             rate_per_min: float) -> Dict[str, Any]:
+    settings = {"api_key": "mock", "model": MODEL, "api_base": base, "temperature": 0.7, "max_tokens": 1024}
+    pre = Pregenerator(rate_per_min=rate_per_min, burst=3)
+    sid = new_session_id()
+    matrix: List[Dict[str, Any]] = []
+    start = server.state.requests
+    removed = rows[len(rows) // 2]
+    for row in rows:
+        matrix.append(row)
+        if row is rows[-1]:
+            # giáo viên xoá 1 dòng đã thêm trước đó
+            matrix.remove(removed)
+        if use_pregen:
+            pre.sync(sid, matrix, GRADE, settings)
+        time.sleep(think_s)
+    # như app: tính tỉ lệ & số điểm ngay trước TẠO ĐỀ, rerun sau đó sync lại
+    compute_ratio_points(matrix, "Toàn đề (10 điểm)", 2.5, 7.5)
+    if use_pregen:
+        pre.sync(sid, matrix, GRADE, settings)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mgr = JobManager(root=tmp)
+        job_settings = dict(settings)
+        if use_pregen:
+            job_settings["pregen"] = pre.taker(sid, settings)
+        t0 = time.perf_counter()
+        job = mgr.submit(sid, KIND_GENERATE, build_blueprint(matrix, GRADE), job_settings)
+        while job.active:
+            time.sleep(0.01)
+        wait = time.perf_counter() - t0
+        mgr.shutdown()
+    pre.shutdown()
+    time.sleep(0.2)
+    return {
+        "questions": job.total,
+        "ok": sum(1 for r in job.results if r and r["ok"]),
+        "time_to_exam_s": round(wait, 2),
+        "api_requests": server.state.requests - start,
+    }
+
+def measure_pregen(rows: int = 8, n: int = 2, think_s: float = 2.0, latency_ms: float = 800,
+                   rate_per_min: float = 30) -> Dict[str, Any]:
+    out = {}
+    for label, use in (("without_pregen", False), ("with_pregen", True)):
+        server, base = start_mock(latency_ms=latency_ms, jitter_ms=latency_ms / 10, invalid_rate=0)
+        try:
+            out[label] = run_mode(base, server, _rows(rows, n), think_s, use, rate_per_min)
+        finally:
+            server.shutdown()
+        print(f"{label:<16} {json.dumps(out[label], ensure_ascii=False)}", flush=True)
+    return out
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=8)
+    ap.add_argument("--n", type=int, default=2, help="số câu mỗi dòng")
+    ap.add_argument("--think-s", type=float, default=2.0, help="thời gian giữa 2 lần thêm dòng")
+    ap.add_argument("--latency-ms", type=float, default=800)
+    ap.add_argument("--rate-per-min", type=float, default=30, help="ngân sách sinh trước (câu/phút/phiên)")
+    args = ap.parse_args(argv)
+    measure_pregen(args.rows, args.n, args.think_s, args.latency_ms, args.rate_per_min)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
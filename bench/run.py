@@ -0,0 +1,229 @@
+\
+"""
+Benchmark các module lõi trên dữ liệu giả lập nhiều cỡ.
+
+    python -m bench.run                    # chạy đủ, so với bench/baseline.json
+    python -m bench.run --quick            # chỉ 2 cỡ nhỏ nhất mỗi case
+    python -m bench.run --update-baseline  # ghi kết quả hiện tại làm baseline
+    python -m bench.run --out result.json  # ghi kết quả (JSON) ra file
+
+Thoát mã 1 nếu có case chậm hơn baseline quá ngưỡng (--tolerance), hoặc cold start
+vượt ngân sách (bench.importtime.COLD_START_BUDGET_MS).
+"""
+from __future__ import annotations
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from bench import synthetic
+from bench.importtime import COLD_START_BUDGET_MS, check_budget, profile_imports
+from src.data import load_yccd
+from src.ppct import _extract_ppct_from_pdf_bytes, find_periods, match_periods
+from src.matrix import compute_ratio_points
+from src.validators import validate_question
+from src.export_docx import export_exam_docx
+from src.export_xlsx import export_matrix_xlsx
+from src.matrix_import import import_matrix
+from src.grading import compile_key, grade_responses
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_TOLERANCE = 1.5   # chậm hơn 50% so với baseline -> regression
+MIN_ABS_MS = 2.0          # bỏ qua chênh lệch tuyệt đối nhỏ (nhiễu đo)
+
+QUESTION_SCALES = [10, 100, 1000]
+YCCD_SCALES = [500, 5000, 50000]
+PDF_SCALES = [10, 100, 500]
+STUDENT_SCALES = [100, 1000, 10000]
+
+def case_load_yccd(n: int) -> Callable[[], Any]:
+    raw = synthetic.yccd_csv_upload(n).getvalue()
+    def run():
+        import io
+        f = io.BytesIO(raw)
+        f.name = "synthetic.csv"
+        return load_yccd(f)
+    return run
+
+def case_find_periods(n: int) -> Callable[[], Any]:
+    ppct = synthetic.ppct_frame()
+    rows = synthetic.matrix_rows(n)
+    def run():
+        return [find_periods(ppct, r["subject"], r["lesson"]) for r in rows]
+    return run
+
+def case_match_periods(n: int) -> Callable[[], Any]:
+    # khớp cả kho YCCĐ với PPCT đánh số lệch -> mọi dòng đi qua chỉ mục tên bài
+    ppct = synthetic.ppct_frame_titled()
+    yccd = synthetic.yccd_frame(n)
+    subjects = yccd["Môn"].tolist()
+    lessons = [f"Bài {b}: {name}" for b, name in zip(yccd["Bài"], yccd["Tên bài học"])]
+    def run():
+        from src import ppct as ppct_mod
+        ppct_mod._TITLE_INDEXES.clear()  # tính cả thời gian dựng chỉ mục
+        return match_periods(ppct, subjects, lessons)
+    return run
+
+def case_extract_pdf(pages: int) -> Callable[[], Any]:
+    pdf = synthetic.ppct_pdf(pages)
+    return lambda: _extract_ppct_from_pdf_bytes(pdf)
+
+def case_compute_ratio_points(n: int) -> Callable[[], Any]:
+    rows = synthetic.matrix_rows(n)
+    def run():
+        compute_ratio_points(rows, "Toàn đề (10 điểm)", 2.5, 7.5)
+        return compute_ratio_points(rows, "2 block (2,5 / 7,5)", 2.5, 7.5)
+    return run
+
+def case_validate_question(n: int) -> Callable[[], Any]:
+    qs = synthetic.exam_questions(n)
+    return lambda: [validate_question(q["qtype"], q["content"]) for q in qs]
+
+def case_export_exam_docx(n: int) -> Callable[[], Any]:
+    qs = synthetic.exam_questions(n)
+    meta = {"title": "Đề benchmark", "subject": "Toán", "grade": 5, "time": "40"}
+    return lambda: export_exam_docx(meta, qs)
+
+def case_export_matrix_xlsx(n: int) -> Callable[[], Any]:
+    ppct = synthetic.ppct_frame()
+    rows = synthetic.matrix_rows(n)
+    return lambda: export_matrix_xlsx([("Lớp 5A", rows), ("Lớp 5B", rows)], ppct)
+
+def case_import_matrix(n: int) -> Callable[[], Any]:
+    # n dòng ma trận khớp với kho 5000 YCCĐ + PPCT
+    yccd = synthetic.yccd_frame(5000)
+    ppct = synthetic.ppct_frame()
+    raw = synthetic.matrix_import_frame(n, yccd)
+    def run():
+        from src import matrix_import
+        matrix_import._CATALOGS.clear()  # tính cả lần dựng khoá của kho (lần nhập đầu tiên)
+        return import_matrix(raw, yccd, ppct)
+    return run
+
+def case_grade_responses(n: int) -> Callable[[], Any]:
+    # n học sinh, đề 40 câu (đủ 5 dạng), 2 mã đề
+    exam = synthetic.exam_questions(40)
+    variants = {"101": exam, "102": synthetic.exam_variant(exam)}
+    sheets = synthetic.answer_sheets(variants, n)
+    return lambda: grade_responses(sheets, compile_key(variants))
+
+# (tên case, tham số, danh sách cỡ, hàm chuẩn bị)
+CASES: List[Tuple[str, str, List[int], Callable[[int], Callable[[], Any]]]] = [
+    ("load_yccd", "rows", YCCD_SCALES, case_load_yccd),
+    ("find_periods", "rows", QUESTION_SCALES, case_find_periods),
+    ("match_periods", "rows", YCCD_SCALES, case_match_periods),
+    ("_extract_ppct_from_pdf_bytes", "pages", PDF_SCALES, case_extract_pdf),
+    ("compute_ratio_points", "rows", QUESTION_SCALES, case_compute_ratio_points),
+    ("validate_question", "questions", QUESTION_SCALES, case_validate_question),
+    ("export_exam_docx", "questions", QUESTION_SCALES, case_export_exam_docx),
+    ("export_matrix_xlsx", "rows", QUESTION_SCALES, case_export_matrix_xlsx),
+    ("import_matrix", "rows", QUESTION_SCALES, case_import_matrix),
+    ("grade_responses", "students", STUDENT_SCALES, case_grade_responses),
+]
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    fn()  # warm-up
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return {
+        "min_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "repeat": repeat,
+    }
+
+def run_cases(quick: bool = False, repeat: int = 5, only: str = "") -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, param, scales, setup in CASES:
+        if only and only not in name:
+            continue
+        for scale in (scales[:2] if quick else scales):
+            key = f"{name}[{param}={scale}]"
+            fn = setup(scale)
+            # case lớn: giảm số lần lặp để bộ benchmark vẫn chạy trong vài phút
+            r = measure(fn, repeat if scale == scales[0] else max(1, repeat // (scales.index(scale) + 1)))
+            results[key] = r
+            print(f"{key:<48} median {r['median_ms']:>10.2f} ms   min {r['min_ms']:>10.2f} ms", flush=True)
+    return results
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float = DEFAULT_TOLERANCE) -> List[Dict[str, Any]]:
+    """
+    Trả danh sách regression: case có median vượt baseline * tolerance (và vượt MIN_ABS_MS).
+    """
+    regressions = []
+    for key, r in results.items():
+        b = baseline.get(key)
+        if not b:
+            continue
+        cur, ref = r["median_ms"], b["median_ms"]
+        if cur > ref * tolerance and cur - ref > MIN_ABS_MS:
+            regressions.append({"case": key, "baseline_ms": ref, "current_ms": cur, "ratio": round(cur / ref, 2)})
+    return regressions
+
+def load_baseline(path: Path = BASELINE) -> Dict[str, Dict[str, float]]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8")).get("results", {})
+
+def report(results: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+def main(argv: List[str] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--quick", action="store_true", help="chỉ chạy 2 cỡ nhỏ nhất mỗi case")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--only", default="", help="lọc case theo tên (chuỗi con)")
+    ap.add_argument("--out", type=Path, help="ghi kết quả JSON ra file")
+    ap.add_argument("--baseline", type=Path, default=BASELINE)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    ap.add_argument("--budget", type=float, default=COLD_START_BUDGET_MS, help="ngân sách cold start (ms)")
+    args = ap.parse_args(argv)
+
+    results = run_cases(quick=args.quick, repeat=args.repeat, only=args.only)
+    budget_problems = []
+    if not args.only or args.only in "cold_start":
+        prof = profile_imports()
+        results["cold_start[import]"] = {"median_ms": prof["import_ms"], "min_ms": prof["import_ms"], "repeat": 1}
+        budget_problems = check_budget(prof, args.budget)
+        print(f"{'cold_start[import]':<48} {prof['import_ms']:>17.2f} ms   (ngân sách {args.budget} ms)")
+    out = report(results)
+
+    if args.update_baseline:
+        merged = {**load_baseline(args.baseline), **results}
+        args.baseline.write_text(json.dumps(report(merged), ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"Đã ghi baseline: {args.baseline}")
+        return 0
+
+    regressions = compare(results, load_baseline(args.baseline), args.tolerance)
+    out["regressions"] = regressions
+    out["budget_violations"] = budget_problems
+    if args.out:
+        args.out.write_text(json.dumps(out, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    if regressions:
+        print("\nREGRESSION so với baseline:")
+        for r in regressions:
+            print(f"  {r['case']}: {r['baseline_ms']} ms -> {r['current_ms']} ms (x{r['ratio']})")
+    for p in budget_problems:
+        print("VI PHẠM cold start:", p)
+    if regressions or budget_problems:
+        return 1
+    print("\nKhông có regression.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
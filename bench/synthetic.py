@@ -0,0 +1,289 @@
+\
+from __future__ import annotations
+import io
+import random
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from src.validators import QTYPE_MC, QTYPE_TF, QTYPE_MATCH, QTYPE_FILL, QTYPE_ESSAY
+
+SUBJECTS = ["Tiếng Việt", "Toán", "Lịch sử và Địa lí", "Khoa học", "Tin học", "Công nghệ"]
+# Tiêu đề môn đúng như trong K5.pdf (để regex tách section bắt được)
+PDF_SUBJECT_HEADERS = ["Môn TIẾNG VIỆT", "Môn TOÁN", "Môn LỊCH SỬ VÀ ĐỊA LÍ", "Môn KHOA HỌC", "Môn TIN HỌC", "Môn CÔNG NGHỆ"]
+LEVELS = ["M1 – Nhận biết", "M2 – Kết nối", "M3 – Vận dụng"]
+QTYPES = [QTYPE_MC, QTYPE_TF, QTYPE_MATCH, QTYPE_FILL, QTYPE_ESSAY]
+
+WORDS = ("đọc hiểu văn bản số thập phân phân số diện tích hình tam giác vận tốc thời gian "
+         "đất trồng sinh sản thực vật động vật năng lượng điện an toàn lịch sử địa lí "
+         "vùng miền dân cư máy tính thông tin sáng tạo sản phẩm công nghệ").split()
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+def _topics(rng: random.Random) -> Dict[tuple, str]:
+    return {(s, t): f"{t}. {_sentence(rng, 3).upper()}" for s in SUBJECTS for t in range(1, 9)}
+
+def _lesson_names(rng: random.Random) -> Dict[tuple, str]:
+    return {(s, b): _sentence(rng, 5).capitalize() for s in SUBJECTS for b in range(1, 71)}
+
+def yccd_frame(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Kho YCCĐ giả lập với phân bố lặp lại giống dữ liệu thật (ít môn/chủ đề/bài, YCCĐ dài).
+    """
+    rng = random.Random(seed)
+    # chủ đề/tên bài cố định theo (môn, bài) như kho thật
+    topics = _topics(rng)
+    names = _lesson_names(rng)
+    rows = []
+    for i in range(n_rows):
+        subj = SUBJECTS[i % len(SUBJECTS)]
+        bai = (i // len(SUBJECTS)) % 70 + 1
+        rows.append({
+            "Môn": subj,
+            "Chủ đề/Chủ điểm": topics[(subj, bai // 10 + 1)],
+            "Bài": str(bai),
+            "Tên bài học": names[(subj, bai)],
+            "Yêu cầu cần đạt": "- " + _sentence(rng, 25).capitalize() + ".",
+        })
+    return pd.DataFrame(rows)
+
+def yccd_csv_upload(n_rows: int, seed: int = 0) -> io.BytesIO:
+    """
+    CSV YCCĐ dạng file-like có `.name` (giống UploadedFile của Streamlit).
+    """
+    buf = io.BytesIO(yccd_frame(n_rows, seed).to_csv(index=False).encode("utf-8-sig"))
+    buf.name = f"synthetic_{n_rows}.csv"
+    return buf
+
+def ppct_frame(lessons_per_subject: int = 70) -> pd.DataFrame:
+    rows = []
+    for subj in SUBJECTS:
+        for n in range(1, lessons_per_subject + 1):
+            rows.append({"Mon": subj, "Bai_so": n, "Ten_bai_trich_xuat": "", "So_tiet": n % 4 + 1, "Nguon": "synthetic"})
+    return pd.DataFrame(rows)
+
+def ppct_frame_titled(seed: int = 0, offset: int = 100) -> pd.DataFrame:
+    """
+    PPCT có tên bài trùng tên bài của yccd_frame(seed) nhưng đánh số lệch `offset`
+    (số bài không bao giờ khớp -> mọi dòng phải tra gần đúng theo tên).
+    """
+    rng = random.Random(seed)
+    _topics(rng)  # giữ cùng chuỗi random với yccd_frame
+    names = _lesson_names(rng)
+    rows = [{"Mon": s, "Bai_so": b + offset, "Ten_bai_trich_xuat": f"{name} (Tiết 1) – Trang {b * 2}",
+             "So_tiet": b % 4 + 1, "Nguon": "synthetic"} for (s, b), name in names.items()]
+    return pd.DataFrame(rows)
+
+def matrix_rows(n_rows: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_rows):
+        bai = rng.randint(1, 80)
+        rows.append({
+            "id": f"r{i}",
+            "subject": SUBJECTS[i % len(SUBJECTS)],
+            "topic": "Chủ đề",
+            "lesson": f"Bài {bai}: {_sentence(rng, 4)}",
+            "yccd": _sentence(rng, 20),
+            "qtype": QTYPES[i % len(QTYPES)],
+            "level": LEVELS[i % len(LEVELS)],
+            "points": 0.5,
+            "n": 1,
+            "so_tiet": rng.randint(1, 4),
+            "block": 1 + (i % 2),
+            "ti_le": None,
+            "so_diem": None,
+        })
+    return rows
+
+def matrix_import_frame(n_rows: int, yccd: pd.DataFrame, seed: int = 0) -> pd.DataFrame:
+    """
+    File ma trận để nhập: phần lớn ghi nội dung YCCĐ (có dòng viết hoa / không dấu đầu dòng),
+    1/4 chỉ ghi mã YCCĐ, ~5% YCCĐ không có trong kho.
+    """
+    from src.matrix_import import yccd_ids
+
+    rng = random.Random(seed)
+    ids = yccd_ids(yccd)
+    rows = []
+    for i in range(n_rows):
+        j = rng.randrange(len(yccd))
+        r = yccd.iloc[j]
+        row = {"Môn": r["Môn"], "Bài": r["Bài"], "Yêu cầu cần đạt": r["Yêu cầu cần đạt"], "Mã YCCĐ": "",
+               "Dạng câu hỏi": QTYPES[i % len(QTYPES)], "Mức độ": f"M{i % 3 + 1}", "Số câu": str(1 + i % 3),
+               "Block": str(1 + i % 2)}
+        if i % 4 == 1:
+            row.update({"Bài": "", "Yêu cầu cần đạt": "", "Mã YCCĐ": ids.iat[j]})
+        elif i % 4 == 2:
+            row["Yêu cầu cần đạt"] = row["Yêu cầu cần đạt"].lstrip("- ").upper()
+        if i % 20 == 3:
+            row["Yêu cầu cần đạt"] = _sentence(rng, 12)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def question_content(qtype: str, rng: random.Random) -> Dict[str, Any]:
+    stem = _sentence(rng, 15).capitalize() + "?"
+    if qtype == QTYPE_MC:
+        return {"stem": stem, "options": {k: _sentence(rng, 4) for k in "ABCD"},
+                "correct_answer": rng.choice("ABCD"), "explanation": _sentence(rng, 8)}
+    if qtype == QTYPE_TF:
+        return {"stem": stem, "true_false": [{"statement": _sentence(rng, 8), "answer": bool(j % 2)} for j in range(4)],
+                "explanation": _sentence(rng, 8)}
+    if qtype == QTYPE_MATCH:
+        return {"stem": stem, "matching": {
+                    "left": [f"{j}) {_sentence(rng, 3)}" for j in range(1, 5)],
+                    "right": [f"{c}) {_sentence(rng, 3)}" for c in "ABCD"],
+                    "answer": {str(j): c for j, c in zip(range(1, 5), "BADC")}},
+                "explanation": _sentence(rng, 8)}
+    if qtype == QTYPE_FILL:
+        return {"stem": stem, "fill_blank": {"text": f"{_sentence(rng, 6)} ____ {_sentence(rng, 4)}.", "answer": rng.choice(WORDS)},
+                "explanation": _sentence(rng, 8)}
+    return {"stem": stem, "essay": {"prompt": _sentence(rng, 12), "rubric": [_sentence(rng, 5), _sentence(rng, 5)]},
+            "explanation": _sentence(rng, 8)}
+
+def exam_questions(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        qtype = QTYPES[i % len(QTYPES)]
+        out.append({
+            "qtype": qtype,
+            "level": LEVELS[i % len(LEVELS)],
+            "points": 0.5,
+            "subject": SUBJECTS[i % len(SUBJECTS)],
+            "topic": "Chủ đề",
+            "lesson": f"Bài {i % 70 + 1}",
+            "yccd": _sentence(rng, 20),
+            "content": question_content(qtype, rng),
+            "status": "OK",
+        })
+    return out
+
+def exam_variant(exam: List[Dict[str, Any]], seed: int = 1) -> List[Dict[str, Any]]:
+    """
+    Mã đề khác của cùng đề: đổi đáp án trắc nghiệm (như đảo phương án), giữ nguyên cấu trúc.
+    """
+    rng = random.Random(seed)
+    out = []
+    for q in exam:
+        q = dict(q, content=dict(q["content"]))
+        if q["qtype"] == QTYPE_MC:
+            q["content"]["correct_answer"] = rng.choice("ABCD")
+        out.append(q)
+    return out
+
+def answer_sheets(variants: Dict[str, List[Dict[str, Any]]], n_students: int, seed: int = 0,
+                  p_correct: float = 0.7, p_blank: float = 0.05) -> pd.DataFrame:
+    """
+    Bảng bài làm giả lập (1 dòng / học sinh, cột "Câu i") theo cách ghi của src.grading.
+    """
+    rng = random.Random(seed)
+    codes = list(variants)
+    n_q = len(variants[codes[0]])
+    rows = []
+    for s in range(n_students):
+        code = codes[s % len(codes)]
+        row = [f"HS{s + 1:05d}", code]
+        for q in variants[code]:
+            c = q["content"]
+            if rng.random() < p_blank:
+                row.append("")
+            elif q["qtype"] == QTYPE_MC:
+                row.append(c["correct_answer"] if rng.random() < p_correct else rng.choice("ABCD"))
+            elif q["qtype"] == QTYPE_TF:
+                row.append("".join("Đ" if (it["answer"] == (rng.random() < p_correct)) else "S"
+                                   for it in c["true_false"]))
+            elif q["qtype"] == QTYPE_MATCH:
+                row.append(" ".join(f"{j}{v if rng.random() < p_correct else rng.choice('ABCD')}"
+                                    for j, v in c["matching"]["answer"].items()))
+            elif q["qtype"] == QTYPE_FILL:
+                row.append(c["fill_blank"]["answer"] if rng.random() < p_correct else rng.choice(WORDS))
+            else:
+                row.append(str(rng.choice([0, 0.25, 0.5])))
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["Học sinh", "Mã đề"] + [f"Câu {i + 1}" for i in range(n_q)], dtype=str)
+
+# ---- PDF tối giản (không cần thư viện ngoài) ----
+
+def _pdf_escape(b: bytes) -> bytes:
+    return b.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+def ppct_pdf(pages: int, lines_per_page: int = 40, seed: int = 0) -> bytes:
+    """
+    PDF kế hoạch dạy học giả lập: các trang chia đều cho 6 môn, mỗi dòng 'Bài n: ... (k tiết)'.
+    Font Helvetica + bảng ToUnicode riêng để pypdf trích lại được chữ tiếng Việt.
+    """
+    rng = random.Random(seed)
+    page_lines: List[List[str]] = []
+    per_subject = max(1, pages // len(SUBJECTS))
+    lesson = 0
+    for p in range(pages):
+        s_idx = min(p // per_subject, len(SUBJECTS) - 1)
+        lines = []
+        if p % per_subject == 0 and p // per_subject < len(SUBJECTS):
+            lines.append(PDF_SUBJECT_HEADERS[s_idx])
+            lesson = 0
+        while len(lines) < lines_per_page:
+            lesson = lesson % 999 + 1  # regex PPCT chỉ bắt số bài tối đa 3 chữ số
+            lines.append(f"Bài {lesson}: {_sentence(rng, 5)} ({rng.randint(1, 4)} tiết)")
+        page_lines.append(lines)
+
+    # bảng mã 1 byte cho mọi ký tự xuất hiện
+    chars = sorted({ch for lines in page_lines for ln in lines for ch in ln})
+    if len(chars) > 254:
+        raise ValueError("Quá nhiều ký tự khác nhau cho font 1 byte.")
+    code = {ch: i + 1 for i, ch in enumerate(chars)}
+
+    def enc(text: str) -> bytes:
+        return bytes(code[ch] for ch in text)
+
+    bfchar = "\n".join(f"<{code[ch]:02X}> <{ord(ch):04X}>" for ch in chars)
+    cmap = (
+        "/CIDInit /ProcSet findresource begin 12 dict begin begincmap\n"
+        "/CMapName /Synthetic def /CMapType 2 def\n"
+        "1 begincodespacerange <01> <FF> endcodespacerange\n"
+        f"{len(chars)} beginbfchar\n{bfchar}\nendbfchar\n"
+        "endcmap CMapName currentdict /CMap defineresource pop end end\n"
+    ).encode("ascii")
+
+    objects: List[bytes] = []
+
+    def add(obj: bytes) -> int:
+        objects.append(obj)
+        return len(objects)
+
+    def stream(data: bytes) -> bytes:
+        return b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream"
+
+    catalog_id = add(b"")  # điền sau
+    pages_id = add(b"")
+    cmap_id = add(stream(cmap))
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /ToUnicode %d 0 R >>" % cmap_id)
+    page_ids = []
+    for lines in page_lines:
+        ops = [b"BT /F1 10 Tf 40 800 Td 12 TL"]
+        for ln in lines:
+            ops.append(b"(" + _pdf_escape(enc(ln)) + b") Tj T*")
+        ops.append(b"ET")
+        content_id = add(stream(b"\n".join(ops)))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font_id, content_id)
+        ))
+    objects[catalog_id - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + obj + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for off in offsets:
+        out.write(b"%010d 00000 n \n" % off)
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref))
+    return out.getvalue()
@@ -0,0 +1,84 @@
+\
+"""
+Đo tỉ lệ phản hồi AI hợp lệ (validate_question) trước/sau khi gửi responseSchema.
+
+Mặc định dùng mock server (bench.mock_gemini, không tốn quota): tỉ lệ lỗi của cả 2 chế độ là
+giả định của mock (--invalid-rate, --schema-invalid-rate), nên kết quả chỉ kiểm tra pipeline
+(vòng sửa lỗi, số lần gọi API), không chứng minh schema tốt hơn bao nhiêu. Số thật: chạy với
+--api-key (gọi API thật, tốn quota).
+
+    python -m bench.validity --n 200 --invalid-rate 0.2 --schema-invalid-rate 0.05
+    python -m bench.validity --n 50 --api-key $GEMINI_API_KEY --model gemini-2.0-flash
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+from typing import Any, Dict, List
+
+from bench.mock_gemini import start_mock
+from src.gemini import DEFAULT_BASE, GeminiError, generate_json
+from src.generation import LEVELS_TT27, QTYPES, SYSTEM_INSTRUCTION, build_prompt, make_question
+from src.validators import response_schema, validate_question
+
+def _blueprint(n: int) -> List[Dict[str, Any]]:
+    return [{
+        "subject": "Toán", "topic": "Số thập phân", "lesson": f"Bài {i % 30 + 1}",
+        "yccd": "Thực hiện được phép cộng, trừ số thập phân.",
+        "qtype": QTYPES[i % len(QTYPES)], "level": LEVELS_TT27[i % 3], "points": 0.5,
+    } for i in range(n)]
+
+def measure_validity(n: int = 200, invalid_rate: float = 0.2, schema_invalid_rate: float = 0.05, seed: int = 0,
+                     api_key: str = "", model: str = "gemini-2.0-flash", api_base: str = DEFAULT_BASE) -> Dict[str, Any]:
+    if api_key:
+        server, base, key = None, api_base, api_key
+    else:
+        server, base = start_mock(seed=seed, invalid_rate=invalid_rate, schema_invalid_rate=schema_invalid_rate)
+        key = "mock"
+    out = {"source": "api" if server is None else "mock"}
+    try:
+        for label, structured in [("without_schema", False), ("with_schema", True)]:
+            bp = _blueprint(n)
+            first_ok = 0
+            for meta in bp:
+                schema = response_schema(meta["qtype"]) if structured else None
+                try:
+                    obj = generate_json(build_prompt(meta), api_key=key, model=model, api_base=base,
+                                        system_instruction=SYSTEM_INSTRUCTION, response_schema=schema)
+                except GeminiError:
+                    continue  # JSON không đọc được cũng là phản hồi không hợp lệ
+                first_ok += validate_question(meta["qtype"], obj)[0]
+            # toàn pipeline (có vòng sửa lỗi): số lần gọi API và số câu rơi về mẫu tạm
+            before = server.state.requests if server else 0
+            final_ok = 0
+            for meta in bp:
+                final_ok += make_question(meta, key, model, base, 0.7, 1024, structured=structured)[1]
+            calls = server.state.requests - before if server else None
+            out[label] = {
+                "questions": n,
+                "first_response_valid_rate": round(first_ok / n, 4),
+                "final_valid_rate": round(final_ok / n, 4),
+                "calls_per_question": round(calls / n, 3) if calls is not None else None,
+            }
+    finally:
+        if server is not None:
+            server.shutdown()
+    return out
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=200)
+    ap.add_argument("--invalid-rate", type=float, default=0.2, help="tỉ lệ JSON sai cấu trúc của mock khi không có schema")
+    ap.add_argument("--schema-invalid-rate", type=float, default=0.05,
+                    help="tỉ lệ phản hồi đúng schema nhưng sai luật validator của mock khi có schema")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--api-key", default="", help="đo trên API thật thay vì mock (tốn quota)")
+    ap.add_argument("--model", default="gemini-2.0-flash")
+    ap.add_argument("--api-base", default=DEFAULT_BASE)
+    args = ap.parse_args(argv)
+    print(json.dumps(measure_validity(args.n, args.invalid_rate, args.schema_invalid_rate, args.seed,
+                                      args.api_key, args.model, args.api_base), ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+\
+"""
+Kho chương trình nhiều khối lớp, chia partition theo (khối, môn) trên đĩa:
+
+    data/catalog/manifest.json
+    data/catalog/yccd/grade=5/toan.csv
+    data/catalog/ppct/grade=5/toan.csv
+
+Chỉ manifest (nhỏ) được đọc lúc khởi động; partition chỉ load khi người dùng chọn.
+
+    python -m src.catalog build --grade 5 --yccd data/khoi5_normalized.csv --ppct data/ppct/ppct_k5_extracted.csv
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from .data import _key_col, load_yccd, normalize_yccd
+from .perf import timed
+
+CATALOG_DIR = Path(__file__).resolve().parents[1] / "data" / "catalog"
+MANIFEST = "manifest.json"
+PPCT_COLS = ["Mon", "Bai_so", "Ten_bai_trich_xuat", "So_tiet", "Nguon"]
+# nhiều phiên cùng tiến trình có thể ghi catalog: đọc-sửa-ghi manifest phải tuần tự
+_WRITE_LOCK = threading.Lock()
+
+def slugify(subject: str) -> str:
+    return "-".join(_key_col(subject).replace("/", " ").split())
+
+def load_manifest(root: Path = CATALOG_DIR) -> Dict[str, Any]:
+    """
+    Đọc manifest; trả manifest rỗng nếu chưa build catalog.
+    """
+    path = Path(root) / MANIFEST
+    if not path.exists():
+        return {"version": 1, "yccd": [], "ppct": []}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def grades(manifest: Dict[str, Any]) -> List[int]:
+    return sorted({int(e["grade"]) for e in manifest.get("yccd", [])})
+
+def subjects(manifest: Dict[str, Any], grade: int, kind: str = "yccd") -> List[str]:
+    return sorted(e["subject"] for e in manifest.get(kind, []) if int(e["grade"]) == int(grade))
+
+def _entries(manifest: Dict[str, Any], kind: str, grade: int, subject_list: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+    wanted = None if subject_list is None else set(subject_list)
+    return [e for e in manifest.get(kind, [])
+            if int(e["grade"]) == int(grade) and (wanted is None or e["subject"] in wanted)]
+
+@timed("load_yccd_partitions")
+def load_yccd_partitions(grade: int, subject_list: Optional[Sequence[str]] = None, root: Path = CATALOG_DIR,
+                         measure_memory: bool = False) -> pd.DataFrame:
+    """
+    Load YCCĐ của 1 khối, chỉ các môn được chọn (None = mọi môn của khối).
+    """
+    root = Path(root)
+    entries = _entries(load_manifest(root), "yccd", grade, subject_list)
+    if not entries:
+        raise FileNotFoundError(f"Catalog chưa có YCCĐ cho lớp {grade} ({', '.join(subject_list or []) or 'mọi môn'}).")
+    parts = [pd.read_csv(root / e["path"], encoding="utf-8-sig", dtype=str, keep_default_na=False) for e in entries]
+    return normalize_yccd(pd.concat(parts, ignore_index=True), measure_memory=measure_memory)
+
+@timed("load_ppct_partitions")
+def load_ppct_partitions(grade: int, subject_list: Optional[Sequence[str]] = None, root: Path = CATALOG_DIR) -> pd.DataFrame:
+    """
+    Load PPCT (số tiết theo bài) của 1 khối, chỉ các môn được chọn. Rỗng nếu catalog chưa có.
+    """
+    root = Path(root)
+    entries = _entries(load_manifest(root), "ppct", grade, subject_list)
+    if not entries:
+        return pd.DataFrame(columns=PPCT_COLS)
+    return pd.concat([pd.read_csv(root / e["path"], encoding="utf-8-sig") for e in entries], ignore_index=True)
+
+def _write_partitions(df: pd.DataFrame, kind: str, grade: int, subject_col: str, root: Path,
+                      manifest: Dict[str, Any]) -> None:
+    entries = [e for e in manifest.get(kind, []) if not (int(e["grade"]) == int(grade) and e["subject"] in set(df[subject_col]))]
+    for subj, part in df.groupby(subject_col, sort=True, observed=True):
+        rel = f"{kind}/grade={int(grade)}/{slugify(subj)}.csv"
+        out = root / rel
+        out.parent.mkdir(parents=True, exist_ok=True)
+        part.to_csv(out, index=False, encoding="utf-8-sig")
+        entries.append({"grade": int(grade), "subject": str(subj), "path": rel, "rows": int(len(part))})
+    manifest[kind] = sorted(entries, key=lambda e: (e["grade"], e["subject"]))
+
+def save_manifest(manifest: Dict[str, Any], root: Path = CATALOG_DIR) -> None:
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    # ghi file tạm rồi đổi tên: phiên đang đọc manifest không thấy file ghi dở
+    tmp = root / f"{MANIFEST}.tmp"
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp, root / MANIFEST)
+
+def save_ppct_partitions(ppct_df: pd.DataFrame, grade: int, root: Path = CATALOG_DIR) -> None:
+    """
+    Ghi PPCT (vd. vừa trích từ PDF upload) vào catalog của khối `grade`.
+    """
+    if ppct_df is None or len(ppct_df) == 0:
+        return
+    with _WRITE_LOCK:
+        manifest = load_manifest(root)
+        _write_partitions(ppct_df, "ppct", grade, "Mon", Path(root), manifest)
+        save_manifest(manifest, root)
+
+def build_catalog(grade: int, yccd_df: pd.DataFrame, ppct_df: Optional[pd.DataFrame] = None,
+                  root: Path = CATALOG_DIR) -> Dict[str, Any]:
+    """
+    Chia YCCĐ (+ PPCT) của 1 khối thành partition theo môn và cập nhật manifest
+    (giữ nguyên partition của các khối/môn khác).
+    """
+    root = Path(root)
+    yccd_plain = yccd_df.astype(str)
+    with _WRITE_LOCK:
+        manifest = load_manifest(root)
+        _write_partitions(yccd_plain, "yccd", grade, "Môn", root, manifest)
+        if ppct_df is not None and len(ppct_df) > 0:
+            _write_partitions(ppct_df, "ppct", grade, "Mon", root, manifest)
+        save_manifest(manifest, root)
+    return manifest
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="thêm/ghi đè partition của 1 khối từ file YCCĐ (+ PPCT)")
+    b.add_argument("--grade", type=int, required=True)
+    b.add_argument("--yccd", type=Path, required=True, help="CSV/XLSX YCCĐ của khối")
+    b.add_argument("--ppct", type=Path, help="CSV PPCT (Mon,Bai_so,Ten_bai_trich_xuat,So_tiet,Nguon)")
+    b.add_argument("--root", type=Path, default=CATALOG_DIR)
+    args = ap.parse_args(argv)
+
+    with args.yccd.open("rb") as f:
+        yccd_df = load_yccd(f)
+    ppct_df = pd.read_csv(args.ppct, encoding="utf-8-sig") if args.ppct else None
+    manifest = build_catalog(args.grade, yccd_df, ppct_df, args.root)
+    for kind in ("yccd", "ppct"):
+        n = sum(1 for e in manifest[kind] if e["grade"] == args.grade)
+        print(f"{kind}: {n} partition cho lớp {args.grade}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
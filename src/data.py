@@ -1,13 +1,18 @@
 \
 from __future__ import annotations
+import sys
 import pandas as pd
 from pathlib import Path
 
+from .perf import timed
+
 DEFAULT_CSV = Path(__file__).resolve().parents[1] / "data" / "khoi5_normalized.csv"
 DEFAULT_XLSX = Path(__file__).resolve().parents[1] / "data" / "khoi5_normalized.xlsx"
 
 # Chuẩn cột tối thiểu (sau khi chuẩn hoá tên cột)
 REQUIRED_COLS = ["Môn", "Chủ đề/Chủ điểm", "Bài", "Tên bài học", "Yêu cầu cần đạt"]
+# Cột lặp lại nhiều -> lưu dạng categorical (mã số nguyên + bảng giá trị)
+CATEGORICAL_COLS = ["Môn", "Chủ đề/Chủ điểm", "Bài", "Tên bài học"]
 
 # Các biến thể thường gặp -> chuẩn hoá
 COL_ALIASES = {
@@ -65,9 +70,11 @@ def _standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
     df = df.rename(columns=rename)
     return df
 
-def load_yccd(uploaded_file=None) -> pd.DataFrame:
+@timed("load_yccd")
+def load_yccd(uploaded_file=None, measure_memory: bool = False) -> pd.DataFrame:
     """
     Load kho YCCĐ lớp 5 (đã chuẩn hoá). Ưu tiên file upload (csv/xlsx), fallback về data/.
+    measure_memory: ghi df.attrs["memory"] = bộ nhớ trước/sau khi nén (tốn thêm 1 lượt duyệt).
     """
     if uploaded_file is not None:
         name = (uploaded_file.name or "").lower()
@@ -85,15 +92,54 @@ def load_yccd(uploaded_file=None) -> pd.DataFrame:
         else:
             raise FileNotFoundError("Không tìm thấy khoi5_normalized.csv/xlsx trong thư mục data/. Bạn có thể upload ở sidebar.")
 
+    return normalize_yccd(df, measure_memory=measure_memory)
+
+def normalize_yccd(df: pd.DataFrame, measure_memory: bool = False) -> pd.DataFrame:
+    """
+    Chuẩn hoá tên cột/kiểu dữ liệu, kiểm tra cột bắt buộc, bỏ dòng trống YCCĐ và nén bộ nhớ.
+    """
     df = _standardize_columns(df)
 
     # Chuẩn hoá kiểu dữ liệu, bỏ NaN
     for c in df.columns:
-        df[c] = df[c].astype(str).fillna("").str.strip()
+        df[c] = df[c].fillna("").astype(str).str.strip()
 
     missing = [c for c in REQUIRED_COLS if c not in df.columns]
     if missing:
         raise ValueError(f"Thiếu cột trong dữ liệu YCCĐ: {missing}. Cần có: {REQUIRED_COLS}. Cột hiện có: {list(df.columns)}")
 
-    df = df[df["Yêu cầu cần đạt"].astype(str).str.strip() != ""].copy()
+    df = df[df["Yêu cầu cần đạt"] != ""]
+    before = frame_memory(df) if measure_memory else None
+    df = _compact(df)
+    if measure_memory:
+        df.attrs["memory"] = {"before_bytes": before, "after_bytes": frame_memory(df)}
     return df
+
+def _compact(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Giảm bộ nhớ: cột lặp lại -> categorical, YCCĐ dài -> intern để các dòng trùng dùng chung 1 chuỗi.
+    """
+    out = {}
+    for c in df.columns:
+        if c in CATEGORICAL_COLS:
+            out[c] = df[c].astype("category")
+        elif c == "Yêu cầu cần đạt":
+            out[c] = df[c].map(sys.intern)
+        else:
+            out[c] = df[c]
+    return pd.DataFrame(out, index=df.index)
+
+def frame_memory(df: pd.DataFrame) -> int:
+    """
+    Số byte thực của DataFrame (kể cả nội dung chuỗi). Khác memory_usage(deep=True):
+    chuỗi dùng chung (intern) chỉ tính 1 lần.
+    """
+    total = int(df.index.memory_usage())
+    for c in df.columns:
+        col = df[c]
+        if col.dtype == object:
+            seen = {id(x): x for x in col.array}
+            total += col.array.nbytes + sum(sys.getsizeof(x) for x in seen.values())
+        else:
+            total += int(col.memory_usage(deep=True, index=False))
+    return total
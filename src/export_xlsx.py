@@ -0,0 +1,200 @@
+\
+"""
+Xuất ma trận + bản đặc tả ra XLSX bằng openpyxl write-only: từng dòng được ghi thẳng
+ra file tạm nên ma trận lớn (nhiều lớp, hàng chục nghìn dòng) không phải dựng cả
+workbook trong bộ nhớ. Nhiều ma trận -> nhiều sheet trong 1 workbook, ghi trong 1 lượt.
+
+    python -m src.export_xlsx ma_tran.xlsx lop5A.json lop5B.json   # mỗi file = session.json
+"""
+from __future__ import annotations
+import argparse
+import json
+import re
+from collections import Counter, defaultdict
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from .generation import LEVELS_TT27, QTYPES
+from .perf import timed
+from .ppct import _lesson_num_from_text, match_lessons, ppct_lookup, ppct_subject
+
+MATRIX_HEADER = ["STT", "Môn", "Chủ đề/Chủ điểm", "Bài", "Yêu cầu cần đạt", "Dạng câu hỏi", "Mức độ",
+                 "Số câu", "Điểm/câu", "Block", "Số tiết", "Số tiết (PPCT)", "Bài PPCT",
+                 "Tỉ lệ (%)", "Số điểm", "Tổng điểm dòng"]
+SUMMARY_HEADER = ["Ma trận", "Số dòng", "Số câu", "Tổng số tiết", "Tổng điểm"]
+
+Matrix = Tuple[str, Iterable[Dict[str, Any]]]
+
+def _sheet_title(name: str, used: set) -> str:
+    # Excel: tối đa 31 ký tự, không có []:*?/\ và không trùng tên
+    base = re.sub(r"[\[\]:*?/\\]", "-", str(name)).strip() or "Ma trận"
+    title, k = base[:31], 2
+    while title.lower() in used:
+        suffix = f" ({k})"
+        title, k = base[:31 - len(suffix)] + suffix, k + 1
+    used.add(title.lower())
+    return title
+
+def _num(x: Any) -> Optional[float]:
+    try:
+        return None if x in (None, "") else float(x)
+    except (TypeError, ValueError):
+        return None
+
+class _Spec:
+    """
+    Cộng dồn bản đặc tả theo block trong lúc ghi từng dòng (không giữ lại các dòng).
+    """
+    def __init__(self):
+        self.rows = Counter()
+        self.tiet = Counter()
+        self.ti_le = Counter()
+        self.diem = Counter()
+        self.levels: Dict[Any, Counter] = defaultdict(Counter)
+        self.qtypes: Dict[Any, Counter] = defaultdict(Counter)
+
+    def add(self, block: Any, n: int, so_tiet: int, ti_le: Optional[float], diem: float, level: str, qtype: str):
+        self.rows[block] += 1
+        self.tiet[block] += so_tiet
+        self.ti_le[block] += ti_le or 0.0
+        self.diem[block] += diem
+        self.levels[block][level] += n
+        self.qtypes[block][qtype] += n
+
+    def table(self) -> Tuple[List[str], List[List[Any]]]:
+        levels = LEVELS_TT27 + sorted({k for c in self.levels.values() for k in c} - set(LEVELS_TT27))
+        qtypes = QTYPES + sorted({k for c in self.qtypes.values() for k in c} - set(QTYPES))
+        header = ["Block", "Số dòng", "Số tiết", "Tỉ lệ (%)", "Số điểm"] + levels + qtypes + ["Tổng số câu"]
+        out = []
+        for b in sorted(self.rows, key=str):
+            out.append([b, self.rows[b], self.tiet[b], round(self.ti_le[b], 2), round(self.diem[b], 2)]
+                       + [self.levels[b][lv] for lv in levels] + [self.qtypes[b][qt] for qt in qtypes]
+                       + [sum(self.levels[b].values())])
+        total = ["Tổng", sum(self.rows.values()), sum(self.tiet.values()), None, round(sum(self.diem.values()), 2)]
+        total += [sum(self.levels[b][lv] for b in self.rows) for lv in levels]
+        total += [sum(self.qtypes[b][qt] for b in self.rows) for qt in qtypes]
+        total += [sum(sum(c.values()) for c in self.levels.values())]
+        out.append(total)
+        return header, out
+
+def _bold_row(ws, values: Sequence[Any]) -> list:
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    font = Font(bold=True)
+    cells = []
+    for v in values:
+        c = WriteOnlyCell(ws, value=v)
+        c.font = font
+        cells.append(c)
+    return cells
+
+def _write_matrix(ws, rows: Iterable[Dict[str, Any]], lookup: Dict[Tuple[str, int], Tuple[int, str]],
+                  ppct_df: Optional[pd.DataFrame]) -> List[Any]:
+    """
+    Ghi 1 ma trận vào sheet, trả tổng [số dòng, số câu, số tiết, điểm] cho sheet Tổng hợp.
+    """
+    if not isinstance(rows, Sequence):
+        # generator: phải đọc 2 lượt -> gom các dòng (dict) của ma trận này; workbook vẫn ghi write-only
+        rows = list(rows)
+
+    def exact(r: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+        bai = _lesson_num_from_text(r.get("lesson", ""))
+        return lookup.get((ppct_subject(r.get("subject", "")), bai)) if bai is not None else None
+
+    # lượt 1: chỉ gom (môn, bài) của các dòng trượt số bài, tra gần đúng theo tên bài trong 1 lượt
+    misses = {(r.get("subject", ""), r.get("lesson", "")): None for r in rows if exact(r) is None}
+    fuzzy: Dict[Tuple[str, str], Tuple[int, str]] = {}
+    if misses and ppct_df is not None and len(ppct_df) > 0:
+        keys = list(misses)
+        for key, (so_tiet_fz, title, _) in zip(keys, match_lessons(ppct_df, [k[0] for k in keys], [k[1] for k in keys])):
+            if so_tiet_fz is not None:
+                fuzzy[key] = (so_tiet_fz, title)
+
+    # lượt 2: ghi thẳng từng dòng
+    ws.append(_bold_row(ws, MATRIX_HEADER))
+    spec = _Spec()
+    stt = 0
+    for stt, r in enumerate(rows, 1):
+        n = int(r.get("n") or 1)
+        so_tiet = int(r.get("so_tiet") or 0)
+        bai = _lesson_num_from_text(r.get("lesson", ""))
+        hit = exact(r) or fuzzy.get((r.get("subject", ""), r.get("lesson", "")))
+        so_diem = _num(r.get("so_diem"))
+        # cùng quy tắc với blueprint ở Tab 2: mỗi câu lấy so_diem nếu đã tính, không thì points
+        per_q = so_diem if so_diem else (_num(r.get("points")) or 0.0)
+        ti_le = _num(r.get("ti_le"))
+        ws.append([stt, r.get("subject", ""), r.get("topic", ""), r.get("lesson", ""), r.get("yccd", ""),
+                   r.get("qtype", ""), r.get("level", ""), n, _num(r.get("points")), r.get("block", 1), so_tiet,
+                   hit[0] if hit else None, (hit[1] or f"Bài {bai}") if hit else "", ti_le, so_diem, round(per_q * n, 5)])
+        spec.add(r.get("block", 1), n, so_tiet, ti_le, per_q * n, r.get("level", ""), r.get("qtype", ""))
+
+    header, table = spec.table()
+    ws.append([])
+    ws.append(_bold_row(ws, ["BẢN ĐẶC TẢ (theo block)"]))
+    ws.append(_bold_row(ws, header))
+    for line in table:
+        ws.append(line)
+    total = table[-1]
+    return [stt, total[-1], total[2], total[4]]
+
+@timed("export_matrix_xlsx")
+def export_matrix_xlsx(matrices: Union[Sequence[Dict[str, Any]], Iterable[Matrix]],
+                       ppct_df: Optional[pd.DataFrame] = None, dest=None) -> Optional[bytes]:
+    """
+    Xuất 1 ma trận (list dòng matrix_rows) hoặc nhiều ma trận [(tên, dòng), ...] ra XLSX.
+    Dòng có thể là generator: khi đó các dòng của từng ma trận được gom vào bộ nhớ (để tra PPCT
+    gần đúng 1 lượt rồi mới ghi); chỉ phần workbook là ghi thẳng. Mỗi ma trận 1 sheet, kèm bản đặc tả ở cuối sheet;
+    nhiều ma trận thì thêm sheet "Tổng hợp". Số tiết PPCT được tra theo môn + số bài.
+    `dest`: đường dẫn / file object để ghi thẳng; None -> trả bytes.
+    """
+    # openpyxl chỉ import khi xuất lần đầu (giảm thời gian khởi động app)
+    from openpyxl import Workbook
+
+    if isinstance(matrices, list) and (not matrices or isinstance(matrices[0], dict)):
+        matrices = [("Ma trận", matrices)]
+    lookup = ppct_lookup(ppct_df)
+
+    wb = Workbook(write_only=True)
+    used = {"tổng hợp"}
+    summary = []
+    for name, rows in matrices:
+        ws = wb.create_sheet(_sheet_title(name, used))
+        summary.append([name] + _write_matrix(ws, rows, lookup, ppct_df))
+
+    if len(summary) > 1:
+        ws = wb.create_sheet("Tổng hợp", 0)
+        ws.append(_bold_row(ws, SUMMARY_HEADER))
+        for line in summary:
+            ws.append(line)
+
+    if dest is not None:
+        wb.save(dest)
+        return None
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("out", type=Path)
+    ap.add_argument("sessions", type=Path, nargs="+", help="session.json tải từ app (mỗi file = 1 ma trận)")
+    ap.add_argument("--ppct", type=Path, help="CSV PPCT (mặc định data/ppct/ppct_k5_extracted.csv)")
+    args = ap.parse_args(argv)
+
+    from .ppct import load_ppct
+    ppct_df = pd.read_csv(args.ppct, encoding="utf-8-sig") if args.ppct else load_ppct()
+
+    def matrices():
+        for path in args.sessions:
+            yield path.stem, json.loads(path.read_text(encoding="utf-8")).get("matrix_rows", [])
+
+    export_matrix_xlsx(matrices(), ppct_df, dest=args.out)
+    print(f"Đã ghi {args.out} ({len(args.sessions)} ma trận)")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,135 @@
+\
+"""
+Chỉ mục n-gram ký tự (TF-IDF, cosine) để tra gần đúng tên bài học.
+
+- Bỏ dấu tiếng Việt (fold) trước khi tách n-gram: "Hỗn số" ~ "hon so".
+- Inverted index: n-gram -> (mảng dòng, mảng trọng số) bằng NumPy; 1 truy vấn chỉ cộng
+  điểm trên các dòng có chung n-gram, không quét toàn bộ tiêu đề.
+"""
+from __future__ import annotations
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+NGRAM = 3
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+# dấu tiếng Việt sau NFD đều nằm trong khối Combining Diacritical Marks -> xoá bằng str.translate (nhanh hơn duyệt từng ký tự)
+_STRIP_MARKS = dict.fromkeys(range(0x0300, 0x0370))
+
+def fold(text: str) -> str:
+    """
+    Chữ thường, bỏ dấu (kể cả đ -> d), chỉ giữ chữ/số, gộp khoảng trắng.
+    """
+    s = unicodedata.normalize("NFD", str(text or "").lower().replace("đ", "d")).translate(_STRIP_MARKS)
+    return _NON_WORD.sub(" ", s).strip()
+
+def ngrams(text: str, n: int = NGRAM) -> Counter:
+    """
+    N-gram ký tự của từng từ (có đệm 2 đầu) + cặp từ liền nhau -> Counter.
+    Cặp từ giữ thứ tự, để "số thập phân" không trùng "phân số" chỉ vì chung các n-gram ký tự.
+    """
+    grams = Counter()
+    words = text.split()
+    for a, b in zip(words, words[1:]):
+        grams[f"{a}_{b}"] += 1
+    for word in words:
+        w = f" {word} "
+        if len(w) <= n:
+            grams[w] += 1
+            continue
+        for i in range(len(w) - n + 1):
+            grams[w[i:i + n]] += 1
+    return grams
+
+class TitleIndex:
+    """
+    Chỉ mục các tiêu đề (đã fold), có thể chia nhóm (vd. theo môn) để chỉ tra trong nhóm.
+    """
+    def __init__(self, titles: Sequence[str], groups: Optional[Sequence[str]] = None, n: int = NGRAM):
+        self.n = n
+        self.size = len(titles)
+        rows: Dict[str, List[int]] = defaultdict(list)
+        tfs: Dict[str, List[float]] = defaultdict(list)
+        for i, title in enumerate(titles):
+            for g, c in ngrams(fold(title), n).items():
+                rows[g].append(i)
+                tfs[g].append(1.0 + math.log(c))
+        self.idf = {g: math.log(1.0 + self.size / len(r)) for g, r in rows.items()}
+        self._unknown_idf = math.log(1.0 + self.size)
+
+        norms = np.zeros(self.size, dtype=np.float64)
+        for g, r in rows.items():
+            w = np.asarray(tfs[g]) * self.idf[g]
+            np.add.at(norms, r, w * w)
+        norms = np.sqrt(norms)
+        norms[norms == 0] = 1.0
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for g, r in rows.items():
+            idx = np.asarray(r, dtype=np.int32)
+            self.postings[g] = (idx, (np.asarray(tfs[g]) * self.idf[g] / norms[idx]).astype(np.float32))
+
+        self._groups: Dict[str, np.ndarray] = {}
+        if groups is not None:
+            by_group: Dict[str, List[int]] = defaultdict(list)
+            for i, grp in enumerate(groups):
+                by_group[str(grp)].append(i)
+            self._groups = {k: np.asarray(v, dtype=np.int32) for k, v in by_group.items()}
+
+    def scores(self, text: str) -> np.ndarray:
+        """
+        Cosine similarity của `text` với mọi tiêu đề (0..1).
+        """
+        out = np.zeros(self.size, dtype=np.float32)
+        q = ngrams(fold(text), self.n)
+        if not q:
+            return out
+        qnorm = 0.0
+        for g, c in q.items():
+            w = (1.0 + math.log(c)) * self.idf.get(g, self._unknown_idf)
+            qnorm += w * w
+            hit = self.postings.get(g)
+            if hit is not None:
+                # mỗi dòng chỉ xuất hiện 1 lần trong 1 posting -> cộng trực tiếp được
+                out[hit[0]] += w * hit[1]
+        out /= math.sqrt(qnorm)
+        return out
+
+    def query(self, text: str, k: int = 5, group: Optional[str] = None,
+              min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """
+        Top-k [(chỉ số dòng, điểm)] giảm dần; `group` giới hạn trong 1 nhóm.
+        """
+        s = self.scores(text)
+        cand = self._groups.get(str(group)) if group is not None else None
+        if group is not None and cand is None:
+            return []
+        if cand is not None:
+            s = s[cand]
+        k = min(k, len(s))
+        if k <= 0:
+            return []
+        top = np.argpartition(-s, k - 1)[:k]
+        top = top[np.argsort(-s[top], kind="stable")]
+        rows = cand[top] if cand is not None else top
+        return [(int(r), float(s[t])) for r, t in zip(rows, top) if s[t] > min_score]
+
+    def query_many(self, texts: Iterable[str], groups: Optional[Iterable[Optional[str]]] = None, k: int = 1,
+                   min_score: float = 0.0) -> List[List[Tuple[int, float]]]:
+        """
+        Tra hàng loạt; truy vấn trùng (cùng text + nhóm) chỉ tính 1 lần.
+        """
+        texts = list(texts)
+        groups = list(groups) if groups is not None else [None] * len(texts)
+        memo: Dict[Tuple[str, Optional[str]], List[Tuple[int, float]]] = {}
+        out = []
+        for text, grp in zip(texts, groups):
+            key = (fold(text), grp)
+            if key not in memo:
+                memo[key] = self.query(text, k=k, group=grp, min_score=min_score)
+            out.append(memo[key])
+        return out
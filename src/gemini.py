@@ -1,10 +1,17 @@
 \
 from __future__ import annotations
 import os
-import requests
+import contextvars
+import hashlib
 import json
 import re
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .perf import span
 
 DEFAULT_BASE = "https://generativelanguage.googleapis.com/v1beta"
 DEFAULT_MODEL = "gemini-2.0-flash"
@@ -25,6 +32,324 @@ def _extract_json(text: str) -> Dict[str, Any]:
             raise GeminiError("Không trích xuất được JSON từ phản hồi AI.")
         return json.loads(m.group(0))
 
+CACHE_TTL_SECONDS = 3600
+# cachedContents từ chối nội dung ngắn hơn ngưỡng token tối thiểu (tuỳ model, thấp nhất 1024):
+# ước tính trước (~4 ký tự/token) để khỏi tốn 1 request chắc chắn lỗi. Mock server dùng cùng giá trị.
+MIN_CACHE_TOKENS = 1024
+
+def cache_tokens(text: str) -> int:
+    """
+    Số token ước tính của nội dung gửi vào cachedContents (client và mock cùng cách tính).
+    """
+    return len(text) // 4
+
+def _system_part(text: str) -> Dict[str, Any]:
+    return {"parts": [{"text": text}]}
+
+class ContextCache:
+    """
+    Cache phần system instruction tĩnh qua Gemini context caching API (cachedContents).
+    Nếu API từ chối (vd. nội dung dưới ngưỡng token tối thiểu, model không hỗ trợ)
+    thì ghi nhớ và gửi system instruction trực tiếp trong request.
+    min_tokens: ngưỡng bỏ qua cache; bench hạ xuống (cùng ngưỡng với mock) để chạy được nhánh cache.
+    """
+    def __init__(self, ttl_seconds: int = CACHE_TTL_SECONDS, min_tokens: int = MIN_CACHE_TOKENS):
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Any] = {}   # key -> (name | None, hết hạn lúc)
+        self._creating: set = set()          # key đang gọi cachedContents
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, system_instruction: str, model: str, api_key: str, api_base: str) -> str:
+        raw = "\n".join([api_base, model, hashlib.sha256(api_key.encode()).hexdigest(), system_instruction])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def cacheable(self, system_instruction: str) -> bool:
+        """
+        False nếu hướng dẫn ngắn hơn ngưỡng: không bao giờ tạo cache, luôn gửi trực tiếp.
+        """
+        return cache_tokens(system_instruction) >= self.min_tokens
+
+    def _create(self, system_instruction: str, model: str, api_key: str, api_base: str) -> Optional[str]:
+        if not self.cacheable(system_instruction):
+            return None
+        import requests
+
+        url = f"{api_base.rstrip('/')}/cachedContents"
+        body = {
+            "model": f"models/{model}",
+            "systemInstruction": _system_part(system_instruction),
+            "ttl": f"{int(self.ttl_seconds)}s",
+        }
+        try:
+            r = requests.post(url, headers={"Content-Type": "application/json", "x-goog-api-key": api_key},
+                              json=body, timeout=30)
+        except Exception:
+            return None
+        if r.status_code >= 400:
+            return None
+        return (r.json() or {}).get("name")
+
+    def payload_fields(self, system_instruction: str, model: str, api_key: str, api_base: str) -> Dict[str, Any]:
+        """
+        Trả các field cần thêm vào payload generateContent:
+        {"cachedContent": name} nếu cache được, ngược lại {"systemInstruction": ...}.
+        """
+        key = self._key(system_instruction, model, api_key, api_base)
+        now = time.time()
+        create = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                name = entry[0]
+            else:
+                # luồng khác đang tạo: không chờ, lần này gửi trực tiếp
+                name = None
+                if key not in self._creating:
+                    self.misses += 1
+                    self._creating.add(key)
+                    create = True
+        if create:
+            # gọi mạng ngoài lock: không chặn các phiên / endpoint khác
+            try:
+                name = self._create(system_instruction, model, api_key, api_base)
+            finally:
+                with self._lock:
+                    self._creating.discard(key)
+                    # tạo lỗi: nhớ kết quả trong 1 TTL để không gọi lại mỗi câu
+                    self._entries[key] = (name, now + self.ttl_seconds * 0.9)
+        if name:
+            return {"cachedContent": name}
+        return {"systemInstruction": _system_part(system_instruction)}
+
+    def cached(self, system_instruction: str, model: str, api_key: str, api_base: str) -> bool:
+        """
+        True nếu hướng dẫn của endpoint này đang thực sự đi qua cachedContents (đã tạo được, còn hạn).
+        """
+        key = self._key(system_instruction, model, api_key, api_base)
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry is not None and bool(entry[0]) and entry[1] > time.time()
+
+# ---- Độ trễ theo endpoint, hedged request, chuyển sang model/key dự phòng ----
+REQUEST_TIMEOUT = 90
+STATS_WINDOW = 200            # số mẫu độ trễ giữ lại mỗi endpoint
+ERROR_WINDOW = 20             # số lần gọi gần nhất để tính tỉ lệ lỗi
+MIN_SAMPLES = 20              # chưa đủ mẫu thì dùng HEDGE_DEFAULT_DELAY
+HEDGE_PERCENTILE = 95
+HEDGE_DEFAULT_DELAY = 10.0
+HEDGE_MIN_DELAY = 0.2
+HEDGE_MAX_FACTOR = 4.0        # straggler chiếm >5% thì p95 chính là straggler -> chặn ở 4x p50
+DEGRADED_ERROR_RATE = 0.5     # >= 50% lỗi gần đây -> endpoint bị coi là suy giảm
+DEGRADED_SLOWDOWN = 3.0       # p50 chậm gấp 3 endpoint tốt nhất -> suy giảm
+MAX_PARALLEL_CALLS = 16
+
+class EndpointStats:
+    """
+    Độ trễ (chỉ lần gọi thành công) + kết quả gần đây của 1 endpoint (model + key + base).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: deque = deque(maxlen=STATS_WINDOW)
+        self.outcomes: deque = deque(maxlen=ERROR_WINDOW)
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, seconds: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            self.errors += 0 if ok else 1
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            xs = sorted(self.latencies)
+        if len(xs) < MIN_SAMPLES:
+            return None
+        return xs[min(len(xs) - 1, int(round(p / 100.0 * (len(xs) - 1))))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return (1.0 - sum(self.outcomes) / len(self.outcomes)) if self.outcomes else 0.0
+
+class LatencyStats:
+    """
+    Thống kê theo endpoint. STATS dùng chung tiến trình (gọi không qua router, bench);
+    app giữ 1 bản riêng cho mỗi phiên để bảng endpoint không lộ model/key/base của phiên khác.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._eps: Dict[str, EndpointStats] = {}
+
+    def get(self, key: str) -> EndpointStats:
+        with self._lock:
+            st = self._eps.get(key)
+            if st is None:
+                st = self._eps[key] = EndpointStats()
+            return st
+
+    def summary_rows(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._eps.items())
+        rows = []
+        for key, st in items:
+            p50, p95 = st.percentile(50), st.percentile(95)
+            rows.append({
+                "endpoint": key.split("|", 1)[1],
+                "calls": st.calls,
+                "errors": st.errors,
+                "recent_error_rate": round(st.error_rate(), 2),
+                "p50_ms": round(p50 * 1000) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            })
+        return rows
+
+STATS = LatencyStats()
+
+class Endpoint:
+    def __init__(self, model: str, api_key: str, api_base: str):
+        self.model = model
+        self.api_key = api_key
+        self.api_base = api_base
+
+    @property
+    def key(self) -> str:
+        # không để lộ API key: chỉ 4 ký tự cuối
+        return f"{self.api_base}|{self.model} …{self.api_key[-4:]}"
+
+class Router:
+    """
+    Chọn endpoint theo độ trễ / lỗi thực tế và gửi hedged request:
+    - endpoint chính đứng đầu trừ khi đang suy giảm (nhiều lỗi hoặc chậm hơn hẳn);
+    - nếu sau p95 độ trễ của endpoint đang chờ mà chưa có kết quả, bắn thêm 1 request
+      (sang endpoint dự phòng nếu có, không thì lặp lại endpoint đó) và lấy kết quả về trước;
+    - request lỗi -> chuyển ngay sang endpoint kế tiếp.
+    fallbacks: [(model, api_key)], để trống 1 vế = dùng model/key chính.
+    hedge mặc định tắt: mỗi lần hedge là thêm 1 request vào quota (free tier bị giới hạn request/phút).
+    """
+    def __init__(self, fallbacks: Sequence[Tuple[str, str]] = (), hedge: bool = False,
+                 hedge_percentile: float = HEDGE_PERCENTILE, stats: Optional[LatencyStats] = None):
+        self.fallbacks = list(fallbacks)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.stats = stats if stats is not None else STATS
+
+    def endpoints(self, model: str, api_key: str, api_base: str) -> List[Endpoint]:
+        eps, seen = [], set()
+        for m, k in [(model, api_key)] + self.fallbacks:
+            ep = Endpoint(m or model, k or api_key, api_base)
+            if ep.key not in seen:
+                seen.add(ep.key)
+                eps.append(ep)
+        return eps
+
+    def degraded(self, ep: Endpoint, eps: Sequence[Endpoint]) -> bool:
+        st = self.stats.get(ep.key)
+        if st.error_rate() >= DEGRADED_ERROR_RATE:
+            return True
+        mine = st.percentile(50)
+        others = [self.stats.get(e.key).percentile(50) for e in eps if e is not ep]
+        others = [x for x in others if x is not None]
+        return mine is not None and bool(others) and mine > DEGRADED_SLOWDOWN * min(others)
+
+    def plan(self, eps: Sequence[Endpoint]) -> List[Endpoint]:
+        """
+        Thứ tự thử: endpoint khoẻ trước (chính trước, dự phòng theo p50 tăng dần), suy giảm xếp cuối.
+        """
+        healthy = [e for e in eps if not self.degraded(e, eps)]
+        bad = [e for e in eps if e not in healthy]
+        def p50(e):
+            x = self.stats.get(e.key).percentile(50)
+            return float("inf") if x is None else x
+        if healthy and healthy[0] is eps[0]:
+            return [healthy[0]] + sorted(healthy[1:], key=p50) + bad
+        return sorted(healthy, key=p50) + bad
+
+    def hedge_delay(self, ep: Endpoint) -> float:
+        st = self.stats.get(ep.key)
+        p = st.percentile(self.hedge_percentile)
+        if p is None:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, min(p, HEDGE_MAX_FACTOR * st.percentile(50)))
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_CALLS, thread_name_prefix="gemini")
+        return _pool
+
+def _attempt(ep: Endpoint, payload: Dict[str, Any], stats: LatencyStats) -> Dict[str, Any]:
+    """
+    1 lần POST generateContent; ghi độ trễ/lỗi vào stats. Trả JSON phản hồi.
+    """
+    import requests
+
+    url = f"{ep.api_base.rstrip('/')}/models/{ep.model}:generateContent"
+    headers = {"Content-Type": "application/json", "x-goog-api-key": ep.api_key}
+    t0 = time.perf_counter()
+    try:
+        r = requests.post(url, headers=headers, json=payload, timeout=REQUEST_TIMEOUT)
+    except Exception as e:
+        stats.get(ep.key).record(time.perf_counter() - t0, False)
+        raise GeminiError(f"Lỗi kết nối Gemini API: {e}")
+    ok = r.status_code < 400
+    stats.get(ep.key).record(time.perf_counter() - t0, ok)
+    if not ok:
+        raise GeminiError(f"Lỗi gọi Gemini API ({r.status_code}): {r.text[:500]}")
+    return r.json()
+
+def _routed(router: Router, eps: List[Endpoint], build: Callable[[Endpoint], Dict[str, Any]]) -> Tuple[Dict[str, Any], Endpoint, bool]:
+    """
+    Chạy kế hoạch của router: trả (phản hồi, endpoint thắng, đã hedge chưa).
+    Request thua không huỷ được (requests chặn), nó chạy nốt ở nền và vẫn được ghi vào stats.
+    """
+    plan = router.plan(eps)
+    queue = list(plan)
+    pool = _executor()
+    pending = {}
+
+    def submit(ep: Endpoint):
+        ctx = contextvars.copy_context()
+        pending[pool.submit(ctx.run, _attempt, ep, build(ep), router.stats)] = ep
+
+    submit(queue.pop(0))
+    attempts, max_attempts = 1, len(plan) + 1
+    hedged = False
+    error: Optional[GeminiError] = None
+    while pending:
+        # chỉ hedge khi còn đúng 1 request đang chờ (tối đa len(plan) + 1 request cho 1 lần gọi)
+        can_hedge = router.hedge and len(pending) == 1 and attempts < max_attempts
+        # sau khi chuyển endpoint (request trước lỗi), hedge theo độ trễ của endpoint đang chờ
+        inflight = next(iter(pending.values()))
+        done, _ = wait(list(pending), timeout=router.hedge_delay(inflight) if can_hedge else None,
+                       return_when=FIRST_COMPLETED)
+        if not done:
+            # hedge sang endpoint dự phòng khoẻ kế tiếp, không có thì lặp lại endpoint đang chờ
+            target = queue.pop(0) if queue and not router.degraded(queue[0], plan) else inflight
+            submit(target)
+            attempts += 1
+            hedged = True
+            continue
+        for fut in done:
+            ep = pending.pop(fut)
+            try:
+                return fut.result(), ep, hedged
+            except GeminiError as e:
+                error = e
+        if not pending and queue and attempts < max_attempts:
+            submit(queue.pop(0))
+            attempts += 1
+    raise error or GeminiError("Không gọi được Gemini API.")
+
 def generate_json(
     prompt: str,
     api_key: str,
@@ -32,19 +357,46 @@ def generate_json(
     api_base: str = DEFAULT_BASE,
     temperature: float = 0.7,
     max_output_tokens: int = 1024,
+    system_instruction: Optional[str] = None,
+    cache: Optional[ContextCache] = None,
+    response_schema: Optional[Dict[str, Any]] = None,
+    router: Optional[Router] = None,
 ) -> Dict[str, Any]:
     """
     Gọi Gemini Developer API (AI Studio key) theo endpoint generateContent.
+    system_instruction: phần hướng dẫn tĩnh dùng chung; đi qua `cache` nếu có.
+    response_schema: structured output (responseSchema) để model trả đúng cấu trúc.
+    router: hedged request + model/key dự phòng (None = gọi 1 lần tới endpoint chính).
     """
     if not api_key:
         raise GeminiError("Thiếu GEMINI_API_KEY")
 
-    url = f"{api_base.rstrip('/')}/models/{model}:generateContent"
-    headers = {
-        "Content-Type": "application/json",
-        "x-goog-api-key": api_key,
-    }
+    def build(ep: Endpoint) -> Dict[str, Any]:
+        return _payload(prompt, ep, temperature, max_output_tokens, system_instruction, cache, response_schema)
 
+    primary = Endpoint(model, api_key, api_base)
+    with span("generate_json", model=model) as sp:
+        try:
+            if router is None:
+                data, winner, hedged = _attempt(primary, build(primary), STATS), primary, False
+            else:
+                data, winner, hedged = _routed(router, router.endpoints(model, api_key, api_base), build)
+        except GeminiError as e:
+            m = re.search(r"\((\d{3})\)", str(e))
+            sp["status"] = m.group(1) if m else "error"
+            raise
+        sp["status"] = "200"
+        sp["hedged"] = int(hedged)
+        sp["fallback"] = int(winner.key != primary.key)
+        usage = data.get("usageMetadata") or {}
+        sp["prompt_tokens"] = int(usage.get("promptTokenCount") or 0)
+        sp["response_tokens"] = int(usage.get("candidatesTokenCount") or 0)
+        sp["cached_tokens"] = int(usage.get("cachedContentTokenCount") or 0)
+    return _parse_response(data)
+
+def _payload(prompt: str, ep: Endpoint, temperature: float, max_output_tokens: int,
+             system_instruction: Optional[str], cache: Optional[ContextCache],
+             response_schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
     payload = {
         "contents": [{"role": "user", "parts": [{"text": prompt}]}],
         "generationConfig": {
@@ -53,12 +405,17 @@ def generate_json(
             "responseMimeType": "application/json",
         },
     }
+    if response_schema:
+        payload["generationConfig"]["responseSchema"] = response_schema
+    if system_instruction:
+        if cache is not None:
+            # cached content gắn với model + key -> mỗi endpoint có cache riêng
+            payload.update(cache.payload_fields(system_instruction, ep.model, ep.api_key, ep.api_base))
+        else:
+            payload["systemInstruction"] = _system_part(system_instruction)
+    return payload
 
-    r = requests.post(url, headers=headers, json=payload, timeout=90)
-    if r.status_code >= 400:
-        raise GeminiError(f"Lỗi gọi Gemini API ({r.status_code}): {r.text[:500]}")
-
-    data = r.json()
+def _parse_response(data: Dict[str, Any]) -> Dict[str, Any]:
     # Lấy text/json từ candidates
     try:
         parts = data["candidates"][0]["content"]["parts"]
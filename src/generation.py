@@ -0,0 +1,336 @@
+\
+from __future__ import annotations
+import json
+from string import Template
+from typing import Any, Dict, List, Optional, Tuple
+
+from .gemini import ContextCache, GeminiError, Router, generate_json
+from .validators import (
+    validate_question,
+    response_schema,
+    QTYPE_MC, QTYPE_TF, QTYPE_MATCH, QTYPE_FILL, QTYPE_ESSAY
+)
+
+LEVELS_TT27 = ["M1 – Nhận biết", "M2 – Kết nối", "M3 – Vận dụng"]
+# Map hiển thị -> nhãn gọn
+LEVEL_KEY = {"M1 – Nhận biết": "M1", "M2 – Kết nối": "M2", "M3 – Vận dụng": "M3"}
+
+QTYPES = [QTYPE_MC, QTYPE_TF, QTYPE_MATCH, QTYPE_FILL, QTYPE_ESSAY]
+
+# Mẫu JSON theo từng dạng (chỉ gửi mẫu của dạng đang hỏi)
+JSON_EXAMPLES = {
+    QTYPE_MC: """{
+  "stem": "...",
+  "options": {"A":"...","B":"...","C":"...","D":"..."},
+  "correct_answer": "A|B|C|D",
+  "explanation": "Giải thích ngắn gọn."
+}""",
+    QTYPE_TF: """{
+  "stem": "...",
+  "true_false": [{"statement":"...","answer":true},{"statement":"...","answer":false}],
+  "explanation": "Giải thích ngắn gọn."
+}""",
+    QTYPE_MATCH: """{
+  "stem": "Nối cột A với cột B cho phù hợp: ...",
+  "matching": {
+     "left": ["1) ...","2) ...","3) ...","4) ..."],
+     "right": ["A) ...","B) ...","C) ...","D) ..."],
+     "answer": {"1":"A","2":"B","3":"C","4":"D"}
+  },
+  "explanation": "Giải thích ngắn gọn."
+}""",
+    QTYPE_FILL: """{
+  "stem": "...",
+  "fill_blank": {"text":"... ____ ...", "answer":"..."},
+  "explanation": "Giải thích ngắn gọn."
+}""",
+    QTYPE_ESSAY: """{
+  "stem": "...",
+  "essay": {"prompt":"...", "rubric":["Ý 1 (x điểm)","Ý 2 (y điểm)"]},
+  "explanation": "Gợi ý/nhận xét ngắn."
+}""",
+}
+
+LEVEL_DESC = {
+    "M1": "Nhận biết: nhắc lại/mô tả/áp dụng trực tiếp trong tình huống quen thuộc.",
+    "M2": "Kết nối: kết nối/sắp xếp kiến thức để giải quyết vấn đề tương tự.",
+    "M3": "Vận dụng: vận dụng kiến thức vào tình huống mới/gần thực tế.",
+}
+
+# Phần tĩnh dùng chung cho mọi câu -> system instruction (đi qua context cache)
+SYSTEM_INSTRUCTION = f"""
+Bạn là giáo viên tiểu học ra câu hỏi kiểm tra định kì theo Chương trình GDPT 2018 và Thông tư 27.
+Trả về DUY NHẤT 1 JSON object (không markdown, không giải thích thêm ngoài JSON), đúng mẫu JSON của dạng câu hỏi được yêu cầu.
+
+Mức độ theo TT27:
+- M1 – {LEVEL_DESC["M1"]}
+- M2 – {LEVEL_DESC["M2"]}
+- M3 – {LEVEL_DESC["M3"]}
+
+Ràng buộc sư phạm:
+- Phù hợp học sinh đúng lớp được nêu, câu văn rõ, không mẹo, không mơ hồ.
+- Bám sát YCCĐ được nêu; độ khó đúng mức TT27 được nêu.
+- Nội dung tương xứng với điểm câu.
+""".strip()
+
+# Template user prompt biên dịch sẵn cho từng dạng (chỉ chứa mẫu JSON của dạng đó)
+PROMPT_TEMPLATES = {
+    qt: Template(
+        "Môn: $subject\n"
+        "Chủ đề: $topic\n"
+        "Bài: $lesson\n"
+        "Lớp: $grade\n"
+        "YCCĐ: $yccd\n"
+        f"Dạng: {qt}\n"
+        "Mức: $level ($level_key)\n"
+        "Điểm: $points\n\n"
+        "Mẫu JSON:\n" + example.replace("$", "$$")
+    )
+    for qt, example in JSON_EXAMPLES.items()
+}
+
+def row_meta(row: Dict[str, Any], grade: int) -> Dict[str, Any]:
+    """
+    Meta của 1 câu sinh từ 1 dòng ma trận (điểm/câu = so_diem nếu đã tính, không thì points).
+    """
+    pts = float(row.get("so_diem")) if row.get("so_diem") not in (None, "", 0) else float(row.get("points", 1))
+    return {
+        "subject": row["subject"],
+        "topic": row["topic"],
+        "lesson": row["lesson"],
+        "yccd": row["yccd"],
+        "qtype": row["qtype"],
+        "level": row["level"],
+        "points": pts,
+        "grade": grade,
+    }
+
+def build_blueprint(rows: List[Dict[str, Any]], grade: int) -> List[Dict[str, Any]]:
+    """
+    Danh sách meta từng câu theo ma trận (mỗi dòng lặp n lần).
+    """
+    return [row_meta(row, grade) for row in rows for _ in range(int(row["n"]))]
+
+def build_prompt(meta: Dict[str, Any]) -> str:
+    """
+    Prompt gọn theo dạng câu hỏi; phần hướng dẫn chung nằm ở SYSTEM_INSTRUCTION.
+    """
+    return PROMPT_TEMPLATES[meta["qtype"]].substitute(
+        subject=meta["subject"],
+        topic=meta["topic"],
+        lesson=meta["lesson"],
+        grade=meta.get("grade", 5),
+        yccd=meta["yccd"],
+        level=meta["level"],
+        level_key=LEVEL_KEY[meta["level"]],
+        points=meta["points"],
+    )
+
+def estimate_tokens(text: str) -> int:
+    """
+    Ước tính số token (~4 ký tự/token) để so sánh kích thước prompt khi chưa có usageMetadata.
+    """
+    return max(1, len(text) // 4)
+
+def prompt_token_report(blueprint: List[Dict[str, Any]], cached: bool = True) -> Dict[str, int]:
+    """
+    So sánh token đầu vào ước tính cho cả đề: prompt cũ (gửi schema 5 dạng mỗi câu)
+    với prompt gọn theo dạng (+ system instruction 1 lần nếu được cache, hoặc mỗi câu nếu không).
+    `cached`: hướng dẫn có thực sự đi qua cachedContents không (ContextCache.cached), không phải
+    chỉ là tuỳ chọn đang bật.
+    """
+    legacy = sum(estimate_tokens(build_legacy_prompt(m)) for m in blueprint)
+    system = estimate_tokens(SYSTEM_INSTRUCTION)
+    compact = sum(estimate_tokens(build_prompt(m)) for m in blueprint)
+    compact += system if cached and blueprint else system * len(blueprint)
+    return {
+        "questions": len(blueprint),
+        "legacy_tokens": legacy,
+        "compact_tokens": compact,
+        "saved_tokens": legacy - compact,
+        "saved_pct": round(100.0 * (legacy - compact) / legacy, 1) if legacy else 0.0,
+        "cached": bool(cached),
+    }
+
+def build_legacy_prompt(meta: Dict[str, Any]) -> str:
+    """
+    Prompt cũ (gửi schema cả 5 dạng + ràng buộc mỗi câu). Chỉ giữ để đo mức tiết kiệm token.
+    """
+    qtype = meta["qtype"]
+    level = meta["level"]
+    subject = meta["subject"]
+    topic = meta["topic"]
+    lesson = meta["lesson"]
+    yccd = meta["yccd"]
+    grade = meta.get("grade", 5)
+    pts = meta["points"]
+
+    level_desc = {
+        "M1": "Nhận biết: nhắc lại/mô tả/áp dụng trực tiếp trong tình huống quen thuộc.",
+        "M2": "Kết nối: kết nối/sắp xếp kiến thức để giải quyết vấn đề tương tự.",
+        "M3": "Vận dụng: vận dụng kiến thức vào tình huống mới/gần thực tế.",
+    }[LEVEL_KEY[level]]
+
+    schema = f"""
+Trả về DUY NHẤT 1 JSON object (không markdown, không giải thích thêm ngoài JSON), theo dạng {qtype}:
+
+- Với Trắc nghiệm nhiều lựa chọn:
+{{
+  "stem": "...",
+  "options": {{"A":"...","B":"...","C":"...","D":"..."}},
+  "correct_answer": "A|B|C|D",
+  "explanation": "Giải thích ngắn gọn."
+}}
+
+- Với Đúng/Sai:
+{{
+  "stem": "...",
+  "true_false": [{{"statement":"...","answer":true}},{{"statement":"...","answer":false}}],
+  "explanation": "Giải thích ngắn gọn."
+}}
+
+- Với Nối cột:
+{{
+  "stem": "Nối cột A với cột B cho phù hợp: ...",
+  "matching": {{
+     "left": ["1) ...","2) ...","3) ...","4) ..."],
+     "right": ["A) ...","B) ...","C) ...","D) ..."],
+     "answer": {{"1":"A","2":"B","3":"C","4":"D"}}
+  }},
+  "explanation": "Giải thích ngắn gọn."
+}}
+
+- Với Điền khuyết:
+{{
+  "stem": "...",
+  "fill_blank": {{"text":"... ____ ...", "answer":"..."}},
+  "explanation": "Giải thích ngắn gọn."
+}}
+
+- Với Tự luận:
+{{
+  "stem": "...",
+  "essay": {{"prompt":"...", "rubric":["Ý 1 (x điểm)","Ý 2 (y điểm)"]}},
+  "explanation": "Gợi ý/nhận xét ngắn."
+}}
+
+Ràng buộc sư phạm:
+- Phù hợp học sinh lớp {grade}, câu văn rõ, không mẹo, không mơ hồ.
+- Bám sát YCCĐ: {yccd}
+- Mức độ theo TT27: {level_desc}
+- Điểm câu: {pts} điểm.
+"""
+    user = f"""
+Môn: {subject}
+Chủ đề: {topic}
+Bài: {lesson}
+YCCĐ: {yccd}
+Dạng: {qtype}
+Mức: {level} ({LEVEL_KEY[level]})
+Điểm: {pts}
+
+{schema}
+"""
+    return user.strip()
+
+def offline_question(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fallback khi không có API key: tạo câu theo mẫu cấu trúc để test pipeline.
+    """
+    qtype = meta["qtype"]
+    level_short = LEVEL_KEY[meta["level"]]
+    yccd = meta["yccd"]
+
+    if qtype == QTYPE_MC:
+        return {
+            "stem": f"({level_short}) Chọn đáp án đúng: {yccd}",
+            "options": {"A": "Phương án A", "B": "Phương án B", "C": "Phương án C", "D": "Phương án D"},
+            "correct_answer": "A",
+            "explanation": "Giải thích ngắn gọn theo nội dung bài học."
+        }
+    if qtype == QTYPE_TF:
+        return {
+            "stem": f"({level_short}) Đánh dấu Đ/S theo yêu cầu: {yccd}",
+            "true_false": [{"statement": "Mệnh đề 1", "answer": True}, {"statement": "Mệnh đề 2", "answer": False}],
+            "explanation": "Giải thích ngắn gọn."
+        }
+    if qtype == QTYPE_MATCH:
+        return {
+            "stem": f"({level_short}) Nối cột A với cột B cho phù hợp: {yccd}",
+            "matching": {
+                "left": ["1) A1", "2) A2", "3) A3", "4) A4"],
+                "right": ["A) B1", "B) B2", "C) B3", "D) B4"],
+                "answer": {"1": "A", "2": "B", "3": "C", "4": "D"},
+            },
+            "explanation": "Giải thích ngắn gọn."
+        }
+    if qtype == QTYPE_FILL:
+        return {
+            "stem": f"({level_short}) Điền vào chỗ trống: {yccd}",
+            "fill_blank": {"text": "Nội dung ____ cần điền.", "answer": "đáp án"},
+            "explanation": "Giải thích ngắn gọn."
+        }
+    return {
+        "stem": f"({level_short}) Trả lời: {yccd}",
+        "essay": {"prompt": "Viết câu trả lời đầy đủ.", "rubric": ["Ý 1 (0,5–1 điểm)", "Ý 2 (0,5–1 điểm)"]},
+        "explanation": "Gợi ý chấm."
+    }
+
+# Số lần gửi lại JSON lỗi + thông báo validator để AI tự sửa (rẻ hơn tạo mới)
+MAX_REPAIRS = 2
+REPAIR_TEMPERATURE = 0.2
+
+def build_repair_prompt(meta: Dict[str, Any], bad_obj: Any, error: str) -> str:
+    """
+    Prompt sửa lỗi: gửi lại JSON chưa đạt + thông báo validator, chỉ yêu cầu sửa cấu trúc.
+    """
+    qtype = meta["qtype"]
+    bad = json.dumps(bad_obj, ensure_ascii=False)
+    return f"""
+JSON câu hỏi dạng {qtype} dưới đây chưa đạt kiểm tra: {error}
+Hãy sửa lại cho đúng cấu trúc, giữ nguyên nội dung đã đúng và vẫn bám YCCĐ: {meta["yccd"]}
+Trả về DUY NHẤT 1 JSON object (không markdown) theo mẫu:
+{JSON_EXAMPLES[qtype]}
+
+JSON cần sửa:
+{bad}
+""".strip()
+
+def make_question(meta: Dict[str, Any], api_key: str, model: str, api_base: str, temperature: float, max_tokens: int,
+                  max_repairs: int = MAX_REPAIRS, cache: Optional[ContextCache] = None,
+                  structured: bool = True, router: Optional[Router] = None) -> Tuple[Dict[str, Any], bool, str]:
+    """
+    Sinh 1 câu theo meta. Nếu AI trả sai cấu trúc: gửi prompt sửa lỗi (tối đa max_repairs lần)
+    trước khi rơi về mẫu offline. Trả (obj, ok, msg).
+    structured: gửi kèm responseSchema của dạng câu hỏi (structured output).
+    router: hedged request + model/key dự phòng (xem src.gemini.Router).
+    """
+    prompt = build_prompt(meta)
+    schema = response_schema(meta["qtype"]) if structured else None
+    if api_key:
+        obj = generate_json(prompt, api_key=api_key, model=model, api_base=api_base,
+                           temperature=temperature, max_output_tokens=max_tokens,
+                           system_instruction=SYSTEM_INSTRUCTION, cache=cache, response_schema=schema,
+                           router=router)
+    else:
+        obj = offline_question(meta)
+
+    ok, msg = validate_question(meta["qtype"], obj)
+    repairs = 0
+    while not ok and api_key and repairs < max_repairs:
+        repairs += 1
+        try:
+            obj = generate_json(build_repair_prompt(meta, obj, msg), api_key=api_key, model=model, api_base=api_base,
+                                temperature=REPAIR_TEMPERATURE, max_output_tokens=max_tokens,
+                                system_instruction=SYSTEM_INSTRUCTION, cache=cache, response_schema=schema,
+                                router=router)
+        except GeminiError:
+            break
+        ok, msg = validate_question(meta["qtype"], obj)
+    if not ok:
+        # nếu AI trả sai cấu trúc -> fallback offline để không "kẹt"
+        obj = offline_question(meta)
+        return obj, False, f"AI trả chưa đạt ({msg}). Dùng mẫu tạm để test."
+    if repairs:
+        return obj, True, f"OK (đã sửa {repairs} lần)"
+    return obj, True, "OK"
@@ -0,0 +1,388 @@
+\
+"""
+Chấm hàng loạt bài làm của học sinh theo đáp án của đề (st.session_state.exam hoặc session.json).
+
+- compile_key(): đề -> ma trận đáp án NumPy. Mỗi câu tách thành các "ô" chấm tự động:
+  trắc nghiệm 1 ô, Đúng/Sai 1 ô / mệnh đề, nối cột 1 ô / cặp, điền khuyết 1 ô. Điểm của câu
+  (`points`) chia đều cho các ô (Đ/S, nối cột được điểm từng phần). Tự luận không chấm tự động:
+  cột của câu tự luận là điểm giáo viên đã chấm.
+- Nhiều mã đề: truyền {mã đề: đề}; các mã đề phải cùng cấu trúc (cùng dạng câu, cùng số mệnh đề
+  / số cặp theo thứ tự câu), chỉ khác đáp án (đảo phương án), và mỗi mã đề phải có mã (không trống).
+  Học sinh chọn đáp án theo cột "Mã đề"; thiếu / sai mã đề thì không chấm, ghi chú.
+- grade_responses(): mỗi câu 1 cột "Câu i"; mỗi giá trị khác nhau chỉ phân tích 1 lần
+  (pd.factorize), chấm cả lớp / cả khối bằng 1 phép so sánh (N học sinh x S ô) với đáp án của
+  mã đề tương ứng, rồi nhân ma trận với trọng số -> điểm từng câu, tổng điểm, thống kê từng câu.
+
+Cách ghi bài làm: trắc nghiệm "B" (ghi nhiều chữ như "A, C" -> 0 điểm + ghi chú); Đúng/Sai "ĐSĐS" (hoặc "Đ, S, Đ, S", D/S, 1/0);
+nối cột "1B 2A 3D 4C" hoặc "BADC"; điền khuyết ghi đúng từ cần điền; tự luận ghi điểm (vd. 1,5).
+
+    python -m src.grading session.json bai_lam.xlsx --out ket_qua.xlsx
+"""
+from __future__ import annotations
+import argparse
+import json
+import re
+import unicodedata
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .data import _key_col
+from .perf import timed
+from .validators import QTYPE_MC, QTYPE_TF, QTYPE_MATCH, QTYPE_FILL, QTYPE_ESSAY
+
+MISSING = -1  # ô bỏ trống / không đọc được
+NO_KEY = -2   # đề thiếu đáp án ở ô này: không bài làm nào khớp
+MULTIPLE = -3  # trắc nghiệm chọn nhiều phương án (vd. "A, C"): tính sai, ghi chú
+
+STUDENT_ALIASES = {"hoc sinh", "ho ten", "ho va ten", "ten", "ten hoc sinh", "sbd", "so bao danh",
+                   "ma hs", "ma hoc sinh", "hs", "student"}
+VARIANT_ALIASES = {"ma de", "de", "ma de thi", "variant"}
+_QUESTION_COL = re.compile(r"^(?:cau|c|q|question)?\s*(\d{1,3})$")
+
+_TF_WORDS = re.compile(r"ĐÚNG|DUNG|ĐUNG|TRUE|SAI|FALSE")
+_TF_CODE = {"Đ": 1, "D": 1, "T": 1, "1": 1, "S": 0, "F": 0, "0": 0}
+_PAIR = re.compile(r"(\d+)\s*[-–:=>.)]*\s*([A-Z])")
+_NUMBER = re.compile(r"^-?\d+(?:[.,]\d+)?$")
+
+Exams = Union[Sequence[Dict[str, Any]], Dict[str, Sequence[Dict[str, Any]]]]
+
+def _letter(v: Any) -> int:
+    m = re.search(r"[A-Z]", str(v or "").upper())
+    return ord(m.group()) - ord("A") if m else MISSING
+
+def _mc_choice(v: str) -> int:
+    # bài làm trắc nghiệm: nhiều chữ cái khác nhau -> MULTIPLE (không tự lấy chữ đầu)
+    letters = set(re.findall(r"[A-Z]", v.upper()))
+    if len(letters) > 1:
+        return MULTIPLE
+    return ord(letters.pop()) - ord("A") if letters else MISSING
+
+def _norm_text(v: Any) -> str:
+    """
+    Chuẩn hoá câu trả lời điền khuyết: NFC, chữ thường, gộp khoảng trắng, bỏ dấu câu ở cuối;
+    số "0,5" = "0.5". Giữ dấu tiếng Việt (khác dấu là khác từ).
+    """
+    s = " ".join(unicodedata.normalize("NFC", str(v or "")).lower().split()).rstrip(".;!")
+    if _NUMBER.match(s):
+        return str(float(s.replace(",", ".")))
+    return s
+
+def _match_lefts(mt: Dict[str, Any]) -> List[int]:
+    # khoá "1".."n" của mapping, theo thứ tự số
+    nums = [int(m.group()) for m in (re.search(r"\d+", str(k)) for k in (mt.get("answer") or {})) if m]
+    return sorted(set(nums))
+
+def _question_slots(q: Dict[str, Any]) -> Tuple[List[int], List[int], str]:
+    """
+    (số thứ tự bên trái của từng ô, mã đáp án từng ô, đáp án dạng ghi trên phiếu) của 1 câu.
+    """
+    content = q.get("content") or {}
+    qtype = q.get("qtype")
+    if qtype == QTYPE_MC:
+        code = _letter(content.get("correct_answer"))
+        return [0], [code], chr(ord("A") + code) if code >= 0 else ""
+    if qtype == QTYPE_TF:
+        marks = [bool(it.get("answer")) for it in content.get("true_false") or []]
+        return list(range(len(marks))), [int(m) for m in marks], "".join("Đ" if m else "S" for m in marks)
+    if qtype == QTYPE_MATCH:
+        mt = content.get("matching") or {}
+        answer = {int(m.group()): v for k, v in (mt.get("answer") or {}).items() if (m := re.search(r"\d+", str(k)))}
+        lefts = _match_lefts(mt)
+        codes = [_letter(answer.get(j)) for j in lefts]
+        return lefts, codes, " ".join(f"{j}{chr(ord('A') + c)}" for j, c in zip(lefts, codes) if c >= 0)
+    if qtype == QTYPE_FILL:
+        text = str((content.get("fill_blank") or {}).get("answer") or "").strip()
+        return [0], [1], text
+    return [], [], ""
+
+class AnswerKey:
+    """
+    Đáp án đã biên dịch của 1 đề (1 hoặc nhiều mã đề cùng cấu trúc).
+
+    keys: (số mã đề, số ô) mã đáp án; weights: điểm từng ô; slot_q: câu của từng ô;
+    fill_texts[v][s]: đáp án điền khuyết đã chuẩn hoá (ô điền khuyết có mã đáp án = 1).
+    """
+    def __init__(self, questions: List[Dict[str, Any]], codes: List[str], keys: np.ndarray, weights: np.ndarray,
+                 slot_q: np.ndarray, lefts: List[List[int]], fill_texts: List[Dict[int, str]],
+                 answers: List[List[str]]):
+        self.questions = questions
+        self.codes = codes
+        self.keys = keys
+        self.weights = weights
+        self.slot_q = slot_q
+        self.lefts = lefts
+        self.fill_texts = fill_texts
+        self.answers = answers
+        self.starts = np.searchsorted(slot_q, np.arange(len(questions)))
+        # (ô, câu) = 1 nếu ô thuộc câu: điểm từng câu = điểm từng ô @ indicator
+        self.indicator = np.zeros((len(slot_q), len(questions)))
+        self.indicator[np.arange(len(slot_q)), slot_q] = 1.0
+
+    @property
+    def n_questions(self) -> int:
+        return len(self.questions)
+
+    @property
+    def max_points(self) -> float:
+        return float(sum(q["points"] for q in self.questions))
+
+    def variant_index(self, codes: pd.Series) -> np.ndarray:
+        """
+        Cột "Mã đề" -> chỉ số mã đề (-1 nếu không có trong đáp án). 1 mã đề thì ai cũng là 0.
+        """
+        if len(self.codes) == 1:
+            return np.zeros(len(codes), dtype=np.intp)
+        lookup = {c: i for i, c in enumerate(self.codes)}
+        uniq_codes, uniq = pd.factorize(codes.fillna("").astype(str).str.strip().str.upper())
+        return np.array([lookup.get(u, -1) for u in uniq] + [-1], dtype=np.intp)[uniq_codes]
+
+def compile_key(exams: Exams) -> AnswerKey:
+    """
+    Đề (list câu như st.session_state.exam) hoặc {mã đề: đề} -> AnswerKey.
+    ValueError nếu các mã đề khác cấu trúc.
+    """
+    variants = dict(exams) if isinstance(exams, dict) else {"": list(exams)}
+    if not any(variants.values()):
+        raise ValueError("Chưa có đề để chấm.")
+    codes = [str(c).strip().upper() for c in variants]
+    if len(codes) > 1 and "" in codes:
+        # mã đề trống khớp với ô "Mã đề" bỏ trống -> học sinh quên ghi mã đề bị chấm nhầm đề
+        raise ValueError("Có nhiều mã đề: mỗi mã đề (kể cả đề hiện tại) phải có mã, không để trống.")
+    if len(set(codes)) < len(codes):
+        raise ValueError(f"Mã đề bị trùng: {', '.join(sorted({c for c in codes if codes.count(c) > 1}))}.")
+    layouts, questions = None, []
+    rows, lefts_ref, fill_texts, answers = [], None, [], []
+    for code, exam in zip(codes, variants.values()):
+        parsed = [_question_slots(q) for q in exam]
+        layout = [(q.get("qtype"), len(p[0])) for q, p in zip(exam, parsed)]
+        if layouts is None:
+            layouts, lefts_ref = layout, [p[0] for p in parsed]
+            questions = [{"qtype": q.get("qtype"), "points": float(q.get("points") or 0),
+                          "slots": len(p[0])} for q, p in zip(exam, parsed)]
+        elif layout != layouts:
+            raise ValueError(f"Mã đề {code or '(mặc định)'} khác cấu trúc (dạng câu / số ô) với mã đề {codes[0]}.")
+        row, fills, slot = [], {}, 0
+        for q, (_, keys, shown) in zip(exam, parsed):
+            if q.get("qtype") == QTYPE_FILL:
+                fills[slot] = _norm_text(shown)
+            row += [k if k >= 0 else NO_KEY for k in keys]
+            slot += len(keys)
+        rows.append(row)
+        fill_texts.append(fills)
+        answers.append([p[2] for p in parsed])
+    slot_q = np.array([i for i, q in enumerate(questions) for _ in range(q["slots"])], dtype=np.intp)
+    weights = np.array([q["points"] / q["slots"] for q in questions for _ in range(q["slots"])])
+    keys = np.array(rows, dtype=np.int16).reshape(len(codes), len(slot_q))
+    return AnswerKey(questions, codes, keys, weights, slot_q, lefts_ref, fill_texts, answers)
+
+def load_key(session: Dict[str, Any]) -> AnswerKey:
+    """
+    session.json tải từ app: {"exam": [...]}; có thêm "variants": {mã đề: [...]} thì chấm theo mã đề.
+    """
+    return compile_key(session.get("variants") or session.get("exam") or [])
+
+# ---- phân tích bài làm (mỗi giá trị khác nhau 1 lần) ----
+
+def _parse_tf(v: str, n: int) -> List[int]:
+    s = _TF_WORDS.sub(lambda m: "S" if m.group()[0] in "SF" else "D", v.upper())
+    marks = [_TF_CODE[c] for c in s if c in _TF_CODE][:n]
+    return marks + [MISSING] * (n - len(marks))
+
+def _parse_match(v: str, lefts: List[int]) -> List[int]:
+    s = v.upper()
+    pairs = _PAIR.findall(s)
+    if pairs:
+        chosen = {int(j): ord(c) - ord("A") for j, c in pairs}
+        return [chosen.get(j, MISSING) for j in lefts]
+    letters = [ord(c) - ord("A") for c in re.sub(r"[^A-Z]", "", s)][:len(lefts)]
+    return letters + [MISSING] * (len(lefts) - len(letters))
+
+def _parse_column(values: pd.Series, qtype: str, lefts: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cột bài làm của 1 câu -> (mã từng ô (N, số ô), chỉ số giá trị trong `uniq`) ; điền khuyết trả
+    văn bản đã chuẩn hoá để so với đáp án của từng mã đề.
+    """
+    codes, uniq = pd.factorize(values.fillna("").astype(str).str.strip())
+    n = len(lefts)
+    if qtype == QTYPE_MC:
+        parsed = [[_mc_choice(u)] for u in uniq]
+    elif qtype == QTYPE_TF:
+        parsed = [_parse_tf(u, n) for u in uniq]
+    elif qtype == QTYPE_MATCH:
+        parsed = [_parse_match(u, lefts) for u in uniq]
+    else:
+        return np.array([_norm_text(u) for u in uniq], dtype=object), codes
+    table = np.array(parsed, dtype=np.int16).reshape(len(uniq), n)
+    return table, codes
+
+def read_responses(uploaded_file) -> pd.DataFrame:
+    """
+    Đọc bảng bài làm CSV/XLSX (file upload hoặc đường dẫn), mọi ô dạng chuỗi; XLSX lấy sheet đầu.
+    """
+    name = str(getattr(uploaded_file, "name", uploaded_file) or "").lower()
+    if name.endswith(".csv"):
+        return pd.read_csv(uploaded_file, encoding="utf-8-sig", dtype=str)
+    if name.endswith(".xlsx"):
+        return pd.read_excel(uploaded_file, sheet_name=0, dtype=str)
+    raise ValueError("Chỉ hỗ trợ .csv hoặc .xlsx")
+
+def _columns(df: pd.DataFrame) -> Tuple[Optional[str], Optional[str], Dict[int, str]]:
+    student = variant = None
+    questions: Dict[int, str] = {}
+    for c in df.columns:
+        k = _key_col(str(c))
+        m = _QUESTION_COL.match(k)
+        if m:
+            questions.setdefault(int(m.group(1)), c)
+        elif variant is None and k in VARIANT_ALIASES:
+            variant = c
+        elif student is None and k in STUDENT_ALIASES:
+            student = c
+    if student is None:
+        student = next((c for c in df.columns if c != variant and c not in questions.values()), None)
+    return student, variant, questions
+
+@timed("grade_responses")
+def grade_responses(responses: pd.DataFrame, key: AnswerKey) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Chấm bảng bài làm (1 dòng / học sinh) -> (điểm từng học sinh, thống kê từng câu).
+    Học sinh có mã đề không có trong đáp án: không chấm, ghi chú ở cột "Ghi chú". Ô bị chấm khác
+    với giá trị ghi trong bảng (trắc nghiệm chọn nhiều phương án -> 0 điểm; điểm tự luận ngoài
+    0..điểm câu -> kẹp lại) cũng được ghi chú.
+    """
+    student_col, variant_col, qcols = _columns(responses)
+    n, n_slots = len(responses), len(key.slot_q)
+    if not qcols:
+        raise ValueError('Không thấy cột câu hỏi (cần các cột "Câu 1", "Câu 2", ...).')
+    variant = key.variant_index(responses[variant_col]) if variant_col is not None \
+        else np.zeros(n, dtype=np.intp) if len(key.codes) == 1 else np.full(n, -1, dtype=np.intp)
+    valid = variant >= 0
+    vidx = np.where(valid, variant, 0)
+
+    notes = pd.Series("", index=range(n), dtype=object)
+    given = np.full((n, n_slots), MISSING, dtype=np.int16)
+    essay = np.zeros((n, key.n_questions))
+    essay_blank = np.zeros((n, key.n_questions), dtype=bool)
+    for i, q in enumerate(key.questions):
+        col = qcols.get(i + 1)
+        if col is None:
+            continue
+        if q["qtype"] == QTYPE_ESSAY or q["slots"] == 0:
+            pts = pd.to_numeric(responses[col].astype(str).str.replace(",", ".").str.strip(), errors="coerce")
+            raw = pts.fillna(0).to_numpy(dtype=float)
+            essay[:, i] = np.clip(raw, 0, q["points"])
+            essay_blank[:, i] = pts.isna().to_numpy()
+            clipped = raw != essay[:, i]
+            if clipped.any():
+                notes[clipped] += [f"Câu {i + 1}: điểm tự luận {x:g} ngoài 0–{q['points']:g}, tính {y:g}. "
+                                   for x, y in zip(raw[clipped], essay[clipped, i])]
+            continue
+        s0 = key.starts[i]
+        table, codes = _parse_column(responses[col], q["qtype"], key.lefts[i])
+        if q["qtype"] == QTYPE_FILL:
+            texts = table[codes]
+            wanted = np.array([key.fill_texts[v][s0] for v in range(len(key.codes))], dtype=object)[vidx]
+            given[:, s0] = np.where(texts == "", MISSING, (texts == wanted).astype(np.int16))
+        else:
+            given[:, s0:s0 + q["slots"]] = table[codes]
+            if q["qtype"] == QTYPE_MC:
+                multi = given[:, s0] == MULTIPLE
+                if multi.any():
+                    notes[multi] += [f"Câu {i + 1}: chọn nhiều phương án ({str(v).strip()}), không tính điểm. "
+                                     for v in responses[col].to_numpy()[multi]]
+
+    correct = given == key.keys[vidx]                        # (N, S)
+    per_q = (correct * key.weights) @ key.indicator + essay  # (N, Q)
+    per_q[~valid] = np.nan
+    totals = per_q.sum(axis=1)
+
+    qnames = [f"Câu {i + 1}" for i in range(key.n_questions)]
+    students = pd.DataFrame(np.round(per_q, 2), columns=qnames)
+    students.insert(0, "Học sinh", responses[student_col].to_numpy() if student_col is not None
+                    else np.arange(1, n + 1))
+    if variant_col is not None:
+        students.insert(1, "Mã đề", responses[variant_col].to_numpy())
+    students["Tổng điểm"] = np.round(totals, 2)
+    notes[~valid] = "Mã đề không có trong đáp án"
+    no_code = (responses[variant_col].fillna("").astype(str).str.strip() == "").to_numpy() \
+        if variant_col is not None else np.ones(n, dtype=bool)
+    notes[~valid & no_code] = "Thiếu mã đề (có nhiều mã đề)"
+    students["Ghi chú"] = notes.str.strip().to_numpy()
+    return students, _question_stats(key, per_q[valid], given[valid], essay_blank[valid], qcols)
+
+def _question_stats(key: AnswerKey, per_q: np.ndarray, given: np.ndarray, essay_blank: np.ndarray,
+                    qcols: Dict[int, str]) -> pd.DataFrame:
+    maxp = np.array([q["points"] for q in key.questions])
+    n = max(len(per_q), 1)
+    blank_slots = (given == MISSING) @ key.indicator
+    slots = np.array([q["slots"] for q in key.questions])
+    blank = ((blank_slots >= slots) & (slots > 0)) | essay_blank
+    # độ phân biệt: tương quan điểm câu với tổng điểm các câu còn lại
+    rest = per_q.sum(axis=1, keepdims=True) - per_q
+    xc, rc = per_q - per_q.mean(axis=0), rest - rest.mean(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        disc = (xc * rc).sum(axis=0) / np.sqrt((xc ** 2).sum(axis=0) * (rc ** 2).sum(axis=0))
+    stats = pd.DataFrame({
+        "Câu": [f"Câu {i + 1}" for i in range(key.n_questions)],
+        "Dạng": [q["qtype"] for q in key.questions],
+        "Điểm tối đa": maxp,
+        "Điểm TB": np.round(per_q.mean(axis=0), 3) if len(per_q) else np.nan,
+        "Đạt tối đa (%)": np.round((per_q >= maxp - 1e-9).sum(axis=0) / n * 100, 1),
+        "Bỏ trống (%)": np.round(blank.sum(axis=0) / n * 100, 1),
+        "Độ phân biệt": np.round(disc, 2),
+        "Phương án chọn": [_choice_spread(key, i, given) for i in range(key.n_questions)],
+    })
+    stats.loc[[i + 1 not in qcols for i in range(key.n_questions)], "Dạng"] += " (không có cột)"
+    return stats
+
+def _choice_spread(key: AnswerKey, i: int, given: np.ndarray) -> str:
+    # tỉ lệ chọn từng phương án của câu trắc nghiệm (chỉ khi 1 mã đề: mã đề khác đảo phương án)
+    if key.questions[i]["qtype"] != QTYPE_MC or len(key.codes) != 1 or not len(given):
+        return ""
+    picks = given[:, key.starts[i]]
+    counts = np.bincount(picks[picks >= 0], minlength=4)
+    return " • ".join(f"{chr(ord('A') + c)} {counts[c] / len(picks) * 100:.0f}%" for c in range(len(counts)))
+
+def response_template(key: AnswerKey) -> bytes:
+    """
+    Phiếu bài làm mẫu (CSV, UTF-8 BOM): mỗi mã đề 1 dòng ghi đúng đáp án theo cách ghi được chấp nhận.
+    """
+    rows = []
+    for code, answers in zip(key.codes, key.answers):
+        cells = [a if q["qtype"] != QTYPE_ESSAY else q["points"] for q, a in zip(key.questions, answers)]
+        rows.append([f"Đáp án {code}".strip(), code] + cells)
+    cols = ["Học sinh", "Mã đề"] + [f"Câu {i + 1}" for i in range(key.n_questions)]
+    return pd.DataFrame(rows, columns=cols).to_csv(index=False).encode("utf-8-sig")
+
+def results_xlsx(students: pd.DataFrame, stats: pd.DataFrame) -> bytes:
+    """
+    Kết quả chấm: sheet "Điểm" (từng học sinh) + sheet "Thống kê" (từng câu).
+    """
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as xw:
+        students.to_excel(xw, sheet_name="Điểm", index=False)
+        stats.to_excel(xw, sheet_name="Thống kê", index=False)
+    return buf.getvalue()
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("session", type=Path, help="session.json tải từ app")
+    ap.add_argument("responses", type=Path, help="bảng bài làm CSV/XLSX")
+    ap.add_argument("--out", type=Path, help="ghi kết quả XLSX (điểm + thống kê)")
+    args = ap.parse_args(argv)
+
+    key = load_key(json.loads(args.session.read_text(encoding="utf-8")))
+    students, stats = grade_responses(read_responses(args.responses), key)
+    print(stats.to_string(index=False))
+    print(f"\n{len(students)} học sinh • điểm TB {students['Tổng điểm'].mean():.2f} / {key.max_points:g}")
+    if args.out:
+        args.out.write_bytes(results_xlsx(students, stats))
+        print(f"Đã ghi {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,298 @@
+\
+"""
+Hàng đợi job sinh đề chạy nền (ngoài thread của script Streamlit).
+
+- 1 JobManager cho cả tiến trình (st.cache_resource); job gắn với session_id của phiên.
+- Mỗi job xử lý lần lượt các câu của blueprint; kết quả từng câu được ghi ngay ra
+  logs/jobs/<session_id>/<job_id>.jsonl (append-only) nên huỷ / tiến trình khởi động lại
+  vẫn giữ được phần đã sinh và có thể chạy tiếp (resume).
+- Không ghi API key ra đĩa: khi resume, UI truyền lại cấu hình AI hiện tại.
+- session_id phải đúng định dạng của src.sessions (không dùng giá trị tuỳ ý làm đường dẫn);
+  thư mục của phiên không có job mới quá JOB_TTL_DAYS ngày bị xoá (lúc khởi tạo + mỗi giờ).
+"""
+from __future__ import annotations
+import contextvars
+import json
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from .generation import make_question
+from .sessions import valid_session_id
+
+JOBS_DIR = Path(__file__).resolve().parents[1] / "logs" / "jobs"
+MAX_WORKERS = 2
+JOB_TTL_DAYS = 7
+PRUNE_EVERY = 3600
+
+QUEUED, RUNNING, DONE, CANCELLED, FAILED, INTERRUPTED = "queued", "running", "done", "cancelled", "error", "interrupted"
+ACTIVE = (QUEUED, RUNNING)
+
+KIND_GENERATE = "generate"      # sinh cả đề -> thay exam
+KIND_REGENERATE = "regenerate"  # sinh lại 1 số câu -> ghi đè đúng vị trí trong exam
+
+def exam_item(meta: Dict[str, Any], qobj: Dict[str, Any], ok: bool, msg: str) -> Dict[str, Any]:
+    """
+    1 câu trong st.session_state.exam.
+    """
+    return {
+        "qtype": meta["qtype"],
+        "level": meta["level"],
+        "points": meta["points"],
+        "subject": meta["subject"],
+        "topic": meta["topic"],
+        "lesson": meta["lesson"],
+        "yccd": meta["yccd"],
+        "grade": meta.get("grade", 5),
+        "content": qobj,
+        "ok": ok,
+        "status": msg,
+    }
+
+class Job:
+    def __init__(self, session_id: str, kind: str, blueprint: List[Dict[str, Any]],
+                 targets: Optional[List[int]] = None, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex[:10]
+        self.session_id = session_id
+        self.kind = kind
+        self.blueprint = blueprint
+        # vị trí (đánh số từ 1) trong exam mà câu thứ i của blueprint sẽ ghi đè (chỉ với regenerate)
+        self.targets = targets or list(range(1, len(blueprint) + 1))
+        self.results: List[Optional[Dict[str, Any]]] = [None] * len(blueprint)
+        self.status = QUEUED
+        self.error = ""
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.applied = False
+        self.cancel_event = threading.Event()
+
+    @property
+    def total(self) -> int:
+        return len(self.blueprint)
+
+    @property
+    def done(self) -> int:
+        return sum(1 for r in self.results if r is not None)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE
+
+    @property
+    def resumable(self) -> bool:
+        return self.status in (CANCELLED, FAILED, INTERRUPTED) and self.done < self.total
+
+    def completed_items(self) -> List[tuple]:
+        """
+        [(vị trí trong exam, câu)] của các câu đã sinh xong.
+        """
+        return [(t, r) for t, r in zip(self.targets, self.results) if r is not None]
+
+class JobManager:
+    """
+    Quản lý job của mọi phiên trong tiến trình. Thread-safe.
+    """
+    def __init__(self, root: Path = JOBS_DIR, max_workers: int = MAX_WORKERS):
+        self.root = Path(root)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gen-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._pruned = 0.0
+        self._maybe_prune()
+
+    # ---- lưu trữ ----
+    def _session_dir(self, session_id: str) -> Path:
+        if not valid_session_id(session_id):
+            raise ValueError(f"session_id không hợp lệ: {session_id!r}")
+        return self.root / session_id
+
+    def _path(self, job: Job) -> Path:
+        return self._session_dir(job.session_id) / f"{job.id}.jsonl"
+
+    def prune(self, max_age_days: float = JOB_TTL_DAYS) -> int:
+        """
+        Xoá thư mục job của các phiên không có gì mới quá max_age_days ngày (bỏ qua phiên còn job
+        đang chạy). Trả số thư mục đã xoá.
+        """
+        cutoff = time.time() - max_age_days * 86400
+        with self._lock:
+            busy = {j.session_id for j in self._jobs.values() if j.active}
+        removed = 0
+        try:
+            folders = [p for p in self.root.iterdir() if p.is_dir() and not p.is_symlink()]
+        except OSError:
+            return 0
+        for folder in folders:
+            if folder.name in busy:
+                continue
+            try:
+                newest = max([folder.stat().st_mtime] + [f.stat().st_mtime for f in folder.iterdir()])
+            except OSError:
+                continue
+            if newest < cutoff:
+                shutil.rmtree(folder, ignore_errors=True)
+                with self._lock:
+                    for job_id in [k for k, j in self._jobs.items() if j.session_id == folder.name]:
+                        del self._jobs[job_id]
+                removed += 1
+        return removed
+
+    def _maybe_prune(self) -> None:
+        now = time.time()
+        if now - self._pruned >= PRUNE_EVERY:
+            self._pruned = now
+            self.prune()
+
+    def _append(self, job: Job, event: Dict[str, Any]) -> None:
+        path = self._path(job)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        except OSError:
+            # không ghi được ra đĩa thì job vẫn chạy trong bộ nhớ
+            pass
+
+    def _set_status(self, job: Job, status: str, error: str = "") -> None:
+        job.status, job.error = status, error
+        if status not in ACTIVE:
+            job.finished = time.time()
+        self._append(job, {"event": "status", "status": status, "error": error})
+
+    def _load(self, path: Path) -> Optional[Job]:
+        job = None
+        try:
+            lines = path.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            return None
+        for line in lines:
+            try:
+                ev = json.loads(line)
+            except ValueError:
+                continue  # dòng cuối bị cắt dở khi tiến trình dừng đột ngột
+            if ev.get("event") == "job":
+                job = Job(ev["session_id"], ev["kind"], ev["blueprint"], ev.get("targets"), job_id=ev["id"])
+                job.created = ev.get("created", job.created)
+            elif job is None:
+                continue
+            elif ev.get("event") == "item":
+                job.results[int(ev["i"])] = ev["item"]
+            elif ev.get("event") == "status":
+                job.status, job.error = ev["status"], ev.get("error", "")
+            elif ev.get("event") == "applied":
+                job.applied = True
+        if job is not None and job.status in ACTIVE:
+            # job đang chạy dở khi tiến trình trước dừng
+            job.status = INTERRUPTED
+        return job
+
+    # ---- API ----
+    def submit(self, session_id: str, kind: str, blueprint: List[Dict[str, Any]], settings: Dict[str, Any],
+               targets: Optional[Sequence[int]] = None) -> Job:
+        """
+        Tạo job và đưa vào hàng đợi. `settings` là tham số của make_question
+        (api_key, model, api_base, temperature, max_tokens, cache, router), thêm "pregen"
+        (tuỳ chọn): hàm meta -> câu đã sinh trước hoặc None. ValueError nếu session_id sai định dạng.
+        """
+        self._session_dir(session_id)
+        self._maybe_prune()
+        job = Job(session_id, kind, list(blueprint), list(targets) if targets is not None else None)
+        self._append(job, {"event": "job", "id": job.id, "session_id": session_id, "kind": kind,
+                           "blueprint": job.blueprint, "targets": job.targets, "created": job.created})
+        with self._lock:
+            self._jobs[job.id] = job
+        self._start(job, settings)
+        return job
+
+    def resume(self, job_id: str, settings: Dict[str, Any]) -> Optional[Job]:
+        """
+        Chạy tiếp các câu chưa sinh của job đã huỷ / lỗi / bị ngắt.
+        """
+        job = self.get(job_id)
+        if job is None or not job.resumable:
+            return job
+        job.cancel_event = threading.Event()
+        job.finished = None
+        job.applied = False
+        self._set_status(job, QUEUED)
+        self._start(job, settings)
+        return job
+
+    def cancel(self, job_id: str) -> None:
+        job = self.get(job_id)
+        if job is not None and job.active:
+            # worker kiểm tra cờ giữa 2 câu; câu đang gọi API sẽ chạy nốt
+            job.cancel_event.set()
+
+    def mark_applied(self, job: Job) -> None:
+        job.applied = True
+        self._append(job, {"event": "applied"})
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def session_jobs(self, session_id: str) -> List[Job]:
+        """
+        Các job của phiên (mới nhất trước), gồm cả job còn trên đĩa từ lần chạy trước.
+        """
+        if not valid_session_id(session_id):
+            return []
+        folder = self._session_dir(session_id)
+        if folder.is_dir():
+            for path in folder.glob("*.jsonl"):
+                with self._lock:
+                    known = path.stem in self._jobs
+                if not known:
+                    job = self._load(path)
+                    if job is not None:
+                        with self._lock:
+                            self._jobs.setdefault(job.id, job)
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if j.session_id == session_id]
+        return sorted(jobs, key=lambda j: j.created, reverse=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel_event.set()
+        self._executor.shutdown(wait=True)
+
+    # ---- worker ----
+    def _start(self, job: Job, settings: Dict[str, Any]) -> None:
+        # chạy trong bản sao context của phiên gọi -> span perf vẫn ghi vào recorder của phiên
+        ctx = contextvars.copy_context()
+        self._executor.submit(ctx.run, self._run, job, dict(settings))
+
+    def _run(self, job: Job, settings: Dict[str, Any]) -> None:
+        if job.cancel_event.is_set():
+            self._set_status(job, CANCELLED)
+            return
+        self._set_status(job, RUNNING)
+        try:
+            for i, meta in enumerate(job.blueprint):
+                if job.results[i] is not None:
+                    continue
+                if job.cancel_event.is_set():
+                    self._set_status(job, CANCELLED)
+                    return
+                # câu đã sinh trước (src.pregen) nếu có, không thì gọi API
+                pregen = settings.get("pregen")
+                hit = pregen(meta) if pregen is not None else None
+                qobj, ok, msg = hit if hit is not None else make_question(
+                    meta, settings.get("api_key", ""), settings.get("model", ""), settings.get("api_base", ""),
+                    settings.get("temperature", 0.7), settings.get("max_tokens", 1024), cache=settings.get("cache"),
+                    router=settings.get("router"),
+                )
+                item = exam_item(meta, qobj, ok, msg)
+                job.results[i] = item
+                self._append(job, {"event": "item", "i": i, "item": item})
+        except Exception as e:
+            self._set_status(job, FAILED, str(e))
+            return
+        self._set_status(job, DONE)
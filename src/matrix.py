@@ -0,0 +1,45 @@
+\
+from __future__ import annotations
+from typing import Any, Dict, List
+
+def compute_ratio_points(rows: List[Dict[str, Any]], mode: str, block1_points: float, block2_points: float):
+    """
+    mode:
+      - "Toàn đề (10 điểm)"
+      - "2 block (2,5 / 7,5)"
+    Yêu cầu: rows có 'so_tiet' (int) và (nếu 2 block) có 'block' = 1/2.
+    Ghi vào rows: 'ti_le', 'so_diem'
+    """
+    # reset
+    for r in rows:
+        r["ti_le"] = None
+        r["so_diem"] = None
+
+    if mode == "Toàn đề (10 điểm)":
+        total = sum(int(r.get("so_tiet") or 0) for r in rows)
+        if total <= 0:
+            return rows, "Tổng số tiết = 0. Hãy điền Số tiết trước."
+        for r in rows:
+            stt = int(r.get("so_tiet") or 0)
+            r["ti_le"] = round(stt * 100.0 / total, 4)
+            r["so_diem"] = round(r["ti_le"] * 10.0 / 100.0, 5)
+        return rows, "OK"
+    else:
+        # 2 blocks
+        b1 = [r for r in rows if int(r.get("block") or 1) == 1]
+        b2 = [r for r in rows if int(r.get("block") or 1) == 2]
+        t1 = sum(int(r.get("so_tiet") or 0) for r in b1)
+        t2 = sum(int(r.get("so_tiet") or 0) for r in b2)
+        if (t1 <= 0 and len(b1)>0) or (t2 <= 0 and len(b2)>0):
+            return rows, "Thiếu Số tiết trong một block. Hãy điền/auto-fill trước."
+        if len(b1)>0 and t1>0:
+            for r in b1:
+                stt = int(r.get("so_tiet") or 0)
+                r["ti_le"] = round(stt * 100.0 / t1, 4)
+                r["so_diem"] = round(r["ti_le"] * float(block1_points) / 100.0, 5)
+        if len(b2)>0 and t2>0:
+            for r in b2:
+                stt = int(r.get("so_tiet") or 0)
+                r["ti_le"] = round(stt * 100.0 / t2, 4)
+                r["so_diem"] = round(r["ti_le"] * float(block2_points) / 100.0, 5)
+        return rows, "OK"
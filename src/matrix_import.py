@@ -0,0 +1,338 @@
+\
+"""
+Nhập cả ma trận từ CSV/XLSX thay vì thêm từng dòng ở Tab 1.
+
+Cột (tên cột linh hoạt, có/không dấu): Môn, Bài, Yêu cầu cần đạt hoặc Mã YCCĐ, Dạng câu hỏi,
+Mức độ, Số câu, Block; tuỳ chọn Chủ đề, Điểm, Số tiết. File XLSX xuất từ app (sheet "Ma trận") cũng đọc được.
+
+- Mọi dòng được khớp với kho YCCĐ bằng merge của pandas (theo mã, hoặc theo môn + [chủ đề] +
+  bài + nội dung YCCĐ đã bỏ dấu), rồi với PPCT (môn + số bài) để điền số tiết; chỉ các dòng không
+  khớp số bài mới qua match_periods (tra gần đúng theo tên bài).
+- Số bài không duy nhất (vd. TV đánh lại từ Bài 1 mỗi học kì): khoá khớp nhiều dòng kho thì
+  không đoán mà báo để ghi thêm Chủ đề / dùng mã; số bài trùng trong PPCT thì tra theo tên bài.
+- Dòng không khớp không bị bỏ im lặng: trả về bảng báo cáo (dòng trong file + lý do + gợi ý).
+
+Mã YCCĐ = "<môn>:<chủ đề>:<bài>:<thứ tự YCCĐ trong bài>", vd. "tv:the-gioi-tuoi-tho:1:2";
+bài không có số (Bài "-") thì bỏ phần bài: "lsdl:3-xay-dung-va-bao-ve-dat-nuoc:1" (xem yccd_ids).
+"""
+from __future__ import annotations
+import uuid
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .data import _key_col
+from .fuzzy import TitleIndex, fold
+from .generation import LEVEL_KEY, LEVELS_TT27, QTYPES
+from .perf import timed
+from .ppct import match_periods, ppct_subject
+
+DEFAULT_POINTS = 0.5
+
+# tên cột (đã bỏ dấu, chữ thường) -> field
+IMPORT_ALIASES = {
+    "mon": "subject", "mon hoc": "subject",
+    "chu de": "topic", "chu de/chu diem": "topic", "chu diem": "topic",
+    "bai": "lesson", "bai hoc": "lesson", "so bai": "lesson",
+    "ten bai hoc": "lesson_name",
+    "yccd": "yccd", "yeu cau can dat": "yccd",
+    "ma yccd": "yccd_id", "ma": "yccd_id", "yccd id": "yccd_id", "id": "yccd_id",
+    "dang": "qtype", "dang cau hoi": "qtype", "loai cau hoi": "qtype",
+    "muc": "level", "muc do": "level", "muc do (tt27)": "level",
+    "so cau": "n", "n": "n",
+    "block": "block", "khoi tinh diem": "block",
+    "diem": "points", "diem/cau": "points", "points": "points",
+    "so tiet": "so_tiet",
+}
+TEMPLATE_COLUMNS = ["Môn", "Chủ đề/Chủ điểm", "Bài", "Yêu cầu cần đạt", "Mã YCCĐ", "Dạng câu hỏi", "Mức độ", "Số câu", "Block", "Điểm"]
+
+def _id_part(s: pd.Series) -> pd.Series:
+    # "3. Xây dựng và bảo vệ đất nước" -> "3-xay-dung-va-bao-ve-dat-nuoc"; "-" -> ""
+    s = s.astype(str)
+    uniq = pd.unique(s)
+    return s.map(dict(zip(uniq, ("-".join(fold(u).split()) for u in uniq))))
+
+def yccd_ids(yccd_df: pd.DataFrame) -> pd.Series:
+    """
+    Mã ổn định cho từng YCCĐ của kho: môn + chủ đề + bài + thứ tự YCCĐ trong bài
+    (số bài có thể lặp giữa các chủ đề, vd. TV đánh lại từ Bài 1 mỗi học kì).
+    """
+    keys = ["Môn", "Chủ đề/Chủ điểm", "Bài"]
+    k = yccd_df.groupby(keys, observed=True, sort=False, dropna=False).cumcount() + 1
+    bai = _id_part(yccd_df["Bài"])
+    bai = bai.where(bai == "", bai + ":")
+    return _id_part(yccd_df["Môn"]) + ":" + _id_part(yccd_df["Chủ đề/Chủ điểm"]) + ":" + bai + k.astype(str)
+
+def catalog_ids(yccd_df: pd.DataFrame) -> pd.Series:
+    """
+    yccd_ids của kho (cache theo bảng, cùng index với yccd_df): để hiện mã ở ô chọn YCCĐ.
+    """
+    return pd.Series(_catalog_data(yccd_df).frame["id_key"].to_numpy(), index=yccd_df.index)
+
+def _fold_col(s: pd.Series) -> pd.Series:
+    # fold mỗi giá trị khác nhau 1 lần (cột lặp rất nhiều: môn, bài, YCCĐ trùng)
+    s = s.fillna("").astype(str)
+    uniq = pd.unique(s)
+    return s.map(dict(zip(uniq, (fold(u) for u in uniq))))
+
+def _subject_key(s: pd.Series) -> pd.Series:
+    # "TV" (kho YCCĐ) và "Tiếng Việt" (giáo viên gõ) -> cùng 1 khoá
+    return _fold_col(s.astype(str).map(ppct_subject))
+
+def _lesson_num(s: pd.Series) -> pd.Series:
+    return pd.to_numeric(s.astype(str).str.extract(r"(\d{1,3})", expand=False), errors="coerce").astype("Int64")
+
+def read_matrix_file(uploaded_file) -> pd.DataFrame:
+    """
+    Đọc CSV/XLSX (file upload hoặc đường dẫn). XLSX: lấy sheet ma trận đầu tiên, dừng ở dòng trống
+    (bỏ phần bản đặc tả phía dưới của file xuất từ app).
+    """
+    name = str(getattr(uploaded_file, "name", uploaded_file) or "").lower()
+    if name.endswith(".csv"):
+        df = pd.read_csv(uploaded_file, encoding="utf-8-sig", dtype=str)
+    elif name.endswith(".xlsx"):
+        sheets = pd.read_excel(uploaded_file, sheet_name=None, dtype=str)
+        df = next((d for s, d in sheets.items() if s != "Tổng hợp"), pd.DataFrame())
+        empty = df.isna().all(axis=1)
+        if empty.any():
+            df = df.loc[:empty.idxmax()].iloc[:-1]
+    else:
+        raise ValueError("Chỉ hỗ trợ .csv hoặc .xlsx")
+    return df
+
+def _standardize(raw: pd.DataFrame) -> pd.DataFrame:
+    rename = {}
+    for c in raw.columns:
+        field = IMPORT_ALIASES.get(_key_col(c))
+        if field is not None and field not in rename.values():
+            rename[c] = field
+    df = raw[list(rename)].rename(columns=rename)
+    for c in ["subject", "topic", "lesson", "lesson_name", "yccd", "yccd_id", "qtype", "level", "n", "block", "points", "so_tiet"]:
+        if c not in df.columns:
+            df[c] = ""
+    df = df.fillna("").astype(str).apply(lambda col: col.str.strip())
+    df["line"] = raw.index.to_numpy() + 2  # số dòng trong file (dòng 1 = tiêu đề)
+    return df.reset_index(drop=True)
+
+def _choice_map(values: pd.Series, options: List[str], extra: Dict[str, str]) -> pd.Series:
+    """
+    Giá trị gõ tay -> 1 trong `options` (so sánh đã bỏ dấu; khớp đầy đủ, theo `extra`, hoặc tiền tố).
+    """
+    folded = {fold(o): o for o in options}
+    def pick(v: str) -> Optional[str]:
+        f = fold(v)
+        if not f:
+            return None
+        if f in folded:
+            return folded[f]
+        if f in extra:
+            return extra[f]
+        hits = [o for k, o in folded.items() if k.startswith(f) or f.startswith(k)]
+        return hits[0] if len(hits) == 1 else None
+    uniq = pd.unique(values)
+    return values.map(dict(zip(uniq, (pick(u) for u in uniq))))
+
+def _level_aliases() -> Dict[str, str]:
+    out = {}
+    for label, key in LEVEL_KEY.items():
+        out[fold(key)] = label                      # "m1"
+        out[key[1:]] = label                        # "1"
+        out[fold(label.split("–")[-1])] = label     # "nhan biet"
+    return out
+
+def _to_int(s: pd.Series, default: int) -> pd.Series:
+    return pd.to_numeric(s.str.replace(",", "."), errors="coerce").fillna(default).astype(int)
+
+class _CatalogData:
+    """
+    Các cột khoá của kho YCCĐ (môn/bài/nội dung đã bỏ dấu, mã) dựng 1 lần cho mỗi bảng;
+    chỉ mục gần đúng cho phần gợi ý chỉ dựng (theo từng môn) khi có dòng không khớp.
+    """
+    def __init__(self, yccd_df: pd.DataFrame):
+        cat = pd.DataFrame({
+            "c_subject": yccd_df["Môn"].astype(str).to_numpy(),
+            "c_topic": yccd_df["Chủ đề/Chủ điểm"].astype(str).to_numpy(),
+            "c_bai_text": yccd_df["Bài"].astype(str).to_numpy(),
+            "c_lesson_name": yccd_df["Tên bài học"].astype(str).to_numpy(),
+            "c_yccd": yccd_df["Yêu cầu cần đạt"].astype(str).to_numpy(),
+            "id_key": yccd_ids(yccd_df).to_numpy(),
+        })
+        cat["subj_key"] = _subject_key(cat["c_subject"])
+        cat["bai"] = _lesson_num(cat["c_bai_text"])
+        cat["ykey"] = _fold_col(cat["c_yccd"])
+        cat["tkey"] = _fold_col(cat["c_topic"])
+        self.frame = cat
+        self._indexes: Dict[str, Tuple[np.ndarray, TitleIndex]] = {}
+
+    def index(self, subj_key: str) -> Tuple[np.ndarray, TitleIndex]:
+        """
+        (vị trí các dòng của môn trong kho, chỉ mục nội dung YCCĐ của môn); dựng khi cần.
+        """
+        if subj_key not in self._indexes:
+            pos = np.flatnonzero(self.frame["subj_key"].to_numpy() == subj_key)
+            self._indexes[subj_key] = (pos, TitleIndex(self.frame["c_yccd"].to_numpy()[pos].tolist()))
+        return self._indexes[subj_key]
+
+# id(yccd_df) -> (weakref df, dữ liệu khoá); kho dùng chung (st.cache_resource) -> dựng 1 lần
+_CATALOGS: Dict[int, Tuple[weakref.ref, _CatalogData]] = {}
+
+def _catalog_data(yccd_df: pd.DataFrame) -> _CatalogData:
+    hit = _CATALOGS.get(id(yccd_df))
+    if hit is not None and hit[0]() is yccd_df:
+        return hit[1]
+    data = _CatalogData(yccd_df)
+    for key in [k for k, (ref, _) in _CATALOGS.items() if ref() is None]:
+        del _CATALOGS[key]
+    _CATALOGS[id(yccd_df)] = (weakref.ref(yccd_df), data)
+    return data
+
+def _merge_unique(left: pd.DataFrame, cat: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """
+    Merge theo `keys`; khoá khớp nhiều dòng kho -> lấy dòng đầu nhưng cột "amb" = True (để báo, không đoán).
+    """
+    right = cat.assign(amb=cat.duplicated(keys, keep=False)).drop_duplicates(keys)
+    return left[keys].merge(right, on=keys, how="left")
+
+@timed("import_matrix")
+def import_matrix(raw: pd.DataFrame, yccd_df: pd.DataFrame,
+                  ppct_df: Optional[pd.DataFrame] = None) -> Tuple[List[Dict[str, Any]], pd.DataFrame]:
+    """
+    Khớp các dòng ma trận nhập từ file với kho YCCĐ + PPCT.
+    Trả (matrix_rows khớp được, bảng báo cáo các dòng không nhập được).
+    """
+    df = _standardize(raw)
+    df = df[(df.drop(columns="line") != "").any(axis=1)].reset_index(drop=True)
+    df["subj_key"] = _subject_key(df["subject"])
+    df["bai"] = _lesson_num(df["lesson"])
+    df["ykey"] = _fold_col(df["yccd"])
+    df["tkey"] = _fold_col(df["topic"])
+    df["id_key"] = df["yccd_id"].str.lower()
+
+    data = _catalog_data(yccd_df)
+    cat = data.frame
+    cols = list(cat.columns) + ["amb"]
+
+    # 1) theo mã YCCĐ; 2) môn + chủ đề + số bài + nội dung; 3) môn + số bài + nội dung;
+    # 4) môn + nội dung (file không ghi bài)
+    by_id = df[["id_key"]].merge(cat.assign(amb=False), on="id_key", how="left")
+    by_topic = _merge_unique(df, cat, ["subj_key", "tkey", "bai", "ykey"])
+    by_lesson = _merge_unique(df, cat, ["subj_key", "bai", "ykey"])
+    by_text = _merge_unique(df, cat, ["subj_key", "ykey"])
+    has_id = df["id_key"] != ""
+    has_bai = df["bai"].notna()
+    match = by_text[cols].astype({"amb": object})
+    use_lesson = has_bai & by_lesson["c_yccd"].notna()
+    match.loc[use_lesson] = by_lesson.loc[use_lesson, cols]
+    use_topic = has_bai & (df["tkey"] != "") & by_topic["c_yccd"].notna()
+    match.loc[use_topic] = by_topic.loc[use_topic, cols]
+    match.loc[has_id] = by_id.loc[has_id, cols]
+    found = match["c_yccd"].notna() & ((df["ykey"] != "") | has_id)
+    ambiguous = found & match["amb"].eq(True)
+
+    qtype = _choice_map(df["qtype"], QTYPES, {})
+    level = _choice_map(df["level"], LEVELS_TT27, _level_aliases())
+    n = _to_int(df["n"], 1)
+    block = _to_int(df["block"], 1)
+    points = pd.to_numeric(df["points"].str.replace(",", "."), errors="coerce").fillna(DEFAULT_POINTS)
+    manual_tiet = _to_int(df["so_tiet"], 0)
+
+    checks = [
+        ((df["ykey"] == "") & ~has_id, "Thiếu YCCĐ hoặc mã YCCĐ."),
+        (~found & has_id, "Không có mã YCCĐ này trong kho."),
+        (~found & ~has_id & (df["ykey"] != ""), "Không tìm thấy YCCĐ trong kho (môn/bài/nội dung)."),
+        (ambiguous, "YCCĐ này có ở nhiều chủ đề/bài trong kho: ghi thêm Chủ đề, Bài hoặc dùng Mã YCCĐ."),
+        (qtype.isna(), "Dạng câu hỏi không hợp lệ."),
+        (level.isna(), "Mức độ không hợp lệ (M1/M2/M3)."),
+        (n < 1, "Số câu phải ≥ 1."),
+        (~block.isin([1, 2]), "Block phải là 1 hoặc 2."),
+    ]
+    reasons = pd.Series("", index=df.index)
+    for mask, msg in checks:
+        reasons = reasons.mask(mask, reasons + msg + " ")
+    reasons = reasons.str.strip()
+    ok = reasons == ""
+
+    # số tiết: cột Số tiết trong file nếu > 0, không thì PPCT (môn + số bài, trượt thì theo tên bài)
+    lessons = ("Bài " + match["c_bai_text"].fillna("") + ": " + match["c_lesson_name"].fillna("")).str.strip()
+    so_tiet = manual_tiet.astype("Int64").where(manual_tiet > 0)
+    notes = pd.Series("Số tiết lấy từ file.", index=df.index).where(manual_tiet > 0, "")
+    need = ok & so_tiet.isna()
+    if ppct_df is not None and len(ppct_df) > 0 and need.any():
+        pp = ppct_df[["Mon", "Bai_so", "So_tiet", "Ten_bai_trich_xuat"]].drop_duplicates()
+        # cùng (môn, số bài) mà khác số tiết / tên bài -> không đoán, để match_periods tra theo tên bài
+        pp = pp[~pp.duplicated(["Mon", "Bai_so"], keep=False)]
+        pp = pp.assign(Bai_so=pp["Bai_so"].astype("Int64"))
+        left = pd.DataFrame({"Mon": match.loc[need, "c_subject"].map(ppct_subject),
+                             "Bai_so": match.loc[need, "bai"].astype("Int64")})
+        hit = left.merge(pp, on=["Mon", "Bai_so"], how="left").set_index(left.index)
+        got = hit["So_tiet"].notna()
+        so_tiet.loc[got[got].index] = hit.loc[got, "So_tiet"].astype(int)
+        notes.loc[got[got].index] = ("Khớp PPCT: Bài " + hit.loc[got, "Bai_so"].astype(str) + " – "
+                                     + hit.loc[got, "Ten_bai_trich_xuat"].fillna("").astype(str) + ".")
+        miss = got[~got].index
+        if len(miss):
+            for i, (tiet, note) in zip(miss, match_periods(ppct_df, match.loc[miss, "c_subject"].tolist(),
+                                                            lessons.loc[miss].tolist())):
+                so_tiet.loc[i] = tiet if tiet is not None else pd.NA
+                notes.loc[i] = note
+
+    rows = []
+    for i in df.index[ok]:
+        m = match.loc[i]
+        rows.append({
+            "id": str(uuid.uuid4())[:8],
+            "subject": m["c_subject"],
+            "topic": m["c_topic"],
+            "lesson": lessons.loc[i],
+            "yccd": m["c_yccd"],
+            "qtype": qtype.loc[i],
+            "level": level.loc[i],
+            "points": float(points.loc[i]),
+            "n": int(n.loc[i]),
+            "so_tiet": int(so_tiet.loc[i]) if pd.notna(so_tiet.loc[i]) else 0,
+            "block": int(block.loc[i]),
+            "ti_le": None,
+            "so_diem": None,
+            "so_tiet_note": notes.loc[i],
+        })
+
+    bad = df.loc[~ok, ["line", "subject", "lesson", "yccd", "yccd_id", "qtype", "level"]].copy()
+    bad.insert(1, "reason", reasons[~ok])
+    bad["suggestion"] = _suggest(df.loc[~ok & ~found], data).reindex(bad.index).fillna("")
+    report = bad.rename(columns={"line": "Dòng", "reason": "Lý do", "subject": "Môn", "lesson": "Bài",
+                                 "yccd": "Yêu cầu cần đạt", "yccd_id": "Mã YCCĐ", "qtype": "Dạng câu hỏi",
+                                 "level": "Mức độ", "suggestion": "Gợi ý"})
+    return rows, report.reset_index(drop=True)
+
+def _suggest(rows: pd.DataFrame, data: _CatalogData) -> pd.Series:
+    """
+    YCCĐ gần nhất trong kho (cùng môn) cho các dòng không khớp: "mã: nội dung".
+    """
+    rows = rows[rows["ykey"] != ""]
+    if rows.empty:
+        return pd.Series(dtype=object)
+    cat = data.frame
+    out = pd.Series("", index=rows.index)
+    for subj_key, grp in rows.groupby("subj_key", sort=False):
+        pos, index = data.index(subj_key)
+        for i, hits in zip(grp.index, index.query_many(grp["yccd"].tolist(), k=1, min_score=0.3)):
+            if hits:
+                j = pos[hits[0][0]]
+                out.loc[i] = f"{cat['id_key'].iat[j]}: {cat['c_yccd'].iat[j]}"
+    return out
+
+def template_csv(yccd_df: pd.DataFrame) -> bytes:
+    """
+    File mẫu (CSV, UTF-8 BOM để Excel đọc đúng tiếng Việt): 1 dòng ghi nội dung YCCĐ,
+    1 dòng chỉ ghi mã YCCĐ, lấy từ kho đang dùng.
+    """
+    ids = yccd_ids(yccd_df)
+    first, last = yccd_df.iloc[0], yccd_df.iloc[-1]
+    sample = pd.DataFrame([
+        [first["Môn"], first["Chủ đề/Chủ điểm"], first["Bài"], first["Yêu cầu cần đạt"], "", QTYPES[0], "M1", 2, 1,
+         DEFAULT_POINTS],
+        [last["Môn"], "", "", "", ids.iloc[-1], QTYPES[1], "M2", 1, 2, 1],
+    ], columns=TEMPLATE_COLUMNS)
+    return sample.to_csv(index=False).encode("utf-8-sig")
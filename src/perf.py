@@ -0,0 +1,170 @@
+\
+from __future__ import annotations
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Số mẫu tối đa giữ lại cho mỗi span (đủ để tính p50/p95, không phình bộ nhớ)
+MAX_SAMPLES = 2000
+
+DEFAULT_TRACE = Path(__file__).resolve().parents[1] / "logs" / "perf_trace.jsonl"
+
+class Histogram:
+    """
+    Thống kê thời gian của 1 span: count/total/max + cửa sổ mẫu để tính percentile.
+    Các thuộc tính dạng số (vd. số token) được cộng dồn vào `sums`.
+    """
+    def __init__(self, maxlen: int = MAX_SAMPLES):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: deque = deque(maxlen=maxlen)
+        self.sums: Dict[str, float] = {}
+
+    def add(self, seconds: float, attrs: Dict[str, Any], ok: bool = True):
+        self.count += 1
+        if not ok:
+            self.errors += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+        for k, v in attrs.items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                self.sums[k] = self.sums.get(k, 0) + v
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        xs = sorted(self.samples)
+        i = min(len(xs) - 1, max(0, int(round(p / 100.0 * (len(xs) - 1)))))
+        return xs[i]
+
+    def summary(self) -> Dict[str, Any]:
+        row = {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total * 1000, 1),
+            "mean_ms": round(self.total * 1000 / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p95_ms": round(self.percentile(95) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+        row.update({k: int(v) if float(v).is_integer() else round(v, 2) for k, v in self.sums.items()})
+        return row
+
+class PerfRecorder:
+    """
+    Tập histogram theo tên span. Dùng chung giữa các thread nên có lock.
+    `trace`: file JSONL riêng của recorder (vd. 1 phiên bật ghi trace, không ảnh hưởng phiên khác).
+    """
+    def __init__(self, label: str = "", trace: Optional[Path] = None):
+        self.label = label
+        self.trace = Path(trace) if trace is not None else None
+        self._lock = threading.Lock()
+        self._hists: Dict[str, Histogram] = {}
+
+    def record(self, name: str, seconds: float, attrs: Dict[str, Any], ok: bool = True):
+        with self._lock:
+            h = self._hists.get(name)
+            if h is None:
+                h = self._hists[name] = Histogram()
+            h.add(seconds, attrs, ok)
+
+    def summary_rows(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = [{"span": name, **h.summary()} for name, h in self._hists.items()]
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._hists.clear()
+
+# Thống kê toàn tiến trình (mọi phiên Streamlit cộng dồn)
+PROCESS = PerfRecorder("process")
+
+_session: ContextVar[Optional[PerfRecorder]] = ContextVar("perf_session", default=None)
+_trace_path: Optional[Path] = None
+_trace_lock = threading.Lock()
+
+def bind_session(recorder: Optional[PerfRecorder]) -> None:
+    """
+    Gắn recorder của phiên hiện tại vào context (gọi đầu mỗi lần rerun).
+    """
+    _session.set(recorder)
+
+def set_trace_path(path: Optional[Path]) -> None:
+    """
+    Bật (path) / tắt (None) ghi trace JSONL ra đĩa cho cả tiến trình (script, benchmark).
+    Trong app mỗi phiên bật riêng qua PerfRecorder.trace.
+    """
+    global _trace_path
+    _trace_path = Path(path) if path is not None else None
+
+def trace_path() -> Optional[Path]:
+    return _trace_path
+
+def _write_trace(path: Path, event: Dict[str, Any]) -> None:
+    line = json.dumps(event, ensure_ascii=False, default=str)
+    with _trace_lock:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError:
+            # trace chỉ để chẩn đoán, không được làm hỏng luồng chính
+            pass
+
+def record(name: str, seconds: float, attrs: Optional[Dict[str, Any]] = None, ok: bool = True) -> None:
+    attrs = attrs or {}
+    PROCESS.record(name, seconds, attrs, ok)
+    rec = _session.get()
+    if rec is not None:
+        rec.record(name, seconds, attrs, ok)
+    paths = {p for p in (_trace_path, rec.trace if rec is not None else None) if p is not None}
+    if paths:
+        event = {
+            "ts": round(time.time(), 3),
+            "span": name,
+            "ms": round(seconds * 1000, 3),
+            "ok": ok,
+            "session": rec.label if rec is not None else "",
+            **attrs,
+        }
+        for path in paths:
+            _write_trace(path, event)
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Đo thời gian 1 đoạn code. Trả về dict attrs để bên trong bổ sung thông tin
+    (vd. số token) trước khi span đóng.
+    """
+    t0 = time.perf_counter()
+    ok = True
+    try:
+        yield attrs
+    except Exception:
+        ok = False
+        raise
+    finally:
+        record(name, time.perf_counter() - t0, attrs, ok)
+
+def timed(name: Optional[str] = None) -> Callable:
+    """
+    Decorator: bọc cả hàm trong 1 span (mặc định lấy tên hàm).
+    """
+    def deco(fn: Callable) -> Callable:
+        span_name = name or fn.__name__
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
@@ -1,24 +1,27 @@
 \
 from __future__ import annotations
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 import re
+import weakref
 import pandas as pd
 
-try:
-    from pypdf import PdfReader
-except Exception:
-    PdfReader = None
+from .fuzzy import TitleIndex
+from .perf import timed
 
 DATA_DIR = Path(__file__).resolve().parents[1] / "data"
 DEFAULT_EXTRACTED = DATA_DIR / "ppct" / "ppct_k5_extracted.csv"
 
+@timed("_extract_ppct_from_pdf_bytes")
 def _extract_ppct_from_pdf_bytes(pdf_bytes: bytes) -> pd.DataFrame:
     """
     Trích số tiết theo bài từ PDF K5 (kế hoạch dạy học lớp 5).
     Cố gắng bắt pattern 'Bài xx ... (n tiết)'.
     """
-    if PdfReader is None:
+    # pypdf chỉ import khi thực sự trích PDF (giảm thời gian khởi động app)
+    try:
+        from pypdf import PdfReader
+    except Exception:
         raise RuntimeError("Thiếu thư viện pypdf. Hãy cài requirements.txt")
 
     import io
@@ -77,6 +80,7 @@ def _extract_ppct_from_pdf_bytes(pdf_bytes: bytes) -> pd.DataFrame:
 
     return pd.DataFrame(rows)
 
+@timed("load_ppct")
 def load_ppct(extracted_csv: Path = DEFAULT_EXTRACTED) -> pd.DataFrame:
     """
     Load PPCT đã trích sẵn (CSV). Nếu không có thì trả DataFrame rỗng.
@@ -86,32 +90,186 @@ def load_ppct(extracted_csv: Path = DEFAULT_EXTRACTED) -> pd.DataFrame:
         return df
     return pd.DataFrame(columns=["Mon","Bai_so","Ten_bai_trich_xuat","So_tiet","Nguon"])
 
+def extract_from_upload(uploaded_pdf) -> pd.DataFrame:
+    """
+    Nhận PDF upload (Streamlit UploadedFile), trích PPCT (không ghi đĩa).
+    """
+    return _extract_ppct_from_pdf_bytes(uploaded_pdf.getvalue())
+
+def save_extracted(df: pd.DataFrame, out_csv: Path = DEFAULT_EXTRACTED) -> None:
+    """
+    Lưu PPCT đã trích ra CSV để lần sau dùng (ghi file tạm rồi đổi tên).
+    """
+    out_csv.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_csv.with_suffix(".csv.tmp")
+    df.to_csv(tmp, index=False, encoding="utf-8-sig")
+    tmp.replace(out_csv)
+
 def extract_and_save_from_upload(uploaded_pdf, out_csv: Path = DEFAULT_EXTRACTED) -> pd.DataFrame:
     """
     Nhận PDF upload (Streamlit UploadedFile), trích PPCT và lưu CSV để lần sau dùng.
     """
-    pdf_bytes = uploaded_pdf.getvalue()
-    df = _extract_ppct_from_pdf_bytes(pdf_bytes)
-    out_csv.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(out_csv, index=False, encoding="utf-8-sig")
+    df = extract_from_upload(uploaded_pdf)
+    save_extracted(df, out_csv)
     return df
 
+# Tên môn trong kho YCCĐ -> tên môn trong PPCT (K5.pdf)
+PPCT_SUBJECT_ALIASES = {
+    "TV": "Tiếng Việt",
+    "LSĐL": "Lịch sử và Địa lí",
+    "Tin học CKP": "Tin học",
+}
+
+def ppct_subject(subject: str) -> str:
+    return PPCT_SUBJECT_ALIASES.get(str(subject), str(subject))
+
 def _lesson_num_from_text(text: str) -> Optional[int]:
     if not text:
         return None
     m = re.search(r"(\d{1,3})", str(text))
     return int(m.group(1)) if m else None
 
+def ppct_lookup(ppct_df: Optional[pd.DataFrame]) -> Dict[Tuple[str, int], Tuple[int, str]]:
+    """
+    (môn PPCT, số bài) -> (số tiết, tên bài). Dựng 1 lần để tra nhiều dòng (xuất ma trận lớn).
+    Số bài lặp lại trong môn mà khác số tiết / tên bài thì bỏ khỏi bảng (để tra theo tên bài).
+    """
+    if ppct_df is None or len(ppct_df) == 0:
+        return {}
+    out: Dict[Tuple[str, int], Tuple[int, str]] = {}
+    ambiguous = set()
+    for mon, bai, tiet, title in zip(ppct_df["Mon"], ppct_df["Bai_so"], ppct_df["So_tiet"], ppct_df["Ten_bai_trich_xuat"]):
+        key, value = (str(mon), int(bai)), (int(tiet), "" if pd.isna(title) else str(title))
+        if out.setdefault(key, value) != value:
+            ambiguous.add(key)
+    for key in ambiguous:
+        del out[key]
+    return out
+
+# Khớp gần đúng theo tên bài: điểm cosine tối thiểu, và phải hơn ứng viên thứ 2 một khoảng
+FUZZY_MIN_SCORE = 0.8
+FUZZY_MARGIN = 0.05
+
+_TITLE_NOISE = re.compile(r"\(\s*tiết[^)]*\)|\s*[–-]\s*trang\b.*$", re.IGNORECASE)
+_LESSON_PREFIX = re.compile(r"^\s*(?:bài\s*)*\d{1,3}\s*[:.\-–]?\s*", re.IGNORECASE)
+
+class _TitleData:
+    """
+    Chỉ mục tên bài + các cột cần để trả kết quả (list thuần, không đụng tới DataFrame khi tra).
+    """
+    def __init__(self, ppct_df: pd.DataFrame):
+        self.titles = ["" if pd.isna(t) else _clean_title(t) for t in ppct_df["Ten_bai_trich_xuat"]]
+        self.bai = [int(x) for x in ppct_df["Bai_so"]]
+        self.so_tiet = [int(x) for x in ppct_df["So_tiet"]]
+        self.index = TitleIndex(self.titles, ppct_df["Mon"].astype(str).tolist())
+
+    def pick(self, hits: List[Tuple[int, float]]) -> Optional[Tuple[int, str, str]]:
+        """
+        Ứng viên tốt nhất -> (số tiết, tên bài PPCT, ghi chú); None nếu không đủ chắc.
+        """
+        if not hits or hits[0][1] < FUZZY_MIN_SCORE:
+            return None
+        if len(hits) > 1 and hits[1][1] > hits[0][1] - FUZZY_MARGIN \
+                and self.so_tiet[hits[0][0]] != self.so_tiet[hits[1][0]]:
+            # 2 bài gần như trùng tên (vd. "Luyện tập chung") mà khác số tiết -> không đoán
+            return None
+        i, score = hits[0]
+        return (self.so_tiet[i], self.titles[i],
+                f"Khớp gần đúng PPCT theo tên bài ({score:.0%}): Bài {self.bai[i]} – {self.titles[i]}.")
+
+# id(ppct_df) -> (weakref df, dữ liệu dựng sẵn); dựng 1 lần cho mỗi bảng PPCT
+_TITLE_INDEXES: Dict[int, Tuple[weakref.ref, _TitleData]] = {}
+_LOOKUPS: Dict[int, Tuple[weakref.ref, Dict[Tuple[str, int], Tuple[int, str]]]] = {}
+
+def _clean_title(title: str) -> str:
+    # "Hỗn số (Tiết 1) – Trang 23,24" -> "Hỗn số"
+    return _TITLE_NOISE.sub(" ", str(title or "")).strip()
+
+def _lesson_name(lesson_text: str) -> str:
+    # "Bài 7: Hỗn số" -> "Hỗn số"
+    return _LESSON_PREFIX.sub("", str(lesson_text or "")).strip()
+
+def _per_frame(cache: Dict[int, Tuple[weakref.ref, Any]], ppct_df: pd.DataFrame, build: Callable[[pd.DataFrame], Any]) -> Any:
+    hit = cache.get(id(ppct_df))
+    if hit is not None and hit[0]() is ppct_df:
+        return hit[1]
+    data = build(ppct_df)
+    for key in [k for k, (ref, _) in cache.items() if ref() is None]:
+        del cache[key]
+    cache[id(ppct_df)] = (weakref.ref(ppct_df), data)
+    return data
+
+def _title_data(ppct_df: pd.DataFrame) -> _TitleData:
+    return _per_frame(_TITLE_INDEXES, ppct_df, _TitleData)
+
+def _frame_lookup(ppct_df: pd.DataFrame) -> Dict[Tuple[str, int], Tuple[int, str]]:
+    # ppct_lookup của bảng, dùng chung giữa các lần gọi find_periods (chỉ đọc)
+    return _per_frame(_LOOKUPS, ppct_df, ppct_lookup)
+
+def ppct_title_index(ppct_df: pd.DataFrame) -> TitleIndex:
+    """
+    Chỉ mục n-gram (bỏ dấu) trên tên bài PPCT, chia nhóm theo môn. Cache theo bảng.
+    """
+    return _title_data(ppct_df).index
+
 def find_periods(ppct_df: pd.DataFrame, subject: str, lesson_text: str) -> Tuple[Optional[int], str]:
     """
-    Tìm số tiết dựa vào môn + số bài. Trả (so_tiet, note).
+    Tìm số tiết dựa vào môn + số bài; không khớp số bài thì tra gần đúng theo tên bài. Trả (so_tiet, note).
     """
     n = _lesson_num_from_text(lesson_text)
+    subject = ppct_subject(subject)
+    if n is not None:
+        # số bài lặp lại (khác số tiết / tên bài) không có trong bảng tra -> tra theo tên bài
+        hit = _frame_lookup(ppct_df).get((subject, n))
+        if hit is not None:
+            return hit[0], f"Khớp PPCT: Bài {n} – {hit[1]}."
+    name = _lesson_name(lesson_text)
+    if name and len(ppct_df) > 0:
+        data = _title_data(ppct_df)
+        found = data.pick(data.index.query(name, k=2, group=subject))
+        if found is not None:
+            return found[0], found[2]
     if n is None:
         return None, "Không lấy được số bài từ trường 'Bài'."
-    cand = ppct_df[(ppct_df["Mon"] == subject) & (ppct_df["Bai_so"] == n)]
-    if len(cand) == 0:
-        return None, f"Không tìm thấy Bài {n} trong PPCT của môn {subject}."
-    so_tiet = int(cand["So_tiet"].iloc[0])
-    title = str(cand["Ten_bai_trich_xuat"].iloc[0])
-    return so_tiet, f"Khớp PPCT: Bài {n} – {title}."
+    return None, f"Không tìm thấy Bài {n} trong PPCT của môn {subject}."
+
+def match_lessons(ppct_df: pd.DataFrame, subjects: Sequence[str],
+                  lessons: Sequence[str]) -> List[Tuple[Optional[int], str, str]]:
+    """
+    Như match_periods nhưng trả thêm tên bài PPCT đã khớp: (so_tiet, tên bài, note);
+    không khớp thì (None, "", note). Dùng khi cần ghi riêng tên bài (vd. cột "Bài PPCT" khi xuất XLSX).
+    """
+    lookup = ppct_lookup(ppct_df)
+    out: List[Tuple[Optional[int], str, str]] = []
+    misses: Dict[Tuple[str, str], List[int]] = {}
+    for i, (subj, lesson) in enumerate(zip(subjects, lessons)):
+        subj = ppct_subject(subj)
+        n = _lesson_num_from_text(lesson)
+        hit = lookup.get((subj, n)) if n is not None else None
+        if hit is not None:
+            out.append((hit[0], hit[1], f"Khớp PPCT: Bài {n} – {hit[1]}."))
+            continue
+        out.append((None, "", "Không lấy được số bài từ trường 'Bài'." if n is None
+                    else f"Không tìm thấy Bài {n} trong PPCT của môn {subj}."))
+        name = _lesson_name(lesson)
+        if name:
+            misses.setdefault((subj, name), []).append(i)
+    if misses and len(ppct_df):
+        # kho YCCĐ lặp tên bài rất nhiều -> mỗi (môn, tên bài) chỉ tra 1 lần
+        data = _title_data(ppct_df)
+        keys = list(misses)
+        results = data.index.query_many([k[1] for k in keys], [k[0] for k in keys], k=2)
+        for key, hits in zip(keys, results):
+            found = data.pick(hits)
+            if found is not None:
+                for i in misses[key]:
+                    out[i] = found
+    return out
+
+@timed("match_periods")
+def match_periods(ppct_df: pd.DataFrame, subjects: Sequence[str], lessons: Sequence[str]) -> List[Tuple[Optional[int], str]]:
+    """
+    Như find_periods nhưng cho cả danh sách (vd. cả kho YCCĐ hoặc ma trận lớn):
+    tra số bài bằng dict, chỉ những dòng không khớp mới qua chỉ mục tên bài (tra hàng loạt).
+    """
+    return [(so_tiet, note) for so_tiet, _, note in match_lessons(ppct_df, subjects, lessons)]
@@ -0,0 +1,293 @@
+\
+"""
+Sinh trước (speculative) các câu của ma trận ngay khi dòng được thêm vào, để lúc bấm
+TẠO ĐỀ phần lớn câu đã có sẵn.
+
+- 1 Pregenerator cho cả tiến trình (st.cache_resource); mỗi phiên 1 pool riêng.
+- Mỗi lần rerun, app gọi sync(): dòng mới -> xếp hàng n câu; dòng bị xoá / đổi nội dung
+  (hoặc đổi model, temperature...) -> huỷ các câu của dòng đó. Điểm/câu không nằm trong khoá
+  (🧮 Tính Tỉ lệ & Số điểm ghi lại so_diem mọi dòng ngay trước TẠO ĐỀ): câu chưa sinh nhận
+  điểm mới, câu đã sinh vẫn dùng, điểm trong đề lấy theo ma trận lúc TẠO ĐỀ.
+- Ngân sách: mỗi phiên sinh lần lượt từng câu (1 request tại 1 thời điểm), tối đa
+  RATE_PER_MIN câu/phút (token bucket) và MAX_PENDING câu chờ/sẵn sàng. Hết token thì
+  trả worker lại cho phiên khác và hẹn giờ xếp lại lượt (không ngủ trong worker).
+- Job TẠO ĐỀ lấy câu qua take(): câu đã xong -> dùng ngay; đang sinh -> chờ nốt;
+  chưa bắt đầu -> huỷ, job tự sinh. Câu đã lấy không được dùng lại cho lần TẠO ĐỀ sau.
+- Huỷ câu đang gọi API không dừng được request, chỉ bỏ kết quả.
+"""
+from __future__ import annotations
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .generation import make_question, row_meta
+from .perf import span
+
+MAX_WORKERS = 2      # số phiên sinh trước cùng lúc
+RATE_PER_MIN = 12    # câu / phút / phiên
+BURST = 3
+MAX_PENDING = 60     # câu chờ + sẵn sàng (chưa dùng) tối đa / phiên
+TAKE_TIMEOUT = 120.0
+IDLE_TTL = 3600      # bỏ pool của phiên không rerun quá 1 giờ
+
+QUEUED, RUNNING, READY, CANCELLED, FAILED = "queued", "running", "ready", "cancelled", "error"
+
+Result = Tuple[Dict[str, Any], bool, str]
+
+def spec_key(meta: Dict[str, Any], settings: Dict[str, Any]) -> str:
+    """
+    Khoá của 1 câu: nội dung meta (trừ điểm) + tham số sinh. Đổi bất kỳ thứ gì -> câu cũ không còn khớp.
+    """
+    meta = {k: v for k, v in meta.items() if k != "points"}
+    raw = json.dumps([meta, settings.get("model", ""), settings.get("api_base", ""),
+                      settings.get("temperature"), settings.get("max_tokens"), bool(settings.get("api_key"))],
+                     ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+class _Bucket:
+    def __init__(self, rate_per_min: float, burst: int):
+        self.rate = rate_per_min / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    def acquire(self) -> float:
+        """
+        Lấy 1 token nếu có (trả 0); không thì trả số giây cần chờ, không chặn.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+class _Spec:
+    def __init__(self, row_id: str, key: str, meta: Dict[str, Any]):
+        self.row_id = row_id
+        self.key = key
+        self.meta = meta
+        self.state = QUEUED
+        self.result: Optional[Result] = None
+        self.taken = False
+        self.cancel = threading.Event()
+        self.finished = threading.Event()
+
+    @property
+    def live(self) -> bool:
+        # câu lỗi vẫn tính cho dòng của nó (không thử lại, job sẽ tự sinh)
+        return self.state != CANCELLED
+
+class _Pool:
+    def __init__(self, rate_per_min: float, burst: int):
+        self.specs: Dict[str, List[_Spec]] = {}
+        self.bucket = _Bucket(rate_per_min, burst)
+        self.settings: Dict[str, Any] = {}
+        self.draining = False
+        self.seen = time.time()
+
+    def all(self) -> List[_Spec]:
+        return [s for specs in self.specs.values() for s in specs]
+
+class Pregenerator:
+    """
+    Sinh trước theo ma trận cho mọi phiên. Thread-safe.
+    """
+    def __init__(self, max_workers: int = MAX_WORKERS, rate_per_min: float = RATE_PER_MIN, burst: int = BURST,
+                 max_pending: int = MAX_PENDING, generate: Callable[..., Result] = make_question):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pregen")
+        self._lock = threading.Lock()
+        self._pools: Dict[str, _Pool] = {}
+        self.rate_per_min = rate_per_min
+        self.burst = burst
+        self.max_pending = max_pending
+        self._generate = generate
+        self._closed = False
+
+    # ---- API ----
+    def sync(self, session_id: str, rows: Sequence[Dict[str, Any]], grade: int, settings: Dict[str, Any]) -> None:
+        """
+        Đồng bộ pool của phiên với ma trận hiện tại (gọi mỗi lần rerun, rẻ khi ma trận không đổi).
+        `settings` như JobManager.submit (api_key, model, ...).
+        """
+        with self._lock:
+            self._prune(session_id)
+            pool = self._pools.get(session_id)
+            if pool is None:
+                pool = self._pools[session_id] = _Pool(self.rate_per_min, self.burst)
+            pool.seen = time.time()
+            pool.settings = dict(settings)
+
+            wanted = {}
+            for row in rows:
+                meta = row_meta(row, grade)
+                wanted[str(row.get("id") or spec_key(meta, {}))] = (meta, spec_key(meta, settings), int(row.get("n") or 1))
+
+            for row_id in list(pool.specs):
+                w = wanted.get(row_id)
+                for s in pool.specs[row_id]:
+                    # dòng bị xoá hoặc đổi nội dung / tham số sinh; câu đã được job lấy thì giữ
+                    # làm dấu "đã dùng" để không sinh lại dòng đã vào đề
+                    if w is None or (s.key != w[1] and not s.taken):
+                        self._cancel(s)
+                if w is None:
+                    del pool.specs[row_id]
+
+            budget = self.max_pending - sum(1 for s in pool.all() if s.live and not s.taken)
+            queued = False
+            for row_id, (meta, key, n) in wanted.items():
+                specs = [s for s in pool.specs.get(row_id, []) if s.live or s.taken]
+                for s in specs:
+                    if s.state == QUEUED:
+                        # chỉ đổi điểm/câu: câu chưa sinh dùng điểm mới trong prompt
+                        s.meta = meta
+                extra = len(specs) - n
+                for s in reversed(specs):
+                    # giảm số câu: huỷ các câu chưa dùng ở cuối
+                    if extra <= 0:
+                        break
+                    if not s.taken:
+                        self._cancel(s)
+                        extra -= 1
+                specs = [s for s in specs if s.live or s.taken]
+                missing = max(0, min(n - len(specs), budget))
+                specs += [_Spec(row_id, key, meta) for _ in range(missing)]
+                budget -= missing
+                queued = queued or missing > 0
+                pool.specs[row_id] = specs
+            if queued and not pool.draining:
+                pool.draining = True
+                # bản sao context của phiên -> span perf ghi vào recorder của phiên
+                ctx = contextvars.copy_context()
+                self._executor.submit(ctx.run, self._drain, pool, ctx)
+
+    def take(self, session_id: str, meta: Dict[str, Any], settings: Dict[str, Any],
+             timeout: float = TAKE_TIMEOUT) -> Optional[Result]:
+        """
+        Lấy 1 câu đã sinh trước khớp meta; None nếu không có (job tự sinh).
+        """
+        key = spec_key(meta, settings)
+        with span("pregen_take") as sp:
+            with self._lock:
+                pool = self._pools.get(session_id)
+                order = {READY: 0, RUNNING: 1, QUEUED: 2}
+                cands = [s for s in (pool.all() if pool else []) if s.key == key and s.state in order and not s.taken]
+                spec = min(cands, key=lambda s: order[s.state], default=None)
+                if spec is None:
+                    sp["hit"] = 0
+                    return None
+                spec.taken = True
+                if spec.state == QUEUED:
+                    self._cancel(spec)
+                    sp["hit"] = 0
+                    return None
+            spec.finished.wait(timeout)
+            result = spec.result if spec.state == READY else None
+            sp["hit"] = int(result is not None)
+            return result
+
+    def taker(self, session_id: str, settings: Dict[str, Any]) -> Callable[[Dict[str, Any]], Optional[Result]]:
+        """
+        Hàm take() gắn sẵn phiên + tham số sinh, để truyền vào settings["pregen"] của job.
+        """
+        return lambda meta: self.take(session_id, meta, settings)
+
+    def status(self, session_id: str) -> Dict[str, int]:
+        """
+        Số câu chưa dùng theo trạng thái (queued/running/ready).
+        """
+        out = {QUEUED: 0, RUNNING: 0, READY: 0}
+        with self._lock:
+            pool = self._pools.get(session_id)
+            for s in pool.all() if pool else []:
+                if s.state in out and not s.taken:
+                    out[s.state] += 1
+        return out
+
+    def cancel_session(self, session_id: str) -> None:
+        with self._lock:
+            pool = self._pools.pop(session_id, None)
+            for s in pool.all() if pool else []:
+                self._cancel(s)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            for pool in self._pools.values():
+                for s in pool.all():
+                    self._cancel(s)
+            self._pools.clear()
+        self._executor.shutdown(wait=True)
+
+    # ---- nội bộ ----
+    def _cancel(self, spec: _Spec) -> None:
+        spec.cancel.set()
+        spec.state = CANCELLED
+        spec.finished.set()
+
+    def _prune(self, keep: str) -> None:
+        cutoff = time.time() - IDLE_TTL
+        for sid in [sid for sid, p in self._pools.items() if sid != keep and p.seen < cutoff]:
+            for s in self._pools.pop(sid).all():
+                self._cancel(s)
+
+    def _next(self, pool: _Pool) -> Optional[_Spec]:
+        with self._lock:
+            spec = next((s for s in pool.all() if s.state == QUEUED and not s.taken), None)
+            if spec is None:
+                pool.draining = False
+            return spec
+
+    def _resume(self, pool: _Pool, ctx: contextvars.Context) -> None:
+        # timer hết giờ chờ token: xếp lại lượt drain của phiên vào pool worker
+        with self._lock:
+            if self._closed:
+                pool.draining = False
+                return
+        try:
+            self._executor.submit(ctx.copy().run, self._drain, pool, ctx)
+        except RuntimeError:
+            # executor đã shutdown
+            with self._lock:
+                pool.draining = False
+
+    def _drain(self, pool: _Pool, ctx: contextvars.Context) -> None:
+        # mỗi phiên 1 lượt drain tại 1 thời điểm -> không quá 1 request sinh trước / phiên
+        while True:
+            spec = self._next(pool)
+            if spec is None:
+                return
+            delay = pool.bucket.acquire()
+            if delay > 0:
+                # hết token: nhả worker (chỉ MAX_WORKERS cho cả tiến trình), hẹn giờ chạy tiếp;
+                # pool.draining giữ True để sync() không xếp lượt thứ 2
+                timer = threading.Timer(delay, self._resume, (pool, ctx))
+                timer.daemon = True
+                timer.start()
+                return
+            with self._lock:
+                if spec.state != QUEUED:
+                    continue
+                spec.state = RUNNING
+                settings = pool.settings
+            try:
+                with span("pregen_question"):
+                    result = self._generate(
+                        spec.meta, settings.get("api_key", ""), settings.get("model", ""), settings.get("api_base", ""),
+                        settings.get("temperature", 0.7), settings.get("max_tokens", 1024),
+                        cache=settings.get("cache"), router=settings.get("router"),
+                    )
+            except Exception:
+                result = None
+            with self._lock:
+                if spec.state == RUNNING:
+                    # câu AI trả chưa đạt (đã rơi về mẫu offline) không dùng: để job sinh lại
+                    ok = result is not None and result[1]
+                    spec.result = result if ok else None
+                    spec.state = READY if ok else FAILED
+                spec.finished.set()
@@ -0,0 +1,224 @@
+\
+"""
+Profiler theo từng lần rerun của app (opt-in): cProfile + thời gian wall cho từng phần
+(sidebar, PPCT, dataset, Tab 1/2/3...) để biết tương tác nào chậm vì phần nào.
+
+- Bật bằng biến môi trường APP_PROFILE=1 hoặc secret APP_PROFILE = true. Tắt thì
+  section() là nullcontext, gần như không tốn gì.
+- Mỗi phần có 1 cProfile riêng; phần lồng nhau tạm dừng profiler của phần cha nên
+  hàm không bị tính 2 lần (wall của phần cha vẫn gồm cả phần con). Phần "rerun" (gốc) =
+  mọi thứ nằm ngoài các phần đã đặt tên.
+- Mỗi lần rerun ghi ra logs/profile/<session_id>/<thời gian>-<seq>/: <phần>.prof (pstats, mở bằng
+  `python -m pstats` / snakeviz) + summary.json (wall từng phần + top hotspot).
+"""
+from __future__ import annotations
+import cProfile
+import json
+import os
+import pstats
+import shutil
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from . import perf
+from .sessions import valid_session_id
+
+ENV_VAR = "APP_PROFILE"
+PROFILE_DIR = Path(__file__).resolve().parents[1] / "logs" / "profile"
+ROOT = "rerun"
+TOP_N = 50  # số hotspot giữ trong summary; sidebar chọn hiển thị bao nhiêu
+KEEP_RUNS = 50  # số lần rerun gần nhất giữ lại trên đĩa cho mỗi phiên
+
+def enabled(secrets: Optional[Any] = None) -> bool:
+    """
+    APP_PROFILE trong biến môi trường (ưu tiên) hoặc trong st.secrets.
+    """
+    value = os.environ.get(ENV_VAR)
+    if value is None and secrets is not None:
+        try:
+            value = secrets.get(ENV_VAR)
+        except Exception:
+            # không có secrets.toml
+            value = None
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+class _Section:
+    def __init__(self, name: str):
+        self.name = name
+        self.wall = 0.0
+        self.calls = 0
+        self.profile: Optional[cProfile.Profile] = cProfile.Profile()
+
+    def enable(self) -> None:
+        if self.profile is None:
+            return
+        try:
+            self.profile.enable()
+        except ValueError:
+            # Python 3.12+: chỉ 1 profiler cho cả tiến trình -> phiên khác đang profile, chỉ đo wall
+            self.profile = None
+
+    def disable(self) -> None:
+        if self.profile is not None:
+            self.profile.disable()
+
+class RerunProfiler:
+    """
+    Profiler của 1 phiên. Gọi begin() đầu script, bọc các phần bằng section(name),
+    finish() ở cuối (st.stop / st.rerun giữa chừng cũng tự finish khi thoát phần ngoài cùng).
+    """
+    def __init__(self, session_id: str, root: Path = PROFILE_DIR, top_n: int = TOP_N, keep: int = KEEP_RUNS):
+        # session_id đến từ URL (?sid=) và thành tên thư mục -> chỉ nhận mã app tự sinh
+        if not valid_session_id(session_id):
+            raise ValueError(f"session_id không hợp lệ: {session_id!r}")
+        self.root = Path(root).resolve()
+        self.dir = self._inside(self.root / session_id)
+        self.top_n = top_n
+        self.keep = keep
+        self.seq = 0
+        self.last: Optional[Dict[str, Any]] = None
+        self._sections: Dict[str, _Section] = {}
+        self._stack: List[_Section] = []
+        self._t0 = 0.0
+        self._top_wall = 0.0  # tổng wall của các phần ngoài cùng (để tính phần gốc)
+        self._last_exit = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._stack)
+
+    def begin(self) -> None:
+        if self.running:
+            # lần trước bị ngắt mà không thoát qua section nào (hiếm)
+            self.finish(end=self._last_exit or None)
+        self.seq += 1
+        self._sections = {}
+        self._top_wall = 0.0
+        self._t0 = time.perf_counter()
+        root = self._sections[ROOT] = _Section(ROOT)
+        self._stack = [root]
+        root.enable()
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        if not self.running:
+            yield
+            return
+        parent = self._stack[-1]
+        parent.disable()
+        sec = self._sections.get(name)
+        if sec is None:
+            sec = self._sections[name] = _Section(name)
+        self._stack.append(sec)
+        t0 = time.perf_counter()
+        sec.enable()
+        escaped = False
+        try:
+            yield
+        except BaseException:
+            # StopException / RerunException của Streamlit cũng đi qua đây
+            escaped = True
+            raise
+        finally:
+            sec.disable()
+            elapsed = time.perf_counter() - t0
+            sec.wall += elapsed
+            sec.calls += 1
+            self._last_exit = time.perf_counter()
+            perf.record(f"app.{name}", elapsed, {})
+            if self._stack and self._stack[-1] is sec:
+                self._stack.pop()
+            if len(self._stack) == 1:
+                self._top_wall += elapsed
+            if escaped and len(self._stack) == 1:
+                # script dừng giữa chừng: không chạy tới finish() ở cuối
+                self.finish()
+            elif self._stack:
+                self._stack[-1].enable()
+
+    def finish(self, end: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Kết thúc lần rerun hiện tại: ghi .prof + summary.json, trả summary (cũng giữ ở self.last).
+        """
+        if not self.running:
+            return self.last
+        for sec in self._stack:
+            sec.disable()
+        self._stack = []
+        root = self._sections[ROOT]
+        total = (end or time.perf_counter()) - self._t0
+        root.wall = max(0.0, total - self._top_wall)
+        root.calls = 1
+        self.last = self._summarize(total)
+        perf.record(f"app.{ROOT}", total, {})
+        self._dump()
+        return self.last
+
+    def _stats(self, sec: _Section) -> Optional[pstats.Stats]:
+        if sec.profile is None:
+            return None
+        try:
+            return pstats.Stats(sec.profile)
+        except TypeError:
+            # profiler chưa ghi được lời gọi nào
+            return None
+
+    def _summarize(self, total: float) -> Dict[str, Any]:
+        sections, hotspots = [], []
+        for name, sec in self._sections.items():
+            sections.append({"section": name, "calls": sec.calls, "wall_ms": round(sec.wall * 1000, 2)})
+            stats = self._stats(sec)
+            if stats is None:
+                continue
+            for (file, line, func), (_, nc, tt, ct, _) in stats.stats.items():
+                hotspots.append({"section": name, "function": _func_label(file, line, func), "ncalls": nc,
+                                 "tottime_ms": round(tt * 1000, 3), "cumtime_ms": round(ct * 1000, 3)})
+        sections.sort(key=lambda r: r["wall_ms"], reverse=True)
+        hotspots.sort(key=lambda r: r["tottime_ms"], reverse=True)
+        return {"seq": self.seq, "ts": round(time.time(), 3), "total_ms": round(total * 1000, 2),
+                "sections": sections, "hotspots": hotspots[:self.top_n]}
+
+    def _inside(self, path: Path) -> Path:
+        """
+        Đường dẫn đã resolve (theo cả symlink), bắt buộc nằm dưới thư mục profile gốc.
+        """
+        path = Path(path).resolve()
+        if self.root not in path.parents:
+            raise ValueError(f"Đường dẫn profile nằm ngoài {self.root}: {path}")
+        return path
+
+    def _dump(self) -> None:
+        # tên thư mục theo thời gian: phiên mở lại (seq đếm lại từ 1) không ghi đè lần cũ
+        try:
+            run_dir = self._inside(self.dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{self.seq:05d}")
+            run_dir.mkdir(parents=True, exist_ok=True)
+            for name, sec in self._sections.items():
+                stats = self._stats(sec)
+                if stats is not None:
+                    stats.dump_stats(str(run_dir / f"{name}.prof"))
+            (run_dir / "summary.json").write_text(json.dumps(self.last, ensure_ascii=False, indent=1),
+                                                  encoding="utf-8")
+            self._prune()
+        except (OSError, ValueError):
+            # profile chỉ để chẩn đoán, không được làm hỏng app
+            pass
+
+    def _prune(self) -> None:
+        runs = sorted(p for p in self._inside(self.dir).iterdir() if p.is_dir() and not p.is_symlink())
+        for old in runs[:-self.keep] if self.keep > 0 else []:
+            shutil.rmtree(self._inside(old), ignore_errors=True)
+
+def _func_label(file: str, line: int, func: str) -> str:
+    if file == "~":
+        return func  # hàm built-in, vd. <method 'append' of 'list' objects>
+    parts = Path(file).parts
+    short = "/".join(parts[-2:]) if len(parts) > 1 else file
+    return f"{func} ({short}:{line})"
+
+def section(profiler: Optional[RerunProfiler], name: str):
+    """
+    Bọc 1 phần của script; profiler None (tắt) -> nullcontext.
+    """
+    return profiler.section(name) if profiler is not None else nullcontext()
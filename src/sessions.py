@@ -0,0 +1,21 @@
+\
+"""
+Mã phiên (session_id) giữ trên URL (?sid=) để F5 / khởi động lại app vẫn nối lại được job nền.
+
+session_id được dùng làm tên thư mục (logs/jobs/<sid>, logs/profile/<sid>) và là "chìa khoá"
+vào đề của phiên, nên chỉ chấp nhận đúng định dạng app tự sinh: 32 ký tự hex ngẫu nhiên
+(128 bit, không đoán được). Giá trị khác trên URL (../, đường dẫn tuyệt đối, mã cũ 8 ký tự)
+bị bỏ, app cấp mã mới.
+"""
+from __future__ import annotations
+import re
+import uuid
+from typing import Any
+
+_SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+def valid_session_id(value: Any) -> bool:
+    return isinstance(value, str) and bool(_SESSION_ID.match(value))
@@ -1,6 +1,8 @@
 \
 from __future__ import annotations
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+
+from .perf import timed
 
 QTYPE_MC = "Trắc nghiệm nhiều lựa chọn"
 QTYPE_TF = "Đúng/Sai"
@@ -8,6 +10,9 @@ QTYPE_MATCH = "Nối cột"
 QTYPE_FILL = "Điền khuyết"
 QTYPE_ESSAY = "Tự luận"
 
+MATCH_MAX_PAIRS = 8  # số cặp nối cột tối đa (form chỉnh sửa + responseSchema)
+
+@timed("validate_question")
 def validate_question(qtype: str, obj: Dict[str, Any]) -> Tuple[bool, str]:
     """
     Trả (ok, message). Validator cứng để đảm bảo cấu trúc sư phạm tối thiểu.
@@ -82,3 +87,100 @@ def validate_question(qtype: str, obj: Dict[str, Any]) -> Tuple[bool, str]:
         return True, "OK"
 
     return False, f"Không hỗ trợ dạng câu hỏi: {qtype}"
+
+# responseSchema (OpenAPI subset của Gemini) cho từng dạng, suy ra từ luật của validate_question:
+# mọi field bắt buộc ở validator đều 'required', số phần tử tối thiểu -> minItems, đáp án MCQ -> enum.
+_STR = {"type": "STRING"}
+
+RESPONSE_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    QTYPE_MC: {
+        "type": "OBJECT",
+        "properties": {
+            "stem": _STR,
+            "options": {
+                "type": "OBJECT",
+                "properties": {k: _STR for k in ["A", "B", "C", "D"]},
+                "required": ["A", "B", "C", "D"],
+            },
+            "correct_answer": {"type": "STRING", "enum": ["A", "B", "C", "D"]},
+            "explanation": _STR,
+        },
+        "required": ["stem", "options", "correct_answer"],
+    },
+    QTYPE_TF: {
+        "type": "OBJECT",
+        "properties": {
+            "stem": _STR,
+            "true_false": {
+                "type": "ARRAY",
+                "minItems": 2,
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {"statement": _STR, "answer": {"type": "BOOLEAN"}},
+                    "required": ["statement", "answer"],
+                },
+            },
+            "explanation": _STR,
+        },
+        "required": ["stem", "true_false"],
+    },
+    QTYPE_MATCH: {
+        "type": "OBJECT",
+        "properties": {
+            "stem": _STR,
+            "matching": {
+                "type": "OBJECT",
+                "properties": {
+                    "left": {"type": "ARRAY", "minItems": 2, "items": _STR},
+                    "right": {"type": "ARRAY", "minItems": 2, "items": _STR},
+                    # schema Gemini không có additionalProperties -> cố định khoá "1".."8"
+                    # (= số cặp tối đa của form chỉnh sửa, xem MATCH_MAX_PAIRS)
+                    "answer": {
+                        "type": "OBJECT",
+                        "properties": {str(k): _STR for k in range(1, MATCH_MAX_PAIRS + 1)},
+                        "required": ["1", "2"],
+                    },
+                },
+                "required": ["left", "right", "answer"],
+            },
+            "explanation": _STR,
+        },
+        "required": ["stem", "matching"],
+    },
+    QTYPE_FILL: {
+        "type": "OBJECT",
+        "properties": {
+            "stem": _STR,
+            "fill_blank": {
+                "type": "OBJECT",
+                "properties": {
+                    "text": {"type": "STRING", "description": "Văn bản có chỗ trống '____'."},
+                    "answer": _STR,
+                },
+                "required": ["text", "answer"],
+            },
+            "explanation": _STR,
+        },
+        "required": ["stem", "fill_blank"],
+    },
+    QTYPE_ESSAY: {
+        "type": "OBJECT",
+        "properties": {
+            "stem": _STR,
+            "essay": {
+                "type": "OBJECT",
+                "properties": {"prompt": _STR, "rubric": {"type": "ARRAY", "items": _STR}},
+                "required": ["prompt"],
+            },
+            "explanation": _STR,
+        },
+        "required": ["stem", "essay"],
+    },
+}
+
+def response_schema(qtype: str) -> Optional[Dict[str, Any]]:
+    """
+    responseSchema gửi kèm generateContent cho dạng qtype (None nếu dạng chưa hỗ trợ).
+    """
+    return RESPONSE_SCHEMAS.get(qtype)
+